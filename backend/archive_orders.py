@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Order Archival
+Moves delivered and cancelled orders older than a cutoff out of the orders collection,
+into orders_archive or gzip JSONL files; the app does the same periodically when
+ORDER_ARCHIVE is set. Both can run at once: writes to an archive directory take a lock
+on its .lock file.
+
+Usage (from backend/):
+    python archive_orders.py --target mongo --after-days 180
+    python archive_orders.py --target files --dir /var/lib/unseen/order_archive --max-batches 1000
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from order_archive import MongoOrderArchive, FileOrderArchive, OrderArchiver, ARCHIVE_AFTER_DAYS
+from order_repository import MongoOrderRepository
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def archive(args: argparse.Namespace) -> int:
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        db = client[args.db_name]
+        order_archive = MongoOrderArchive(db) if args.target == 'mongo' else FileOrderArchive(args.dir)
+        await order_archive.ensure_indexes()
+        repository = MongoOrderRepository(db, archive=order_archive)
+        archiver = OrderArchiver(
+            repository, order_archive,
+            after_days=args.after_days, batch_size=args.batch_size, max_batches=args.max_batches
+        )
+        report = await archiver.run_once()
+        print(f"Archived {report['archived']} orders created before {report['created_before']} "
+              f"in {report['batches']} batches, {report['seconds']}s")
+        if report['skipped']:
+            print(f"Skipped {report['skipped']} orders changed while archiving; run again to archive them")
+        return 0
+    finally:
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Move old delivered and cancelled orders to the archive")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'unseen'))
+    parser.add_argument('--target', choices=('mongo', 'files'), default='mongo')
+    parser.add_argument('--dir', type=Path, default=Path(os.environ.get('ORDER_ARCHIVE_DIR', ROOT_DIR / 'order_archive')),
+                        help="archive directory for --target files")
+    parser.add_argument('--after-days', type=float, default=float(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)),
+                        help="archive orders created more than this many days ago (default 180)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="orders per batch (default 1,000)")
+    parser.add_argument('--max-batches', type=int, default=100, help="stop after this many batches (default 100)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(archive(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Order documents for seeding the in-memory database
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from catalog import PRODUCTS
+
+STATUSES = ["pending_payment", "payment_confirmed", "processing", "shipped", "delivered", "cancelled"]
+
+CUSTOMER_INFO = {"first_name": "Sarah", "last_name": "Cohen", "email": "sarah.cohen@example.com", "phone": "+972-54-123-4567"}
+SHIPPING_ADDRESS = {"address": "15 Rothschild Boulevard", "city": "Tel Aviv", "postal_code": "66881", "country": "Israel"}
+PAYMENT_INFO = {"card_last_four": "4242", "card_name": "Sarah Cohen", "payment_method": "credit_card"}
+
+
+def order_payload() -> Dict:
+    """Request body for POST /api/orders"""
+    return {
+        "customer_info": CUSTOMER_INFO,
+        "shipping_address": SHIPPING_ADDRESS,
+        "items": [
+            {"product_id": "top-1", "name": "Timeless Unseen", "price": 449.0, "quantity": 2,
+             "selected_size": "L", "selected_color": "Black"},
+            {"product_id": "pant-1", "name": "Bandana Shorts", "price": 199.0, "quantity": 1,
+             "selected_size": "M", "selected_color": "Teal"},
+        ],
+        "shipping_method": "standard",
+        "shipping_cost": 40.0,
+        "subtotal": 1097.0,
+        "total": 1137.0,
+        "payment_info": PAYMENT_INFO,
+    }
+
+
+def make_orders(count: int, seed: int = 42) -> List[Dict]:
+    """Build stored order documents; nested customer sub-documents are shared to keep memory down"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    orders = []
+    for index in range(count):
+        items = []
+        for _ in range(rng.randint(1, 3)):
+            product = rng.choice(PRODUCTS)
+            items.append({
+                "product_id": product["id"], "name": product["name"], "price": product["price"],
+                "quantity": rng.randint(1, 3), "selected_size": rng.choice(product["sizes"]),
+                "selected_color": rng.choice(product["colors"]), "image": None,
+            })
+        subtotal = sum(item["price"] * item["quantity"] for item in items)
+        created_at = (start + timedelta(seconds=index * 30)).isoformat()
+        orders.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "order_number": f"ORD-{index:08X}",
+            "customer_info": CUSTOMER_INFO,
+            "customer_email": CUSTOMER_INFO["email"],
+            "shipping_address": SHIPPING_ADDRESS,
+            "items": items,
+            "shipping_method": "standard",
+            "shipping_cost": 40.0,
+            "subtotal": subtotal,
+            "total": subtotal + 40.0,
+            "payment_info": PAYMENT_INFO,
+            "discount_code": None,
+            "discount_amount": 0,
+            "status": rng.choice(STATUSES),
+            "payment_transaction_id": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "notes": None,
+        })
+    return orders
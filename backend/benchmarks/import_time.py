@@ -0,0 +1,121 @@
+"""
+Cold-Start Import Benchmark
+Measures how long `import server` takes in fresh interpreters and checks that the heavy
+clients stay deferred until first use
+
+Usage (from backend/):
+    python -m benchmarks.import_time                 # 10 runs against the 300 ms budget
+    python -m benchmarks.import_time --runs 20 --budget-ms 250
+    python -m benchmarks.import_time --top 15        # also list the slowest imports
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Modules that must not be loaded by importing the app
+DEFERRED_MODULES = ['motor', 'pymongo', 'requests', 'sendgrid', 'passlib', 'jose', 'hyp_client', 'numpy', 'pandas']
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import fastapi
+framework = time.perf_counter() - start
+import server
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'framework_seconds': framework,
+                  'loaded': [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'unseen_benchmark')
+    return env
+
+
+def measure_import(runs: int) -> Tuple[List[float], List[float], List[str]]:
+    """Import the app in `runs` fresh interpreters
+
+    Returns total import timings (ms), the share spent importing FastAPI itself (ms) and
+    any deferred modules that were loaded.
+    """
+    timings = []
+    framework = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=_environment(),
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        timings.append(result['seconds'] * 1000)
+        framework.append(result['framework_seconds'] * 1000)
+        loaded.update(result['loaded'])
+    return timings, framework, sorted(loaded)
+
+
+def slowest_imports(count: int) -> List[Tuple[int, str]]:
+    """Cumulative import time (us) of the slowest modules imported directly by server"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import server'], cwd=BACKEND_DIR,
+        env=_environment(), capture_output=True, text=True, check=True
+    ).stderr
+    # -X importtime prints children before their parent, indented two spaces per level
+    rows: List[Tuple[int, str]] = []
+    children: List[Tuple[int, str]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == 'server':
+                rows = children
+            children = []
+    return sorted(rows, reverse=True)[:count]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the app")
+    parser.add_argument('--runs', type=int, default=10, help="fresh interpreters to time (default 10)")
+    parser.add_argument('--budget-ms', type=float, default=300, help="median import time budget (default 300)")
+    parser.add_argument('--top', type=int, default=0, help="list the N slowest direct imports")
+    args = parser.parse_args()
+
+    # Warm the bytecode cache so the first run is not charged for compilation
+    measure_import(1)
+    timings, framework, loaded = measure_import(args.runs)
+    median = statistics.median(timings)
+    framework_median = statistics.median(framework)
+    print(f"import server: median {median:.1f} ms, min {min(timings):.1f} ms, max {max(timings):.1f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"  of which FastAPI itself: median {framework_median:.1f} ms; app modules: {median - framework_median:.1f} ms")
+
+    if args.top:
+        print("\nSlowest direct imports (cumulative):")
+        for cumulative, name in slowest_imports(args.top):
+            print(f"  {name:<32} {cumulative / 1000:>8.1f} ms")
+
+    failed = False
+    if loaded:
+        print(f"\nDeferred modules loaded at import: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nMedian import time exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Inventory Drop Benchmark
+Thousands of concurrent checkouts reserving the same SKU, checked for overselling
+
+Every checkout reserves one unit of a single SKU at once; exactly `--stock` of them must
+succeed, the SKU must end with nothing available and every unit held, and releasing the
+holds must restore the stock. Runs on the in-memory store, or on MongoDB with --mongo-url
+(a throwaway database is created and dropped).
+
+Usage (from backend/):
+    python -m benchmarks.inventory --checkouts 5000 --stock 500
+    python -m benchmarks.inventory --mongo-url mongodb://localhost:27017 --concurrency 200
+"""
+
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models import OrderItem  # noqa: E402
+from inventory import InventoryStore, MongoInventoryStore, InMemoryInventoryStore, OutOfStockError  # noqa: E402
+
+ITEM = OrderItem(product_id="top-1", name="Timeless Unseen", price=449.0, quantity=1,
+                 selected_size="L", selected_color="Black")
+
+
+async def drop(inventory: InventoryStore, args: argparse.Namespace) -> int:
+    await inventory.ensure_indexes()
+    await inventory.set_stock(ITEM.product_id, ITEM.selected_size, ITEM.selected_color, args.stock)
+
+    order_ids = [str(uuid.uuid4()) for _ in range(args.checkouts)]
+    reserved: List[str] = []
+    timings: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def checkout(order_id: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await inventory.reserve(order_id, [ITEM])
+                reserved.append(order_id)
+            except OutOfStockError:
+                pass
+            finally:
+                timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(checkout(order_id) for order_id in order_ids))
+    elapsed = time.perf_counter() - start
+
+    [level] = await inventory.stock(ITEM.product_id)
+    timings.sort()
+    print(f"{args.checkouts} checkouts for {args.stock} units, {args.concurrency} at a time: {elapsed:.2f} s, "
+          f"{args.checkouts / elapsed:,.0f} checkouts/s")
+    print(f"  latency p50 {statistics.median(timings):.2f} ms, p95 {timings[int(len(timings) * 0.95)]:.2f} ms")
+    print(f"  reserved {len(reserved)}, available {level.available}, held {level.reserved}")
+    failures = []
+    if len(reserved) != min(args.stock, args.checkouts):
+        failures.append(f"expected {min(args.stock, args.checkouts)} reservations, got {len(reserved)}")
+    if level.available != max(args.stock - args.checkouts, 0) or level.reserved != len(reserved):
+        failures.append("stock counters do not match the reservations")
+
+    await asyncio.gather(*(inventory.release(order_id) for order_id in reserved))
+    [level] = await inventory.stock(ITEM.product_id)
+    print(f"  after release: available {level.available}, held {level.reserved}")
+    if level.available != args.stock or level.reserved != 0:
+        failures.append("releasing every hold did not restore the stock")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+async def run(args: argparse.Namespace) -> int:
+    if not args.mongo_url:
+        return await drop(InMemoryInventoryStore(), args)
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url, maxPoolSize=args.concurrency)
+    db = client[f"unseen_inventory_{uuid.uuid4().hex[:8]}"]
+    try:
+        return await drop(MongoInventoryStore(db), args)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent reservations on one SKU, checked for overselling")
+    parser.add_argument('--mongo-url', help="run against MongoDB instead of the in-memory store")
+    parser.add_argument('--checkouts', type=int, default=5000, help="concurrent checkouts (default 5000)")
+    parser.add_argument('--stock', type=int, default=500, help="units of the SKU on sale (default 500)")
+    parser.add_argument('--concurrency', type=int, default=500, help="checkouts in flight at once (default 500)")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
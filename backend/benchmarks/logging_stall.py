@@ -0,0 +1,135 @@
+"""
+Logging Event-Loop Stall Benchmark
+Measures how long logging under load holds up the event loop, writing synchronously from
+the loop versus through structured_logging's queue and writer thread
+
+Many tasks log the way request handlers do while a monitor task sleeps in 1 ms steps and
+records how late it wakes up. The log sink sleeps for --write-latency-ms per write, to
+stand in for a slow disk or a stderr pipe whose reader has fallen behind.
+
+Usage (from backend/):
+    python -m benchmarks.logging_stall
+    python -m benchmarks.logging_stall --tasks 100 --records 500 --write-latency-ms 0.5
+"""
+
+import io
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from typing import Dict, List
+
+from metrics import LOG_RECORDS_DROPPED
+from structured_logging import TEXT_FORMAT, configure_logging, stop_logging
+
+MONITOR_INTERVAL = 0.001
+
+
+class SlowStream(io.TextIOBase):
+    """Discards what is written, taking `latency` seconds per write"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.latency)
+        self.writes += 1
+        return len(text)
+
+
+async def _monitor(lags: List[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + MONITOR_INTERVAL
+        await asyncio.sleep(MONITOR_INTERVAL)
+        lags.append(max(0.0, loop.time() - expected) * 1000)
+
+
+async def _handler(logger: logging.Logger, task: int, records: int, lazy: bool):
+    for i in range(records):
+        order_id = f"order-{task}-{i}"
+        if lazy:
+            logger.info("Order %s updated by %s, total ₪%.2f", order_id, "admin", i * 1.5)
+        else:
+            logger.info(f"Order {order_id} updated by {'admin'}, total ₪{i * 1.5:.2f}")
+        await asyncio.sleep(0)
+
+
+async def _run(tasks: int, records: int, lazy: bool) -> Dict[str, float]:
+    logger = logging.getLogger("benchmark")
+    lags: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor(lags, stop))
+    await asyncio.sleep(MONITOR_INTERVAL * 5)
+    start = time.perf_counter()
+    await asyncio.gather(*(_handler(logger, task, records, lazy) for task in range(tasks)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    lags.sort()
+    return {
+        'seconds': elapsed,
+        'lag_p50_ms': statistics.median(lags),
+        'lag_p99_ms': lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+        'lag_max_ms': lags[-1],
+    }
+
+
+def _dropped() -> float:
+    return LOG_RECORDS_DROPPED.labels("queue_full").value
+
+
+def measure_sync(tasks: int, records: int, latency: float) -> Dict[str, float]:
+    """Before: a StreamHandler writing from the event loop, with f-string messages"""
+    stream = SlowStream(latency)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    result = asyncio.run(_run(tasks, records, lazy=False))
+    root.removeHandler(handler)
+    result['written'] = stream.writes
+    return result
+
+
+def measure_queue(tasks: int, records: int, latency: float, queue_size: int) -> Dict[str, float]:
+    """After: configure_logging()'s queue handler and writer thread, with lazy arguments"""
+    stream = SlowStream(latency)
+    configure_logging("INFO", "json", queue_size=queue_size, stream=stream)
+    dropped = _dropped()
+    result = asyncio.run(_run(tasks, records, lazy=True))
+    stop_logging()
+    result['written'] = stream.writes
+    result['dropped'] = _dropped() - dropped
+    return result
+
+
+def _report(name: str, result: Dict[str, float]):
+    line = (f"  {name:<6} loop lag p50 {result['lag_p50_ms']:7.3f} ms   p99 {result['lag_p99_ms']:8.3f} ms   "
+            f"max {result['lag_max_ms']:8.3f} ms   {result['seconds']:6.2f}s   {result['written']:,.0f} written")
+    if 'dropped' in result:
+        line += f", {result['dropped']:,.0f} dropped"
+    print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure event-loop stalls caused by logging")
+    parser.add_argument('--tasks', type=int, default=50, help="concurrent logging tasks (default 50)")
+    parser.add_argument('--records', type=int, default=200, help="records logged per task (default 200)")
+    parser.add_argument('--write-latency-ms', type=float, default=0.1, help="time per write to the sink (default 0.1)")
+    parser.add_argument('--queue-size', type=int, default=10_000, help="log queue size (default 10000)")
+    args = parser.parse_args()
+
+    latency = args.write_latency_ms / 1000
+    print(f"{args.tasks} tasks x {args.records} records, {args.write_latency_ms} ms per write")
+    _report("sync", measure_sync(args.tasks, args.records, latency))
+    _report("queue", measure_queue(args.tasks, args.records, latency, args.queue_size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
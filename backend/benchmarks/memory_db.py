@@ -0,0 +1,350 @@
+"""
+In-memory stand-in for the subset of the Motor API the handlers use, so benchmarks can
+run against an in-process app without a MongoDB server
+"""
+
+import copy
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+def _get_path(document: Dict, path: str) -> Any:
+    value: Any = document
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        for operator, operand in condition.items():
+            if operator == '$in':
+                if value not in operand:
+                    return False
+            elif operator == '$nin':
+                if value in operand:
+                    return False
+            elif operator == '$ne':
+                if value == operand:
+                    return False
+            elif operator == '$exists':
+                if (value is not None) != operand:
+                    return False
+            elif value is None:
+                return False
+            elif operator == '$gte' and not value >= operand:
+                return False
+            elif operator == '$gt' and not value > operand:
+                return False
+            elif operator == '$lte' and not value <= operand:
+                return False
+            elif operator == '$lt' and not value < operand:
+                return False
+        return True
+    return value == condition
+
+
+def matches(document: Dict, query: Dict) -> bool:
+    """Evaluate a MongoDB filter with equality, $in/$nin/$ne/$exists and range operators"""
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif not _matches_condition(_get_path(document, key), condition):
+            return False
+    return True
+
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return dict(document)
+    included = [key for key, value in projection.items() if value and key != '_id']
+    if included:
+        result = {key: document[key] for key in included if key in document}
+        if projection.get('_id', 1) and '_id' in document:
+            result['_id'] = document['_id']
+        return result
+    excluded = {key for key, value in projection.items() if not value}
+    return {key: value for key, value in document.items() if key not in excluded}
+
+
+def _apply_update(document: Dict, update: Dict, inserting: bool):
+    for operator, fields in update.items():
+        if operator == '$set' or (operator == '$setOnInsert' and inserting):
+            for key, value in fields.items():
+                document[key] = copy.deepcopy(value)
+        elif operator == '$inc':
+            for key, value in fields.items():
+                document[key] = document.get(key, 0) + value
+        elif operator == '$unset':
+            for key in fields:
+                document.pop(key, None)
+
+
+def _compile(expression: Any) -> Callable[[Dict], Any]:
+    """Turn an aggregation expression into a function of the document"""
+    if isinstance(expression, str) and expression.startswith('$'):
+        parts = expression[1:].split('.')
+        if len(parts) == 1:
+            return lambda document: document.get(parts[0])
+        def get_path(document):
+            value = document
+            for part in parts:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(part)
+            return value
+        return get_path
+    if isinstance(expression, dict) and '$multiply' in expression:
+        operands = [_compile(operand) for operand in expression['$multiply']]
+        def multiply(document):
+            result = 1
+            for operand in operands:
+                result *= operand(document) or 0
+            return result
+        return multiply
+    return lambda document: expression
+
+
+def _group(documents: List[Dict], spec: Dict) -> List[Dict]:
+    key_of = _compile(spec['_id'])
+    accumulators = []
+    for field, accumulator in spec.items():
+        if field != '_id':
+            (operator, expression), = accumulator.items()
+            accumulators.append((field, operator, _compile(expression)))
+
+    groups: Dict[Any, Dict] = {}
+    for document in documents:
+        key = key_of(document)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'_id': key}
+            for field, operator, value_of in accumulators:
+                group[field] = value_of(document) if operator == '$first' else 0
+        for field, operator, value_of in accumulators:
+            if operator == '$sum':
+                group[field] += value_of(document) or 0
+    return list(groups.values())
+
+
+def aggregate(documents: List[Dict], pipeline: List[Dict]) -> List[Dict]:
+    """Run a pipeline of $match, $unwind, $group ($sum/$first), $sort and $limit stages"""
+    for stage in pipeline:
+        (operator, spec), = stage.items()
+        if operator == '$match':
+            documents = [doc for doc in documents if matches(doc, spec)]
+        elif operator == '$unwind':
+            field = spec[1:]
+            documents = [{**doc, field: value} for doc in documents for value in doc.get(field) or []]
+        elif operator == '$group':
+            documents = _group(documents, spec)
+        elif operator == '$sort':
+            cursor = MemoryCursor(list(documents), None).sort(list(spec.items()))
+            documents = cursor._documents
+        elif operator == '$limit':
+            documents = documents[:spec]
+        else:
+            raise NotImplementedError(f"aggregation stage {operator}")
+    return documents
+
+
+class MemoryCursor:
+    def __init__(self, documents: List[Dict], projection: Optional[Dict]):
+        self._documents = documents
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, field_direction in reversed(keys):
+            self._documents.sort(
+                key=lambda doc: (_get_path(doc, field) is not None, _get_path(doc, field) or 0),
+                reverse=field_direction < 0
+            )
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, count: int):
+        return self
+
+    def _results(self) -> List[Dict]:
+        end = self._skip + self._limit if self._limit else None
+        return [project(doc, self._projection) for doc in self._documents[self._skip:end]]
+
+    async def to_list(self, length: Optional[int]) -> List[Dict]:
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    """List of documents with optional hash indexes on single fields
+
+    Single-field create_index() calls build an equality index, so lookups the app
+    would serve from a MongoDB index are not charged a full scan here either.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.documents: List[Dict] = []
+        self._indexes: Dict[str, Dict[Any, List[Dict]]] = {}
+        self._next_id = 0
+
+    def _prepare(self, document: Dict) -> Dict:
+        if '_id' not in document:
+            self._next_id += 1
+            document['_id'] = self._next_id
+        for field, index in self._indexes.items():
+            index.setdefault(_get_path(document, field), []).append(document)
+        return document
+
+    def _rebuild_indexes(self):
+        for field in self._indexes:
+            index: Dict[Any, List[Dict]] = {}
+            for document in self.documents:
+                index.setdefault(_get_path(document, field), []).append(document)
+            self._indexes[field] = index
+
+    def _candidates(self, query: Dict) -> List[Dict]:
+        for field, index in self._indexes.items():
+            condition = query.get(field)
+            if condition is not None and not isinstance(condition, dict):
+                return index.get(condition, [])
+        return self.documents
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def create_index(self, keys, **kwargs):
+        if isinstance(keys, str):
+            self._indexes[keys] = {}
+            self._rebuild_indexes()
+        return str(keys)
+
+    async def insert_one(self, document: Dict) -> InsertOneResult:
+        self.documents.append(self._prepare(document))
+        return InsertOneResult(document['_id'], True)
+
+    async def insert_many(self, documents: List[Dict], ordered: bool = True) -> InsertManyResult:
+        for document in documents:
+            self.documents.append(self._prepare(document))
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs) -> Optional[Dict]:
+        query = query or {}
+        for document in self._candidates(query):
+            if matches(document, query):
+                return project(document, projection)
+        return None
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, **kwargs) -> MemoryCursor:
+        query = query or {}
+        return MemoryCursor([doc for doc in self._candidates(query) if matches(doc, query)], projection)
+
+    def aggregate(self, pipeline: List[Dict], **kwargs) -> MemoryCursor:
+        return MemoryCursor(aggregate(self.documents, pipeline), None)
+
+    async def count_documents(self, query: Dict, **kwargs) -> int:
+        if not query:
+            return len(self.documents)
+        return sum(1 for document in self._candidates(query) if matches(document, query))
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False) -> UpdateResult:
+        for document in self._candidates(query):
+            if matches(document, query):
+                _apply_update(document, update, inserting=False)
+                if any(field in update.get('$set', {}) for field in self._indexes):
+                    self._rebuild_indexes()
+                return UpdateResult({'n': 1, 'nModified': 1}, True)
+        if upsert:
+            document = {key: value for key, value in query.items() if not key.startswith('$')}
+            _apply_update(document, update, inserting=True)
+            await self.insert_one(document)
+            return UpdateResult({'n': 0, 'nModified': 0, 'upserted': document['_id']}, True)
+        return UpdateResult({'n': 0, 'nModified': 0}, True)
+
+    async def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                                  return_document: bool = False, **kwargs) -> Optional[Dict]:
+        for document in self._candidates(query):
+            if matches(document, query):
+                before = project(document, projection)
+                _apply_update(document, update, inserting=False)
+                if any(field in update.get('$set', {}) for field in self._indexes):
+                    self._rebuild_indexes()
+                return project(document, projection) if return_document else before
+        return None
+
+    async def update_many(self, query: Dict, update: Dict) -> UpdateResult:
+        count = 0
+        for document in self.documents:
+            if matches(document, query):
+                _apply_update(document, update, inserting=False)
+                count += 1
+        if count and any(field in update.get('$set', {}) for field in self._indexes):
+            self._rebuild_indexes()
+        return UpdateResult({'n': count, 'nModified': count}, True)
+
+    async def delete_one(self, query: Dict) -> DeleteResult:
+        for index, document in enumerate(self.documents):
+            if matches(document, query):
+                del self.documents[index]
+                self._rebuild_indexes()
+                return DeleteResult({'n': 1}, True)
+        return DeleteResult({'n': 0}, True)
+
+    async def delete_many(self, query: Dict) -> DeleteResult:
+        before = len(self.documents)
+        self.documents = [doc for doc in self.documents if not matches(doc, query)]
+        self._rebuild_indexes()
+        return DeleteResult({'n': before - len(self.documents)}, True)
+
+    def reset(self, documents: List[Dict]):
+        """Replace the collection contents in one go"""
+        self.documents = []
+        self._next_id = 0
+        for document in documents:
+            self.documents.append(self._prepare(document))
+
+
+class MemoryDatabase:
+    """Database handle creating collections on first attribute or item access"""
+
+    def __init__(self):
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name: str, *args, **kwargs) -> Dict:
+        return {'ok': 1}
@@ -0,0 +1,135 @@
+"""
+Product Analytics Benchmark
+Times the columnar product analytics pipeline against per-item dict loops over the same
+in-memory orders: one computing the same figures, and InMemoryOrderRepository.popular_products()
+
+Usage (from backend/):
+    python -m benchmarks.product_analytics                        # ~1M line items
+    python -m benchmarks.product_analytics --line-items 100000 --runs 5
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.data import make_orders  # noqa: E402
+from order_repository import InMemoryOrderRepository  # noqa: E402
+from product_analytics import LineItemColumns, product_analytics, summarize  # noqa: E402
+
+
+def dict_loop_analytics(orders: List[Dict]) -> Dict:
+    """The same figures as product_analytics.summarize(), with per-item dict updates"""
+    products: Dict[str, Dict] = {}
+    variants: Dict[Tuple[str, str, str], Dict] = {}
+    multi_product: Dict[str, int] = {}
+    baskets = {"orders": 0, "lines": 0, "products": 0, "units": 0, "value": 0.0}
+    for order in orders:
+        items = order.get("items", [])
+        if not items:
+            continue
+        seen = set()
+        for item in items:
+            product = products.setdefault(item["product_id"], {
+                "product_id": item["product_id"], "name": item.get("name"),
+                "total_quantity": 0, "total_revenue": 0.0, "orders": 0
+            })
+            revenue = item["price"] * item["quantity"]
+            product["total_quantity"] += item["quantity"]
+            product["total_revenue"] += revenue
+            variant = variants.setdefault((item["product_id"], item["selected_size"], item["selected_color"]), {
+                "total_quantity": 0, "total_revenue": 0.0
+            })
+            variant["total_quantity"] += item["quantity"]
+            variant["total_revenue"] += revenue
+            baskets["units"] += item["quantity"]
+            baskets["value"] += revenue
+            seen.add(item["product_id"])
+        for product_id in seen:
+            products[product_id]["orders"] += 1
+            if len(seen) > 1:
+                multi_product[product_id] = multi_product.get(product_id, 0) + 1
+        baskets["orders"] += 1
+        baskets["lines"] += len(items)
+        baskets["products"] += len(seen)
+    for product_id, product in products.items():
+        product["order_share"] = product["orders"] / baskets["orders"]
+        product["attach_rate"] = multi_product.get(product_id, 0) / product["orders"]
+    return {
+        "products": sorted(products.values(), key=lambda product: product["total_quantity"], reverse=True),
+        "variants": sorted(variants.items(), key=lambda variant: variant[1]["total_quantity"], reverse=True)[:50],
+        "basket": baskets
+    }
+
+
+async def timed(operation: Callable[[], Awaitable], runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await operation()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run(args: argparse.Namespace) -> int:
+    # make_orders averages two line items per order
+    orders = make_orders(max(args.line_items // 2, 1))
+    repository = InMemoryOrderRepository()
+    repository.reset(orders)
+    line_items = sum(len(order["items"]) for order in orders)
+    print(f"{len(orders):,} orders, {line_items:,} line items, {args.runs} runs each\n")
+
+    async def loop():
+        return await repository.popular_products(limit=1000)
+
+    async def full_loop():
+        return dict_loop_analytics(orders)
+
+    async def columnar():
+        return await product_analytics(repository)
+
+    columns = LineItemColumns()
+    async for batch in repository.line_item_batches():
+        columns.add(batch)
+
+    async def columnar_summarize():
+        return summarize(columns)
+
+    fields = ("product_id", "total_quantity", "orders")
+    expected = [tuple(row[field] for field in fields) for row in dict_loop_analytics(orders)["products"]]
+    result = await columnar()
+    actual = [tuple(row[field] for field in fields) for row in result["products"]]
+    if sorted(expected) != sorted(actual):
+        print("Columnar product figures differ from the dict loop")
+        return 1
+
+    baseline = None
+    for name, operation in (
+        ('dict loop, all figures', full_loop),
+        ('dict loop, products only', loop),
+        ('columnar, stream + summarize', columnar),
+        ('columnar, summarize only', columnar_summarize),
+    ):
+        timings = await timed(operation, args.runs)
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(f"  {name:<30} median {median * 1000:>9.1f} ms   min {min(timings) * 1000:>9.1f} ms   "
+              f"{baseline / median:>5.2f}x")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark columnar product analytics against the dict loop")
+    parser.add_argument('--line-items', type=int, default=1_000_000, help="approximate line items (default 1000000)")
+    parser.add_argument('--runs', type=int, default=3, help="timed runs per implementation (default 3)")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""
+Backend Benchmark Suite
+Runs the backend hot paths against an in-process app and compares the results with a
+stored baseline
+
+Orders are stored in an InMemoryOrderRepository and the remaining collections in the
+stand-in from benchmarks.memory_db, unless --mongo-url points at an ephemeral MongoDB, in
+which case a throwaway database is created and dropped.
+
+Usage (from backend/):
+    python -m benchmarks.run                    # full run, compared with baseline.json
+    python -m benchmarks.run --quick            # smaller datasets, fewer iterations
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --update-baseline  # store this run as the new baseline
+
+benchmarks.search, benchmarks.product_analytics, benchmarks.inventory,
+benchmarks.logging_stall and benchmarks.import_time are standalone runs with their own
+budgets or comparisons; they are not part of this suite or of baseline.json.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'unseen_benchmark')
+os.environ.pop('SENDGRID_API_KEY', None)
+
+import server  # noqa: E402
+from benchmarks.data import make_orders, order_payload  # noqa: E402
+from benchmarks.memory_db import MemoryDatabase  # noqa: E402
+from order_repository import OrderRepository, MongoOrderRepository, InMemoryOrderRepository, encode_cursor  # noqa: E402
+from order_search import search_prefixes  # noqa: E402
+from inventory import InventoryStore, MongoInventoryStore, InMemoryInventoryStore  # noqa: E402
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baseline.json'
+
+ADMIN_USERNAME = 'benchmark-admin'
+
+
+class ASGIClient:
+    """Minimal in-process HTTP client speaking ASGI directly to the app"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, json_body: Optional[Dict] = None,
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        path, _, query = path.partition('?')
+        body = json.dumps(json_body).encode() if json_body is not None else b''
+        raw_headers = [(b'host', b'benchmark')]
+        if json_body is not None:
+            raw_headers.append((b'content-type', b'application/json'))
+        for name, value in (headers or {}).items():
+            raw_headers.append((name.lower().encode(), value.encode()))
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '', 'headers': raw_headers,
+            'client': ('127.0.0.1', 50000), 'server': ('benchmark', 80),
+        }
+        request_sent = False
+        status = 500
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                return {'type': 'http.disconnect'}
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return status, b''.join(chunks)
+
+
+async def measure(name: str, operation: Callable[[], Awaitable], iterations: int,
+                  warmup: int = 5) -> Dict:
+    """Time an async operation and summarise its latency distribution"""
+    for _ in range(min(warmup, iterations)):
+        await operation()
+
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await operation()
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    result = {
+        'iterations': iterations,
+        'mean_ms': round(statistics.fmean(timings), 4),
+        'p50_ms': round(timings[len(timings) // 2], 4),
+        'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 4),
+        'p99_ms': round(timings[min(int(len(timings) * 0.99), len(timings) - 1)], 4),
+        'ops_per_sec': round(iterations / elapsed, 2),
+    }
+    print(f"  {name:<32} p50 {result['p50_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms   "
+          f"{result['ops_per_sec']:>10.1f} ops/s")
+    return result
+
+
+def _check(status: int, expected: int, name: str):
+    if status != expected:
+        raise RuntimeError(f"{name} returned HTTP {status}, expected {expected}")
+
+
+async def seed_orders(db, repository: OrderRepository, count: int) -> List[Dict]:
+    orders = make_orders(count)
+    if isinstance(repository, InMemoryOrderRepository):
+        repository.reset(dict(order) for order in orders)
+    else:
+        await db.orders.delete_many({})
+        for start in range(0, len(orders), 10000):
+            await db.orders.insert_many(
+                [{**order, 'search_prefixes': search_prefixes(order)} for order in orders[start:start + 10000]],
+                ordered=False
+            )
+    return orders
+
+
+async def run_benchmarks(db, repository: OrderRepository, inventory: InventoryStore, quick: bool) -> Dict[str, Dict]:
+    client = ASGIClient(server.app)
+    results: Dict[str, Dict] = {}
+    rng = random.Random(7)
+    iterations = 100 if quick else 500
+
+    # Indexes the lookups rely on
+    await repository.ensure_indexes()
+    await db.admins.create_index('username')
+    await db.discount_codes.create_index('code')
+
+    await db.admins.insert_one({
+        'id': str(uuid.uuid4()), 'username': ADMIN_USERNAME,
+        'password_hash': 'not-used', 'created_at': '2024-01-01T00:00:00+00:00',
+    })
+    admin_headers = {'Authorization': f"Bearer {server.create_access_token({'sub': ADMIN_USERNAME})}"}
+    await db.discount_codes.insert_one({
+        'id': str(uuid.uuid4()), 'code': 'BENCH10', 'discount_type': 'percentage',
+        'discount_value': 10, 'min_order_amount': 0, 'max_uses': None, 'current_uses': 0,
+        'active': True, 'expires_at': None, 'created_at': '2024-01-01T00:00:00+00:00',
+    })
+
+    orders = await seed_orders(db, repository, 10000)
+    print(f"Seeded {len(orders)} orders")
+
+    payload = order_payload()
+
+    # Orders reserve stock of tracked SKUs, so track the ones the payload buys
+    await inventory.ensure_indexes()
+    for item in payload['items']:
+        await inventory.set_stock(item['product_id'], item['selected_size'], item['selected_color'], 1_000_000)
+
+    async def create_order():
+        status, _ = await client.request('POST', '/api/orders', payload)
+        _check(status, 200, 'create_order')
+    results['create_order'] = await measure('create_order', create_order, iterations)
+
+    async def get_order_by_id():
+        status, _ = await client.request('GET', f"/api/orders/{rng.choice(orders)['id']}")
+        _check(status, 200, 'get_order_by_id')
+    results['get_order_by_id'] = await measure('get_order_by_id', get_order_by_id, iterations)
+
+    async def get_order_by_number():
+        status, _ = await client.request('GET', f"/api/orders/number/{rng.choice(orders)['order_number']}")
+        _check(status, 200, 'get_order_by_number')
+    results['get_order_by_number'] = await measure('get_order_by_number', get_order_by_number, iterations)
+
+    for depth in (0, 1000, 5000):
+        async def list_orders(depth=depth):
+            status, _ = await client.request('GET', f"/api/orders?limit=50&skip={depth}")
+            _check(status, 200, 'list_orders')
+        name = f"list_orders_skip_{depth}"
+        results[name] = await measure(name, list_orders, max(iterations // 5, 20))
+
+    # Every seeded order belongs to the same customer, so history pages are full at any depth
+    customer_headers = {'Authorization': f"Bearer {server.create_customer_token(orders[0]['customer_info']['email'])}"}
+    newest_first = sorted(orders, key=lambda order: (order['created_at'], order['id']), reverse=True)
+    for depth in (0, 5000):
+        cursor = f"&cursor={encode_cursor(newest_first[depth - 1]['created_at'], newest_first[depth - 1]['id'])}" if depth else ''
+
+        async def customer_orders(cursor=cursor):
+            status, _ = await client.request('GET', f"/api/customer/orders?limit=20{cursor}", headers=customer_headers)
+            _check(status, 200, 'customer_orders')
+        name = f"customer_orders_after_{depth}"
+        results[name] = await measure(name, customer_orders, iterations)
+
+    for name, query in (('search_orders_name', 'sarah+coh'), ('search_orders_number', orders[len(orders) // 2]['order_number'])):
+        async def search_orders(query=query):
+            status, _ = await client.request('GET', f"/api/admin/orders/search?q={query}", headers=admin_headers)
+            _check(status, 200, 'search_orders')
+        results[name] = await measure(name, search_orders, max(iterations // 5, 20))
+
+    async def validate_discount():
+        status, _ = await client.request('POST', '/api/discount/validate', {'code': 'bench10', 'order_total': 500})
+        _check(status, 200, 'validate_discount')
+    results['validate_discount'] = await measure('validate_discount', validate_discount, iterations)
+
+    order = server.Order(**server.deserialize_from_mongo(dict(orders[0])))
+
+    async def render_order_email():
+        await server.send_order_confirmation_email(order)
+    results['render_order_confirmation_email'] = await measure(
+        'render_order_confirmation_email', render_order_email, iterations)
+
+    async def render_welcome_email():
+        await server.send_newsletter_welcome_email('bench@example.com', 'Bench')
+    results['render_newsletter_welcome_email'] = await measure(
+        'render_newsletter_welcome_email', render_welcome_email, iterations)
+
+    for size in ((10_000,) if quick else (10_000, 100_000, 1_000_000)):
+        await seed_orders(db, repository, size)
+        print(f"Seeded {size} orders")
+
+        async def analytics():
+            status, _ = await client.request('GET', '/api/admin/analytics', headers=admin_headers)
+            _check(status, 200, 'analytics')
+        name = f"analytics_{size // 1000}k"
+        results[name] = await measure(name, analytics, 3 if size >= 100_000 else 10, warmup=1)
+
+        async def timeseries():
+            # Uncached: the seeded orders all fall in closed buckets
+            server.sales_timeseries.cache.invalidate()
+            status, _ = await client.request(
+                'GET', '/api/admin/analytics/timeseries?start=2024-01-01T00:00:00&end=2025-01-01T00:00:00'
+                       '&granularity=day&tz=Asia/Jerusalem', headers=admin_headers)
+            _check(status, 200, 'sales_timeseries')
+        name = f"sales_timeseries_{size // 1000}k"
+        results[name] = await measure(name, timeseries, 3 if size >= 100_000 else 10, warmup=1)
+
+        async def products():
+            status, _ = await client.request('GET', '/api/admin/analytics/products', headers=admin_headers)
+            _check(status, 200, 'product_analytics')
+        name = f"product_analytics_{size // 1000}k"
+        results[name] = await measure(name, products, 3 if size >= 100_000 else 10, warmup=1)
+
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Return the benchmarks whose median latency regressed beyond the tolerance"""
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {tolerance:.0%}):")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"  {name:<32} (no baseline)")
+            continue
+        ratio = result['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1.0
+        flag = 'REGRESSION' if ratio > 1 + tolerance else 'ok'
+        print(f"  {name:<32} {previous['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms  ({ratio:>5.2f}x)  {flag}")
+        if flag == 'REGRESSION':
+            regressions.append(name)
+    return regressions
+
+
+async def main_async(args) -> int:
+    mongo_client = None
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo_client = AsyncIOMotorClient(args.mongo_url)
+        db = mongo_client[f"unseen_benchmark_{uuid.uuid4().hex[:8]}"]
+    else:
+        db = MemoryDatabase()
+    repository = MongoOrderRepository(db) if mongo_client is not None else InMemoryOrderRepository()
+    repository.on_change = server.publish_order_changes
+    server.db = db
+    server.invalidation_bus.db = db
+    inventory = MongoInventoryStore(db) if mongo_client is not None else InMemoryInventoryStore()
+    server.app.dependency_overrides[server.get_order_repository] = lambda: repository
+    server.app.dependency_overrides[server.get_inventory] = lambda: inventory
+    # Every request comes from one client address, well past the public endpoint limits
+    server.rate_limiter.enabled = False
+
+    try:
+        results = await run_benchmarks(db, repository, inventory, args.quick)
+    finally:
+        if mongo_client is not None:
+            await mongo_client.drop_database(db.name)
+            mongo_client.close()
+
+    report = {
+        'metadata': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'storage': 'mongodb' if args.mongo_url else 'memory',
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()).get('results', {})
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths")
+    parser.add_argument('--quick', action='store_true', help="smaller datasets and fewer iterations")
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed median slowdown before flagging a regression (default 0.25)")
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCH_MONGO_URL'),
+                        help="run against a throwaway database on this MongoDB instead of in memory")
+    args = parser.parse_args()
+
+    # Per-request logs (and the missing SendGrid key warnings) would dominate the timings
+    logging.disable(logging.WARNING)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
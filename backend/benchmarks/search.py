@@ -0,0 +1,86 @@
+"""
+Order Search Benchmark
+Times MongoOrderRepository.search() against an existing order database, e.g. one filled
+with generate_orders.py, using queries built from orders sampled out of it
+
+Usage (from backend/):
+    python generate_orders.py --count 1000000 --db-name unseen_search
+    python migrate_orders.py --db-name unseen_search     # only for orders written without search_prefixes
+    python -m benchmarks.search --db-name unseen_search  # p95 per query kind against the 50 ms budget
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from order_repository import MongoOrderRepository  # noqa: E402
+
+# Query kinds, each built from a sampled order document
+QUERY_BUILDERS: Dict[str, Callable[[Dict], str]] = {
+    'order_number_prefix': lambda order: order['order_number'][:7],
+    'order_number': lambda order: order['order_number'],
+    'last_name_prefix': lambda order: order['customer_info']['last_name'][:3],
+    'full_name': lambda order: f"{order['customer_info']['first_name']} {order['customer_info']['last_name']}",
+    'email_prefix': lambda order: order['customer_info']['email'].split('@')[0][:8],
+    'phone_fragment': lambda order: order['customer_info']['phone'].split('-', 1)[-1][:6],
+    'item_name': lambda order: order['items'][0]['name'].split()[0],
+}
+
+
+async def run(args: argparse.Namespace) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        repository = MongoOrderRepository(client[args.db_name])
+        await repository.ensure_indexes()
+        total = await repository.collection.estimated_document_count()
+        samples = await repository.collection.aggregate([
+            {'$sample': {'size': args.samples}},
+            {'$project': {'_id': 0, 'order_number': 1, 'customer_info': 1, 'items.name': 1}}
+        ]).to_list(args.samples)
+        if not samples:
+            print(f"No orders in {args.db_name}")
+            return 1
+        print(f"{total:,} orders in {args.db_name}; {len(samples)} sampled orders per query kind\n")
+
+        failed = False
+        for kind, build in QUERY_BUILDERS.items():
+            timings: List[float] = []
+            hits = 0
+            for order in samples:
+                query = build(order)
+                start = time.perf_counter()
+                results = await repository.search(query, limit=20)
+                timings.append((time.perf_counter() - start) * 1000)
+                hits += bool(results)
+            timings.sort()
+            p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+            flag = 'ok' if p95 <= args.budget_ms else 'OVER BUDGET'
+            print(f"  {kind:<22} p50 {statistics.median(timings):>8.2f} ms   p95 {p95:>8.2f} ms   "
+                  f"hits {hits}/{len(samples)}   {flag}")
+            failed = failed or p95 > args.budget_ms
+        return 1 if failed else 0
+    finally:
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark admin order search against a populated database")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'unseen'))
+    parser.add_argument('--samples', type=int, default=100, help="sampled orders per query kind (default 100)")
+    parser.add_argument('--budget-ms', type=float, default=50, help="p95 latency budget per query kind (default 50)")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
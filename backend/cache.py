@@ -0,0 +1,259 @@
+"""
+Shared Caches
+In-process caches kept consistent across uvicorn workers through an invalidation channel
+
+Every worker holds its own LocalCache instances. A mutation calls
+InvalidationBus.publish(cache_name, key), which drops the entry in the publishing worker
+at once and records an event in the cache_invalidations collection. Each worker's bus
+tails that collection, through a change stream on replica sets or by polling on a
+standalone server, and drops the same entry. Entries also expire after a TTL, which
+bounds staleness if the channel is down.
+"""
+
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_COLLECTION = "cache_invalidations"
+
+# Invalidation events are kept this long; TTL index on created_at
+INVALIDATION_RETENTION_SECONDS = 3600
+
+# Polling re-reads this far back so events inserted out of order or by a worker with a
+# slightly skewed clock are not missed; already applied events are skipped
+POLL_LOOKBACK_SECONDS = 5
+
+# Change stream errors meaning the server is not a replica set or sharded cluster
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324}
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Per-worker TTL cache with LRU eviction
+
+    `generation` moves on every invalidation, so a value loaded while an invalidation
+    arrived is not stored (see get_or_load).
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = 300, max_entries: int = 1000):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Any = None):
+        """Drop one key, or everything when key is None"""
+        self.generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value for key, loading and storing it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self.generation
+        value = await loader()
+        if generation == self.generation:
+            self.set(key, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class InvalidationBus:
+    """Cross-worker cache invalidation over a MongoDB collection
+
+    mode is "auto" (change stream, falling back to polling when the server does not
+    support change streams), "change_stream", "poll" or "off" (local invalidation only).
+    """
+
+    def __init__(self, db, mode: str = "auto", poll_interval: float = 1.0):
+        if mode not in ("auto", "change_stream", "poll", "off"):
+            raise ValueError(f"Unknown cache invalidation mode: {mode}")
+        self.db = db
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.active_mode: Optional[str] = None
+        self._caches: Dict[str, LocalCache] = {}
+        self._seen: Dict[Any, datetime] = {}
+        self._broadcasts: Set[asyncio.Task] = set()
+
+    def register(self, cache: LocalCache) -> LocalCache:
+        self._caches[cache.name] = cache
+        return cache
+
+    @property
+    def collection(self):
+        return self.db[INVALIDATION_COLLECTION]
+
+    def _apply(self, event: Dict):
+        if event.get("origin") == self.worker_id:
+            return
+        cache = self._caches.get(event.get("cache"))
+        if cache is not None:
+            cache.invalidate(event.get("key"))
+
+    async def publish(self, cache_name: str, key: Any = None):
+        """Invalidate a key (or a whole cache) in this worker and broadcast it to the others"""
+        cache = self._caches.get(cache_name)
+        if cache is not None:
+            cache.invalidate(key)
+        if self.mode == "off":
+            return
+        try:
+            await self.collection.insert_one({
+                "cache": cache_name,
+                "key": key,
+                "origin": self.worker_id,
+                "created_at": datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            # Other workers fall back on the cache TTL
+            logger.error("Error publishing cache invalidation for %s: %s", cache_name, e)
+
+    async def publish_many(self, cache_name: str, keys: List[Any]):
+        """publish() for several keys, broadcast in one write"""
+        self._invalidate_many(cache_name, keys)
+        if self.mode == "off" or not keys:
+            return
+        await self._broadcast_many(cache_name, keys)
+
+    def publish_many_nowait(self, cache_name: str, keys: List[Any]):
+        """publish_many() that invalidates in this worker now and broadcasts in the background
+
+        For request paths that should not wait on MongoDB; drain() waits for the broadcasts.
+        """
+        self._invalidate_many(cache_name, keys)
+        if self.mode == "off" or not keys:
+            return
+        task = asyncio.create_task(self._broadcast_many(cache_name, keys))
+        self._broadcasts.add(task)
+        task.add_done_callback(self._broadcasts.discard)
+
+    async def drain(self):
+        """Wait for background broadcasts to finish"""
+        if self._broadcasts:
+            await asyncio.gather(*self._broadcasts, return_exceptions=True)
+
+    def _invalidate_many(self, cache_name: str, keys: List[Any]):
+        cache = self._caches.get(cache_name)
+        if cache is not None:
+            for key in keys:
+                cache.invalidate(key)
+
+    async def _broadcast_many(self, cache_name: str, keys: List[Any]):
+        created_at = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_many([
+                {"cache": cache_name, "key": key, "origin": self.worker_id, "created_at": created_at}
+                for key in keys
+            ])
+        except Exception as e:
+            logger.error("Error publishing cache invalidations for %s: %s", cache_name, e)
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("created_at", expireAfterSeconds=INVALIDATION_RETENTION_SECONDS)
+        except Exception as e:
+            logger.error("Error creating cache invalidation index: %s", e)
+
+    async def run(self):
+        """Apply invalidations published by other workers until cancelled"""
+        if self.mode == "off":
+            return
+        await self.ensure_indexes()
+        if self.mode in ("auto", "change_stream"):
+            try:
+                await self._watch()
+                return
+            except Exception as e:
+                if self.mode == "change_stream" or getattr(e, "code", None) not in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    raise
+                logger.info("Change streams not supported by this MongoDB deployment; polling for cache invalidations")
+        await self._poll()
+
+    async def _watch(self):
+        resume_token = None
+        while True:
+            try:
+                async with self.collection.watch(
+                    [{"$match": {"operationType": "insert"}}],
+                    resume_after=resume_token
+                ) as stream:
+                    self.active_mode = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._apply(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if getattr(e, "code", None) in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    raise
+                # Anything cached while the stream was down may be stale
+                logger.error("Cache invalidation change stream failed, resuming: %s", e)
+                for cache in self._caches.values():
+                    cache.invalidate()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self):
+        self.active_mode = "poll"
+        since = datetime.now(timezone.utc)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            poll_started = datetime.now(timezone.utc)
+            try:
+                cursor = self.collection.find(
+                    {"created_at": {"$gte": since - timedelta(seconds=POLL_LOOKBACK_SECONDS)}}
+                ).sort("created_at", 1)
+                async for event in cursor:
+                    if event["_id"] in self._seen:
+                        continue
+                    self._seen[event["_id"]] = event["created_at"]
+                    self._apply(event)
+                since = poll_started
+                horizon = since - timedelta(seconds=2 * POLL_LOOKBACK_SECONDS)
+                self._seen = {
+                    event_id: created_at for event_id, created_at in self._seen.items()
+                    if _aware(created_at) >= horizon
+                }
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error polling cache invalidations: %s", e)
+
+
+def _aware(value: datetime) -> datetime:
+    # PyMongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
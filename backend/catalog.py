@@ -0,0 +1,70 @@
+"""
+Product Catalog
+Backend copy of the products listed in frontend/src/mock.js
+"""
+
+from typing import Dict, List
+
+PRODUCTS: List[Dict] = [
+    {
+        "id": "top-1",
+        "name": "Timeless Unseen",
+        "category": "tops",
+        "price": 449.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/k936sl7w_emrebey_09_09_25_0053.jpeg",
+    },
+    {
+        "id": "top-2",
+        "name": "Good Old Times",
+        "category": "tops",
+        "price": 449.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/l19mdrg6_emrebey_09_09_25_0134.jpeg",
+    },
+    {
+        "id": "top-3",
+        "name": "Global Design",
+        "category": "tops",
+        "price": 449.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/phxaxxvb_emrebey_09_09_25_0124.jpeg",
+    },
+    {
+        "id": "top-4",
+        "name": "The Unseen",
+        "category": "tops",
+        "price": 449.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/a28j9m3w_emrebey_09_09_25_0039.jpeg",
+    },
+    {
+        "id": "top-5",
+        "name": "Basic",
+        "category": "tops",
+        "price": 449.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/7hldwm6r_emrebey_09_09_25_0048.jpeg",
+    },
+    {
+        "id": "pant-1",
+        "name": "Bandana Shorts",
+        "category": "pants",
+        "price": 199.0,
+        "sizes": ["S", "M", "L", "XL", "XXL"],
+        "colors": ["Black", "Teal", "White"],
+        "image": "https://customer-assets.emergentagent.com/job_unseen-daily/artifacts/8wgzlv16_emrebey_09_09_25_0011.jpeg",
+    },
+]
+
+PRODUCTS_BY_ID: Dict[str, Dict] = {product["id"]: product for product in PRODUCTS}
+
+
+def get_product(product_id: str) -> Dict:
+    """Get a catalog product by ID, or None"""
+    return PRODUCTS_BY_ID.get(product_id)
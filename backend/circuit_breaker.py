@@ -0,0 +1,86 @@
+"""
+Circuit Breaker
+Stops calling a dependency that keeps failing, then probes it again after a cooldown
+
+Closed, calls go through and consecutive failures are counted. After `failure_threshold`
+of them the circuit opens and calls are refused immediately instead of each waiting out
+a timeout. Once `reset_seconds` have passed it is half open: one trial call is let
+through, and its outcome closes the circuit or opens it for another cooldown.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, safe to share between threads"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def configure_from_env(self, prefix: str):
+        """Read <prefix>_CIRCUIT_FAILURES and <prefix>_CIRCUIT_RESET_SECONDS"""
+        self.failure_threshold = int(os.getenv(f'{prefix}_CIRCUIT_FAILURES', str(self.failure_threshold)))
+        self.reset_seconds = float(os.getenv(f'{prefix}_CIRCUIT_RESET_SECONDS', str(self.reset_seconds)))
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return OPEN
+        return HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may be made now; in half open state only one trial at a time"""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == OPEN or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a trial call through"""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'failure_threshold': self.failure_threshold,
+            'retry_in_seconds': round(self.retry_in(), 1),
+        }
+
+
+# HYP payment gateway; configured from HYP_CIRCUIT_* by the app
+hyp_circuit = CircuitBreaker("hyp")
@@ -0,0 +1,164 @@
+"""
+Database Connection
+MongoDB handle whose Motor client is created on first use
+
+Importing the app therefore neither loads the driver nor touches the network; the
+client, its command listeners and its pool are set up by the first query or by warmup().
+Pool, compression and retry options come from MONGO_* environment variables, and
+analytics/export reads can be routed away from the primary with with_read_preference().
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCE_NAMES = ('primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest')
+
+
+class MongoSettings:
+    """Connection pool, compression, retry and read routing settings for the Motor client"""
+
+    def __init__(self, max_pool_size: int = 100, min_pool_size: int = 0,
+                 max_idle_time_ms: Optional[int] = None, server_selection_timeout_ms: int = 30000,
+                 wait_queue_timeout_ms: Optional[int] = None, compressors: Optional[List[str]] = None,
+                 retry_reads: bool = True, retry_writes: bool = True,
+                 analytics_read_preference: str = 'secondaryPreferred'):
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.max_idle_time_ms = max_idle_time_ms
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.compressors = compressors or []
+        self.retry_reads = retry_reads
+        self.retry_writes = retry_writes
+        if analytics_read_preference not in READ_PREFERENCE_NAMES:
+            raise ValueError(f"Unknown read preference: {analytics_read_preference}")
+        self.analytics_read_preference = analytics_read_preference
+
+    @classmethod
+    def from_env(cls) -> 'MongoSettings':
+        def optional_int(name: str) -> Optional[int]:
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            max_pool_size=int(os.getenv('MONGO_MAX_POOL_SIZE', '100')),
+            min_pool_size=int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+            max_idle_time_ms=optional_int('MONGO_MAX_IDLE_TIME_MS'),
+            server_selection_timeout_ms=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '30000')),
+            wait_queue_timeout_ms=optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+            compressors=[name.strip() for name in os.getenv('MONGO_COMPRESSORS', '').split(',') if name.strip()],
+            retry_reads=os.getenv('MONGO_RETRY_READS', 'true').lower() == 'true',
+            retry_writes=os.getenv('MONGO_RETRY_WRITES', 'true').lower() == 'true',
+            analytics_read_preference=os.getenv('MONGO_ANALYTICS_READ_PREFERENCE', 'secondaryPreferred'),
+        )
+
+    def client_options(self) -> Dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        options = {
+            'maxPoolSize': self.max_pool_size,
+            'minPoolSize': self.min_pool_size,
+            'serverSelectionTimeoutMS': self.server_selection_timeout_ms,
+            'retryReads': self.retry_reads,
+            'retryWrites': self.retry_writes,
+        }
+        if self.max_idle_time_ms is not None:
+            options['maxIdleTimeMS'] = self.max_idle_time_ms
+        if self.wait_queue_timeout_ms is not None:
+            options['waitQueueTimeoutMS'] = self.wait_queue_timeout_ms
+        if self.compressors:
+            # PyMongo warns about and skips compressors whose library (zstandard, python-snappy) is missing
+            options['compressors'] = ','.join(self.compressors)
+        return options
+
+    def to_dict(self) -> Dict:
+        return {
+            'max_pool_size': self.max_pool_size,
+            'min_pool_size': self.min_pool_size,
+            'max_idle_time_ms': self.max_idle_time_ms,
+            'server_selection_timeout_ms': self.server_selection_timeout_ms,
+            'wait_queue_timeout_ms': self.wait_queue_timeout_ms,
+            'compressors': self.compressors,
+            'retry_reads': self.retry_reads,
+            'retry_writes': self.retry_writes,
+            'analytics_read_preference': self.analytics_read_preference,
+        }
+
+
+def with_read_preference(collection, name: str):
+    """Collection handle reading with the named read preference (e.g. secondaryPreferred)"""
+    if name == 'primary':
+        return collection
+    from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+    return collection.with_options(read_preference=make_read_preference(read_pref_mode_from_name(name), None))
+
+
+class Database:
+    """Lazily connected MongoDB database; attribute access returns collections like Motor's"""
+
+    def __init__(self, url: str, name: str, settings: Optional[MongoSettings] = None):
+        self.url = url
+        self.name = name
+        self.settings = settings or MongoSettings()
+        self._client = None
+        self._database = None
+
+    @property
+    def client(self):
+        """Motor client, created on first access"""
+        if self._client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            from mongo_monitoring import MongoCommandMetrics, MongoPoolMetrics, MongoTracingListener
+            from tracing import tracer
+
+            self._client = AsyncIOMotorClient(
+                self.url,
+                event_listeners=[MongoCommandMetrics(), MongoPoolMetrics(), MongoTracingListener(tracer)],
+                **self.settings.client_options()
+            )
+            self._database = self._client[self.name]
+        return self._client
+
+    @property
+    def connected(self) -> bool:
+        """Whether the client has been created"""
+        return self._client is not None
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._database is None:
+            self.client
+        return getattr(self._database, name)
+
+    def __getitem__(self, name: str):
+        if self._database is None:
+            self.client
+        return self._database[name]
+
+    @staticmethod
+    def _import_driver():
+        import motor.motor_asyncio  # noqa: F401
+        import mongo_monitoring  # noqa: F401
+
+    async def warmup(self, connections: int):
+        """Open up to `connections` pooled sockets at once by issuing concurrent pings"""
+        try:
+            # Import the driver off the event loop so requests are not stalled behind it
+            if self._client is None:
+                await asyncio.get_running_loop().run_in_executor(None, self._import_driver)
+            await asyncio.gather(*(self.client.admin.command('ping') for _ in range(max(connections, 1))))
+            logger.info("MongoDB connection pool warmed with %s connection(s)", connections)
+        except Exception as e:
+            logger.error("Error warming MongoDB connection pool: %s", e)
+
+    def close(self):
+        """Close the client if it was ever created"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._database = None
@@ -3,8 +3,11 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from models import Order
 import os
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 class EmailService:
     def __init__(self):
         # For now, using a simple SMTP setup
@@ -18,19 +21,19 @@ class EmailService:
         for item in order.items:
             items_html += f"""
             <tr>
-                <td style="padding: 10px; border-bottom: 1px solid #eee;">{item.product_name}</td>
-                <td style="padding: 10px; border-bottom: 1px solid #eee;">{item.color} / {item.size}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">{item.name}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">{item.selected_color} / {item.selected_size}</td>
                 <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">{item.quantity}</td>
                 <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">₪{item.price * item.quantity:.2f}</td>
             </tr>
             """
         
         if is_customer:
-            greeting = f"Hi {order.customer.first_name},"
+            greeting = f"Hi {order.customer_info.first_name},"
             message = "Thank you for your order! We've received your order and will process it shortly."
         else:
             greeting = "New Order Received!"
-            message = f"You have a new order from {order.customer.first_name} {order.customer.last_name}"
+            message = f"You have a new order from {order.customer_info.first_name} {order.customer_info.last_name}"
         
         html = f"""
         <!DOCTYPE html>
@@ -92,12 +95,12 @@ class EmailService:
                     
                     <h3>Shipping Address:</h3>
                     <p>
-                        {order.customer.first_name} {order.customer.last_name}<br>
-                        {order.customer.address}<br>
-                        {order.customer.city}, {order.customer.postal_code}<br>
-                        {order.customer.country}<br>
-                        <strong>Phone:</strong> {order.customer.phone}<br>
-                        <strong>Email:</strong> {order.customer.email}
+                        {order.customer_info.first_name} {order.customer_info.last_name}<br>
+                        {order.shipping_address.address}<br>
+                        {order.shipping_address.city}, {order.shipping_address.postal_code}<br>
+                        {order.shipping_address.country}<br>
+                        <strong>Phone:</strong> {order.customer_info.phone}<br>
+                        <strong>Email:</strong> {order.customer_info.email}
                     </p>
                 </div>
                 <div class="footer">
@@ -117,11 +120,10 @@ class EmailService:
         html_content = self.format_order_email_html(order, is_customer=True)
         
         # Log email (in production, actually send it)
-        print(f"\n📧 ORDER CONFIRMATION EMAIL TO CUSTOMER:")
-        print(f"To: {order.customer.email}")
-        print(f"Subject: {subject}")
-        print(f"Order: {order.order_number}")
-        print(f"Total: ₪{order.total:.2f}\n")
+        logger.info(
+            "Order confirmation email to customer %s: %s (order %s, total ₪%.2f)",
+            order.customer_info.email, subject, order.order_number, order.total
+        )
         
         # TODO: Implement actual email sending with SMTP or email service
         return True
@@ -132,12 +134,11 @@ class EmailService:
         html_content = self.format_order_email_html(order, is_customer=False)
         
         # Log email (in production, actually send it)
-        print(f"\n📧 NEW ORDER NOTIFICATION TO OWNER:")
-        print(f"To: {self.owner_email}")
-        print(f"Subject: {subject}")
-        print(f"Customer: {order.customer.first_name} {order.customer.last_name}")
-        print(f"Total: ₪{order.total:.2f}")
-        print(f"Items: {len(order.items)}\n")
+        logger.info(
+            "New order notification to owner %s: %s (customer %s %s, total ₪%.2f, %s items)",
+            self.owner_email, subject, order.customer_info.first_name, order.customer_info.last_name,
+            order.total, len(order.items)
+        )
         
         # TODO: Implement actual email sending
         return True
@@ -151,7 +152,7 @@ class EmailService:
         <html>
         <body style="font-family: Arial, sans-serif;">
             <h2>Your Order Has Shipped!</h2>
-            <p>Hi {order.customer.first_name},</p>
+            <p>Hi {order.customer_info.first_name},</p>
             <p>Great news! Your order <strong>#{order.order_number}</strong> has been shipped and is on its way to you.</p>
             {f'<p><strong>Tracking Number:</strong> {order.tracking_number}</p>' if order.tracking_number else ''}
             <p>Thank you for shopping with UNSEEN!</p>
@@ -159,10 +160,9 @@ class EmailService:
         </html>
         """
         
-        print(f"\n📧 SHIPPING NOTIFICATION TO CUSTOMER:")
-        print(f"To: {order.customer.email}")
-        print(f"Order: {order.order_number}")
-        if order.tracking_number:
-            print(f"Tracking: {order.tracking_number}\n")
+        logger.info(
+            "Shipping notification to customer %s: order %s, tracking %s",
+            order.customer_info.email, order.order_number, order.tracking_number or "none"
+        )
         
         return True
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Synthetic Order Generator
+Bulk-inserts realistic-looking orders for scale testing analytics and order listing
+
+Orders follow the models.Order schema: items are drawn from the catalog with power-law
+product popularity, dates follow weekly and seasonal peaks over a configurable range,
+and the status mix depends on order age. Each worker process generates its share of
+the orders and writes them with unordered insert_many batches.
+
+Usage (from backend/):
+    python generate_orders.py --count 1000000 --start 2024-01-01 --end 2025-10-01
+    python generate_orders.py --count 200000 --workers 4 --drop
+    python generate_orders.py --count 100000 --dry-run      # measure generation only
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+from catalog import PRODUCTS
+from order_search import search_prefixes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+FIRST_NAMES = [
+    "Noa", "Tamar", "Maya", "Yael", "Shira", "Adi", "Michal", "Roni", "Dana", "Lior",
+    "Yosef", "David", "Itai", "Omer", "Noam", "Eitan", "Amit", "Daniel", "Ariel", "Yonatan",
+    "Sarah", "Avigail", "Hila", "Gal", "Tom", "Guy", "Ido", "Nadav", "Ofir", "Liat",
+]
+LAST_NAMES = [
+    "Cohen", "Levi", "Mizrahi", "Peretz", "Biton", "Dahan", "Avraham", "Friedman", "Azulay", "Katz",
+    "Yosef", "David", "Amar", "Ohana", "Hadad", "Gabay", "Ben David", "Shapiro", "Malka", "Vaknin",
+]
+CITIES = [
+    ("Tel Aviv", "6688101"), ("Jerusalem", "9414601"), ("Haifa", "3303101"), ("Rishon LeZion", "7525101"),
+    ("Petah Tikva", "4951101"), ("Ashdod", "7747101"), ("Netanya", "4240101"), ("Beer Sheva", "8410101"),
+    ("Holon", "5810101"), ("Ramat Gan", "5250101"), ("Herzliya", "4610101"), ("Eilat", "8810101"),
+]
+STREETS = ["Rothschild Blvd", "Dizengoff St", "Herzl St", "Ben Yehuda St", "Allenby St", "Jabotinsky St", "Weizmann St"]
+EMAIL_DOMAINS = ["gmail.com", "walla.co.il", "yahoo.com", "hotmail.com", "outlook.com"]
+
+SIZE_WEIGHTS = {"S": 0.12, "M": 0.3, "L": 0.32, "XL": 0.18, "XXL": 0.08}
+ITEM_COUNT_WEIGHTS = [0.62, 0.25, 0.09, 0.04]   # 1..4 distinct items per order
+QUANTITY_WEIGHTS = [0.86, 0.11, 0.03]           # 1..3 units per item
+EXPRESS_SHARE = 0.22
+SHIPPING_COSTS = {"standard": 40.0, "express": 60.0}
+
+# Hour-of-day weights (Israel time is close enough to UTC+2/3 for test data)
+HOUR_WEIGHTS = np.array([
+    1, 0.6, 0.3, 0.2, 0.2, 0.3, 0.6, 1.2, 1.8, 2.2, 2.4, 2.5,
+    2.6, 2.5, 2.4, 2.4, 2.6, 2.9, 3.2, 3.6, 3.9, 3.7, 2.8, 1.8,
+])
+
+STATUSES = ["pending_payment", "payment_confirmed", "processing", "shipped", "delivered", "cancelled"]
+# Status mix by order age: under 3 days, under 14 days, older
+STATUS_WEIGHTS_BY_AGE = [
+    [0.14, 0.36, 0.30, 0.15, 0.00, 0.05],
+    [0.05, 0.04, 0.08, 0.45, 0.33, 0.05],
+    [0.04, 0.00, 0.00, 0.01, 0.89, 0.06],
+]
+
+# Multiplying by an odd constant is a bijection mod 2**32, so sequence numbers map to
+# unique but random-looking order numbers
+ORDER_NUMBER_MULTIPLIER = 2654435761
+
+
+def _seasonal_weight(day: datetime) -> float:
+    """Relative order volume for a day: weekly pattern, holiday season and summer sale"""
+    weight = 1.0
+    # Thursday and Saturday evening are the busiest in Israel, Friday the quietest
+    weight *= {0: 1.0, 1: 1.0, 2: 1.05, 3: 1.3, 4: 0.7, 5: 1.2, 6: 1.1}[day.weekday()]
+    # Black Friday / Cyber Monday
+    if day.month == 11 and day.day >= 20:
+        weight *= 3.5
+    elif day.month == 12 and day.day <= 2:
+        weight *= 2.5
+    # Holiday season and summer sale
+    if day.month == 12:
+        weight *= 1.6
+    if day.month in (6, 7):
+        weight *= 1.4
+    # Rosh Hashanah / Sukkot shopping in September
+    if day.month == 9:
+        weight *= 1.25
+    return weight
+
+
+class OrderGenerator:
+    """Generates batches of order documents with numpy-vectorised sampling"""
+
+    def __init__(self, start: datetime, end: datetime, seed: int = 0,
+                 popularity_exponent: float = 1.2, customer_pool: int = 50000):
+        self.rng = np.random.default_rng(seed)
+        self.now = datetime.now(timezone.utc)
+
+        # Catalog variants (product, size, color) with power-law product popularity
+        self.variants = []
+        weights = []
+        for rank, product in enumerate(PRODUCTS, start=1):
+            product_weight = rank ** -popularity_exponent
+            for size in product["sizes"]:
+                for color in product["colors"]:
+                    self.variants.append({
+                        "product_id": product["id"],
+                        "name": product["name"],
+                        "price": product["price"],
+                        "selected_size": size,
+                        "selected_color": color,
+                        "image": product["image"],
+                    })
+                    weights.append(product_weight * SIZE_WEIGHTS.get(size, 0.1) / len(product["colors"]))
+        self.variant_p = np.array(weights) / sum(weights)
+
+        # Days in range weighted by seasonality
+        days = max((end - start).days, 1)
+        self.days = [start + timedelta(days=offset) for offset in range(days)]
+        self.start64 = np.datetime64(start.replace(tzinfo=None), 's')
+        self.now64 = np.datetime64(self.now.replace(tzinfo=None), 's')
+        day_weights = np.array([_seasonal_weight(day) for day in self.days])
+        self.day_p = day_weights / day_weights.sum()
+        self.hour_p = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+        # Customers: a few repeat buyers account for a large share of orders
+        self.customers = self._build_customers(customer_pool)
+        customer_weights = np.arange(1, customer_pool + 1, dtype=float) ** -0.7
+        self.customer_p = customer_weights / customer_weights.sum()
+
+    def _build_customers(self, count: int) -> List[Dict]:
+        customers = []
+        for index in range(count):
+            first = FIRST_NAMES[self.rng.integers(len(FIRST_NAMES))]
+            last = LAST_NAMES[self.rng.integers(len(LAST_NAMES))]
+            city, postal_code = CITIES[self.rng.integers(len(CITIES))]
+            local_part = f"{first}.{last}".lower().replace(" ", "")
+            customers.append({
+                "customer_info": {
+                    "first_name": first,
+                    "last_name": last,
+                    "email": f"{local_part}{index}@{EMAIL_DOMAINS[index % len(EMAIL_DOMAINS)]}",
+                    "phone": f"+972-5{self.rng.integers(0, 9)}-{self.rng.integers(100, 999)}-{self.rng.integers(1000, 9999)}",
+                },
+                "shipping_address": {
+                    "address": f"{self.rng.integers(1, 200)} {STREETS[self.rng.integers(len(STREETS))]}",
+                    "city": city,
+                    "postal_code": postal_code,
+                    "country": "Israel",
+                },
+                "payment_info": {
+                    "card_last_four": f"{self.rng.integers(0, 10000):04d}",
+                    "card_name": f"{first} {last}",
+                    "payment_method": "credit_card",
+                },
+            })
+        return customers
+
+    def batch(self, size: int, first_sequence: int) -> List[Dict]:
+        """Generate `size` orders; order numbers derive from sequence numbers starting at first_sequence"""
+        rng = self.rng
+        item_counts = rng.choice(len(ITEM_COUNT_WEIGHTS), size=size, p=ITEM_COUNT_WEIGHTS) + 1
+        variant_index = rng.choice(len(self.variants), size=int(item_counts.sum()), p=self.variant_p).tolist()
+        quantities = (rng.choice(len(QUANTITY_WEIGHTS), size=len(variant_index), p=QUANTITY_WEIGHTS) + 1).tolist()
+        customer_index = rng.choice(len(self.customers), size=size, p=self.customer_p).tolist()
+        express = (rng.random(size) < EXPRESS_SHARE).tolist()
+        id_bytes = rng.bytes(16 * size)
+
+        # Timestamps and status are computed column-wise
+        day_offsets = rng.choice(len(self.days), size=size, p=self.day_p)
+        seconds = day_offsets * 86400 + rng.choice(24, size=size, p=self.hour_p) * 3600 + rng.integers(0, 3600, size=size)
+        created = self.start64 + seconds.astype('timedelta64[s]')
+        updated = created + (rng.integers(1, 48, size=size) * 3600).astype('timedelta64[s]')
+        created_iso = [value + '+00:00' for value in np.datetime_as_string(created, unit='s').tolist()]
+        updated_iso = [value + '+00:00' for value in np.datetime_as_string(updated, unit='s').tolist()]
+
+        age_days = (self.now64 - created).astype('timedelta64[D]').astype(int)
+        age_bucket = np.where(age_days < 3, 0, np.where(age_days < 14, 1, 2))
+        status_draw = rng.random(size)
+        status_index = np.zeros(size, dtype=int)
+        for bucket, weights in enumerate(STATUS_WEIGHTS_BY_AGE):
+            mask = age_bucket == bucket
+            status_index[mask] = np.searchsorted(np.cumsum(weights), status_draw[mask])
+        statuses = [STATUSES[min(index, len(STATUSES) - 1)] for index in status_index.tolist()]
+
+        variants = self.variants
+        customers = self.customers
+        orders = []
+        item_cursor = 0
+        for i, item_count in enumerate(item_counts.tolist()):
+            items = []
+            subtotal = 0.0
+            for _ in range(item_count):
+                item = dict(variants[variant_index[item_cursor]])
+                item["quantity"] = quantities[item_cursor]
+                subtotal += item["price"] * item["quantity"]
+                items.append(item)
+                item_cursor += 1
+
+            shipping_method = "express" if express[i] else "standard"
+            shipping_cost = SHIPPING_COSTS[shipping_method]
+            customer = customers[customer_index[i]]
+            status = statuses[i]
+            sequence = first_sequence + i
+
+            orders.append({
+                "id": str(uuid.UUID(bytes=id_bytes[16 * i:16 * i + 16], version=4)),
+                "order_number": f"ORD-{(sequence * ORDER_NUMBER_MULTIPLIER) % 2 ** 32:08X}",
+                "customer_info": customer["customer_info"],
+                "customer_email": customer["customer_info"]["email"],
+                "shipping_address": customer["shipping_address"],
+                "items": items,
+                "shipping_method": shipping_method,
+                "shipping_cost": shipping_cost,
+                "subtotal": subtotal,
+                "total": subtotal + shipping_cost,
+                "payment_info": customer["payment_info"],
+                "discount_code": None,
+                "discount_amount": 0,
+                "status": status,
+                "payment_transaction_id": None if status in ("pending_payment", "cancelled") else f"SYN{sequence:012d}",
+                "created_at": created_iso[i],
+                "updated_at": created_iso[i] if status == "pending_payment" else updated_iso[i],
+                "notes": None,
+            })
+            orders[-1]["search_prefixes"] = search_prefixes(orders[-1])
+        return orders
+
+
+def _worker(worker_id: int, args: argparse.Namespace, count: int, first_sequence: int, results) -> None:
+    """Generate and insert one worker's share of the orders"""
+    from pymongo import MongoClient
+
+    generator = OrderGenerator(args.start, args.end, seed=args.seed * 1000 + worker_id,
+                               popularity_exponent=args.popularity_exponent,
+                               customer_pool=args.customers)
+    collection = None
+    if not args.dry_run:
+        client = MongoClient(args.mongo_url, w=1)
+        collection = client[args.db_name].orders
+
+    generated = 0
+    while generated < count:
+        size = min(args.batch_size, count - generated)
+        orders = generator.batch(size, first_sequence + generated)
+        if collection is not None:
+            collection.insert_many(orders, ordered=False, bypass_document_validation=True)
+        generated += size
+    results.put(generated)
+
+
+def _validate_schema(args: argparse.Namespace) -> None:
+    """Check a sample document against models.Order so schema drift fails fast"""
+    from models import Order, deserialize_from_mongo
+
+    sample = OrderGenerator(args.start, args.end, seed=args.seed, customer_pool=10).batch(1, 0)[0]
+    Order(**deserialize_from_mongo(sample))
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+def main() -> int:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    parser = argparse.ArgumentParser(description="Bulk-insert synthetic orders for scale testing")
+    parser.add_argument('--count', type=int, default=1_000_000, help="number of orders (default 1,000,000)")
+    parser.add_argument('--start', type=_parse_date, default=today - timedelta(days=365), help="first day, YYYY-MM-DD")
+    parser.add_argument('--end', type=_parse_date, default=today, help="day after the last day, YYYY-MM-DD")
+    parser.add_argument('--batch-size', type=int, default=10000, help="documents per insert_many (default 10,000)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--customers', type=int, default=50000, help="size of the customer pool")
+    parser.add_argument('--popularity-exponent', type=float, default=1.2,
+                        help="power-law exponent of product popularity (higher = more skewed)")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'unseen'))
+    parser.add_argument('--drop', action='store_true', help="delete existing orders first")
+    parser.add_argument('--dry-run', action='store_true', help="generate without inserting")
+    args = parser.parse_args()
+
+    if args.end <= args.start:
+        parser.error("--end must be after --start")
+
+    _validate_schema(args)
+
+    if args.drop and not args.dry_run:
+        from pymongo import MongoClient
+        MongoClient(args.mongo_url)[args.db_name].orders.delete_many({})
+
+    workers = max(1, min(args.workers, args.count))
+    shares = [args.count // workers + (1 if i < args.count % workers else 0) for i in range(workers)]
+    results = multiprocessing.Queue()
+    processes = []
+    started = time.perf_counter()
+    first_sequence = int(time.time()) * 1000  # keep order numbers distinct across runs
+    for worker_id, share in enumerate(shares):
+        process = multiprocessing.Process(target=_worker, args=(worker_id, args, share, first_sequence, results))
+        first_sequence += share
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    failed = [process for process in processes if process.exitcode != 0]
+    total = sum(results.get() for _ in range(len(processes) - len(failed)))
+    action = "Generated" if args.dry_run else "Inserted"
+    print(f"{action} {total:,} orders in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s, {workers} workers)")
+    if failed:
+        print(f"{len(failed)} worker(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Health Checks
+Liveness and readiness probes that stay cheap however often they are called
+
+/healthz answers from memory: the process is up and its event loop is serving. /readyz
+pings MongoDB with a short timeout and reports connection pool saturation, the HYP
+circuit breaker and the email queue (order events the email consumers have not sent
+yet). Only MongoDB decides readiness: the other checks describe shared dependencies,
+and taking every instance out of rotation would not help them.
+
+A readiness result is reused for `ttl_seconds`, and concurrent probes share one check
+in flight, so a burst of probes costs at most one ping a second per worker.
+"""
+
+import time
+import asyncio
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from circuit_breaker import CircuitBreaker
+from metrics import MONGO_POOL_CHECKED_OUT, MONGO_POOL_CONNECTIONS
+from order_events import OrderEventStore
+
+# Pools with this share of their connections checked out are reported as saturated
+POOL_SATURATION_WARNING = 0.9
+
+
+class HealthChecker:
+    """Readiness of this worker, checked at most once per `ttl_seconds`"""
+
+    def __init__(self, db, event_store: OrderEventStore, hyp: CircuitBreaker,
+                 email_consumers: Sequence[str], timeout_seconds: float = 1.0, ttl_seconds: float = 1.0):
+        self.db = db
+        self.event_store = event_store
+        self.hyp = hyp
+        self.email_consumers = list(email_consumers)
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self.started_at = time.time()
+        self._result: Optional[Tuple[bool, Dict[str, Any]]] = None
+        self._checked_at = 0.0
+        self._checking: Optional[asyncio.Task] = None
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    async def _mongo(self) -> Dict[str, Any]:
+        if not self.db.connected:
+            # The client is created by the startup warm-up; not ready until then
+            return {"status": "connecting"}
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.db.client.admin.command("ping"), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "timeout_seconds": self.timeout_seconds}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    def _pool(self) -> Dict[str, Any]:
+        max_size = self.db.settings.max_pool_size
+        connections = MONGO_POOL_CONNECTIONS.values()
+        servers = {}
+        for (address,), checked_out in MONGO_POOL_CHECKED_OUT.values().items():
+            saturation = checked_out / max_size if max_size else 0.0
+            servers[address] = {
+                "checked_out": int(checked_out),
+                "open": int(connections.get((address,), 0)),
+                "max": max_size,
+                "saturation": round(saturation, 3),
+            }
+        saturated = any(server["saturation"] >= POOL_SATURATION_WARNING for server in servers.values())
+        return {"status": "saturated" if saturated else "ok", "servers": servers}
+
+    async def _email_queue(self) -> Dict[str, Any]:
+        try:
+            depths = await asyncio.wait_for(
+                asyncio.gather(*(self.event_store.backlog(consumer) for consumer in self.email_consumers)),
+                self.timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            return {"status": "timeout"}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        return {"status": "ok", "depth": sum(depths), "consumers": dict(zip(self.email_consumers, depths))}
+
+    async def _check(self) -> Tuple[bool, Dict[str, Any]]:
+        mongo, email_queue = await asyncio.gather(self._mongo(), self._email_queue())
+        ready = mongo["status"] == "ok"
+        hyp = self.hyp.to_dict()
+        checks = {
+            "mongodb": mongo,
+            "mongodb_pool": self._pool(),
+            "hyp_circuit": {"status": "ok" if hyp["state"] == "closed" else "degraded", **hyp},
+            "email_queue": email_queue,
+        }
+        degraded = any(check["status"] != "ok" for check in checks.values())
+        status = "degraded" if ready and degraded else "ok" if ready else "unavailable"
+        return ready, {"status": status, "checks": checks}
+
+    async def _refresh(self):
+        try:
+            self._result = await self._check()
+            self._checked_at = time.monotonic()
+        finally:
+            self._checking = None
+
+    async def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, report), from the last check if it is recent enough"""
+        if self._result is not None and time.monotonic() - self._checked_at < self.ttl_seconds:
+            return self._result
+        if self._checking is None:
+            self._checking = asyncio.create_task(self._refresh())
+        # Shielded so a probe that disconnects does not cancel the check others wait on
+        await asyncio.shield(self._checking)
+        return self._result
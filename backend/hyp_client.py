@@ -9,8 +9,13 @@ from datetime import datetime
 import uuid
 from typing import Dict, Optional, Any
 import os
+import time
 import logging
 
+from metrics import HYP_REQUEST_LATENCY
+from tracing import tracer
+from circuit_breaker import hyp_circuit
+
 logger = logging.getLogger(__name__)
 
 class HYPPaymentClient:
@@ -28,7 +33,12 @@ class HYPPaymentClient:
         if not self.api_endpoint.endswith('/'):
             self.api_endpoint += '/'
         
-        logger.info(f"HYP Client initialized (Environment: {self.environment}, Terminal: {self.terminal_id})")
+        logger.info("HYP Client initialized (Environment: %s, Terminal: %s)", self.environment, self.terminal_id)
+    
+    @staticmethod
+    def _record_latency(operation: str, outcome: str, start: float):
+        """Record HYP call latency and outcome"""
+        HYP_REQUEST_LATENCY.labels(operation, outcome).observe(time.perf_counter() - start)
     
     def _generate_unique_id(self) -> str:
         """Generate unique transaction ID"""
@@ -105,8 +115,8 @@ class HYPPaymentClient:
             return response_dict
         
         except ET.ParseError as e:
-            logger.error(f"Failed to parse HYP response: {str(e)}")
-            logger.error(f"Response was: {xml_response[:500]}")
+            logger.error("Failed to parse HYP response: %s", e)
+            logger.error("Response was: %s", xml_response[:500])
             return {
                 'error': 'parse_error',
                 'message': f"Failed to parse response: {str(e)}"
@@ -135,6 +145,17 @@ class HYPPaymentClient:
         Returns:
             Dictionary with payment result
         """
+        start = time.perf_counter()
+        # While HYP keeps failing, fail fast instead of holding the customer for the timeout
+        if not hyp_circuit.allow():
+            logger.warning("HYP circuit open, not sending payment for order %s", order_id)
+            self._record_latency('payment', 'circuit_open', start)
+            return {
+                'success': False,
+                'error': 'circuit_open',
+                'response_message': 'Payment gateway temporarily unavailable, please try again shortly',
+                'order_id': order_id
+            }
         try:
             # Build XML request
             xml_payload = self._build_payment_request_xml(
@@ -149,7 +170,7 @@ class HYPPaymentClient:
             
             # Mask sensitive data for logging
             masked_card = f"****{card_number[-4:]}" if len(card_number) >= 4 else "****"
-            logger.info(f"Processing HYP payment for order {order_id}, amount: ₪{amount:.2f}, card: {masked_card}")
+            logger.info("Processing HYP payment for order %s, amount: ₪%.2f, card: %s", order_id, amount, masked_card)
             
             # Send request to HYP
             headers = {
@@ -157,17 +178,22 @@ class HYPPaymentClient:
             }
             
             # HYP expects data as form parameter 'data'
-            response = requests.post(
-                self.api_endpoint,
-                data={'data': xml_payload},
-                headers=headers,
-                timeout=30
-            )
+            with tracer.start_span("hyp.payment", order_id=order_id) as span:
+                response = requests.post(
+                    self.api_endpoint,
+                    data={'data': xml_payload},
+                    headers=headers,
+                    timeout=30
+                )
+                if span:
+                    span.set_attribute("http.status_code", response.status_code)
             
-            logger.info(f"HYP response status: {response.status_code}")
+            logger.debug("HYP response status: %s", response.status_code)
             
             if response.status_code != 200:
-                logger.error(f"HYP returned HTTP {response.status_code}")
+                logger.error("HYP returned HTTP %s", response.status_code)
+                hyp_circuit.record_failure()
+                self._record_latency('payment', 'http_error', start)
                 return {
                     'success': False,
                     'error': f"HTTP error: {response.status_code}",
@@ -188,9 +214,12 @@ class HYPPaymentClient:
             response_message = result.get('responsemessage', result.get('ResponseMessage', 'Unknown error'))
             
             if is_success:
-                logger.info(f"✅ Payment successful for order {order_id}, Transaction ID: {transaction_id}")
+                logger.info("Payment successful for order %s, Transaction ID: %s", order_id, transaction_id)
             else:
-                logger.warning(f"❌ Payment failed for order {order_id}, Code: {response_code}, Message: {response_message}")
+                logger.warning("Payment failed for order %s, Code: %s, Message: %s", order_id, response_code, response_message)
+            # A decline still means the gateway is up
+            hyp_circuit.record_success()
+            self._record_latency('payment', 'success' if is_success else 'declined', start)
             
             return {
                 'success': is_success,
@@ -204,7 +233,9 @@ class HYPPaymentClient:
             }
         
         except requests.Timeout:
-            logger.error(f"HYP request timeout for order {order_id}")
+            logger.error("HYP request timeout for order %s", order_id)
+            hyp_circuit.record_failure()
+            self._record_latency('payment', 'timeout', start)
             return {
                 'success': False,
                 'error': 'timeout',
@@ -213,7 +244,9 @@ class HYPPaymentClient:
             }
         
         except requests.RequestException as e:
-            logger.error(f"Network error with HYP: {str(e)}")
+            logger.error("Network error with HYP: %s", e)
+            hyp_circuit.record_failure()
+            self._record_latency('payment', 'network_error', start)
             return {
                 'success': False,
                 'error': 'network_error',
@@ -222,7 +255,9 @@ class HYPPaymentClient:
             }
         
         except Exception as e:
-            logger.error(f"Unexpected error processing payment: {str(e)}")
+            logger.error("Unexpected error processing payment: %s", e)
+            hyp_circuit.record_failure()
+            self._record_latency('payment', 'error', start)
             return {
                 'success': False,
                 'error': 'unexpected_error',
@@ -242,6 +277,7 @@ class HYPPaymentClient:
             amount: Refund amount in ILS
             order_id: Associated order ID
         """
+        start = time.perf_counter()
         try:
             amount_agorot = int(amount * 100)
             
@@ -260,23 +296,27 @@ class HYPPaymentClient:
             
             xml_payload = ET.tostring(root, encoding='unicode', method='xml')
             
-            logger.info(f"Processing refund for order {order_id}, amount: ₪{amount:.2f}")
+            logger.info("Processing refund for order %s, amount: ₪%.2f", order_id, amount)
             
-            response = requests.post(
-                self.api_endpoint,
-                data={'data': xml_payload},
-                headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                timeout=30
-            )
+            with tracer.start_span("hyp.refund", order_id=order_id) as span:
+                response = requests.post(
+                    self.api_endpoint,
+                    data={'data': xml_payload},
+                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                    timeout=30
+                )
+                if span:
+                    span.set_attribute("http.status_code", response.status_code)
             
             result = self._parse_response(response.text)
             response_code = result.get('responsecode', result.get('ResponseCode', ''))
             is_success = response_code in ['0', '00']
             
             if is_success:
-                logger.info(f"✅ Refund successful for order {order_id}")
+                logger.info("Refund successful for order %s", order_id)
             else:
-                logger.warning(f"❌ Refund failed for order {order_id}")
+                logger.warning("Refund failed for order %s", order_id)
+            self._record_latency('refund', 'success' if is_success else 'declined', start)
             
             return {
                 'success': is_success,
@@ -289,12 +329,20 @@ class HYPPaymentClient:
             }
         
         except Exception as e:
-            logger.error(f"Error processing refund: {str(e)}")
+            logger.error("Error processing refund: %s", e)
+            self._record_latency('refund', 'error', start)
             return {
                 'success': False,
                 'error': str(e),
                 'order_id': order_id
             }
 
-# Global instance
-hyp_client = HYPPaymentClient()
+# Global instance, created on first use
+_hyp_client: Optional[HYPPaymentClient] = None
+
+def get_hyp_client() -> HYPPaymentClient:
+    """Get the shared HYP client, creating it on first use"""
+    global _hyp_client
+    if _hyp_client is None:
+        _hyp_client = HYPPaymentClient()
+    return _hyp_client
@@ -0,0 +1,486 @@
+"""
+Inventory
+Per-SKU stock levels and the reservations that hold stock for unpaid orders
+
+A SKU is a product, size and color. Its inventory document keeps `available` (units that
+can still be sold) and `reserved` (units held for orders awaiting payment), plus a
+`holds` map of order id to units held. An order reserves each of its SKUs with a single
+conditional update that only matches while `available` covers the quantity and the order
+holds nothing on the SKU yet, so concurrent checkouts on a hot SKU can never take more
+than is left and a retried reservation is not taken twice. Committing or releasing an
+order touches only the holds that still exist, which makes both safe to repeat.
+
+Each order's reservation is also recorded in stock_reservations with an expiry. MongoDB
+TTL indexes can delete documents but not give stock back, so expired holds are released
+by InventoryStore.release_expired(), run in the background, through an index on
+(status, expires_at); finished reservations are then removed by a TTL index. Before an
+order is charged, InventoryStore.renew() extends its hold, or takes the units again if the
+hold has expired, and refuses the payment if they have been sold in the meantime.
+
+SKUs without an inventory document are not tracked and never run out, so products can be
+brought under stock control one at a time.
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import OrderItem, OrderStatus, StockLevel
+from order_events import OrderEventConsumer, OrderEventType
+
+logger = logging.getLogger(__name__)
+
+# Stock is held this long for an order awaiting payment
+RESERVATION_TTL_SECONDS = 15 * 60
+
+# A commit or release that has not finished after this long is finished by release_expired()
+STALE_TRANSITION_SECONDS = 60
+
+# Finished reservations are kept this long; TTL index on completed_at
+RESERVATION_RETENTION_SECONDS = 7 * 24 * 3600
+
+RELEASE_BATCH_SIZE = 500
+
+
+class ReservationStatus(str, Enum):
+    HELD = "held"
+    COMMITTING = "committing"
+    COMMITTED = "committed"
+    RELEASING = "releasing"
+    RELEASED = "released"
+
+
+class OutOfStockError(Exception):
+    """Raised when an order asks for more units of a SKU than are available"""
+
+    def __init__(self, skus: List[str]):
+        super().__init__(f"Out of stock: {', '.join(skus)}")
+        self.skus = skus
+
+
+def sku_for(product_id: str, size: str, color: str) -> str:
+    """Inventory key of a product variant"""
+    return f"{product_id}:{size}:{color}"
+
+
+def reservation_lines(items: Iterable[OrderItem]) -> List[Dict]:
+    """Units per SKU for order items, merging repeated SKUs, in SKU order"""
+    lines: Dict[str, Dict] = {}
+    for item in items:
+        sku = sku_for(item.product_id, item.selected_size, item.selected_color)
+        line = lines.setdefault(sku, {
+            "sku": sku, "product_id": item.product_id, "size": item.selected_size,
+            "color": item.selected_color, "quantity": 0
+        })
+        line["quantity"] += item.quantity
+    return [lines[sku] for sku in sorted(lines)]
+
+
+class InventoryStore(ABC):
+    """Stock levels and order reservations"""
+
+    def __init__(self, reservation_ttl_seconds: float = RESERVATION_TTL_SECONDS):
+        self.reservation_ttl_seconds = reservation_ttl_seconds
+
+    async def ensure_indexes(self):
+        """Create the indexes the store relies on"""
+
+    @abstractmethod
+    async def set_stock(self, product_id: str, size: str, color: str, quantity: int) -> StockLevel:
+        """Set the units on hand for a SKU; units reserved for unpaid orders stay reserved"""
+
+    @abstractmethod
+    async def adjust_stock(self, product_id: str, size: str, color: str, delta: int) -> Optional[StockLevel]:
+        """Add (or remove) available units; None if the SKU is not tracked or would go negative"""
+
+    @abstractmethod
+    async def stock(self, product_id: Optional[str] = None) -> List[StockLevel]:
+        """Stock levels, for one product or all"""
+
+    @abstractmethod
+    async def reserve(self, order_id: str, items: Iterable[OrderItem]):
+        """Hold stock for an order's items; raises OutOfStockError and holds nothing if any SKU is short"""
+
+    @abstractmethod
+    async def renew(self, order_id: str):
+        """Extend an order's hold before it is charged, taking the units again if the hold expired
+
+        Raises OutOfStockError, holding nothing, if any of them have been sold since.
+        """
+
+    @abstractmethod
+    async def commit(self, order_id: str) -> bool:
+        """Turn an order's held units into sold units; False if there was nothing to commit"""
+
+    @abstractmethod
+    async def release(self, order_id: str) -> bool:
+        """Return an order's held units to available stock; False if there was nothing to release"""
+
+    @abstractmethod
+    async def release_expired(self, now: Optional[datetime] = None, limit: int = RELEASE_BATCH_SIZE) -> int:
+        """Release reservations past their expiry and finish stalled transitions; returns how many"""
+
+    def _expires_at(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.reservation_ttl_seconds)
+
+
+class MongoInventoryStore(InventoryStore):
+    """Stock in the inventory collection, reservations in stock_reservations"""
+
+    def __init__(self, db, reservation_ttl_seconds: float = RESERVATION_TTL_SECONDS):
+        super().__init__(reservation_ttl_seconds)
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db.inventory
+
+    @property
+    def reservations(self):
+        return self.db.stock_reservations
+
+    async def ensure_indexes(self):
+        indexes = [
+            (self.collection, "sku", {"unique": True}),
+            (self.collection, "product_id", {}),
+            (self.reservations, "order_id", {"unique": True}),
+            (self.reservations, [("status", 1), ("expires_at", 1)], {}),
+            (self.reservations, "completed_at", {"expireAfterSeconds": RESERVATION_RETENTION_SECONDS}),
+        ]
+        for collection, keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error("Error creating inventory index %s: %s", keys, e)
+
+    @staticmethod
+    def _level(document: Dict) -> StockLevel:
+        return StockLevel(
+            product_id=document["product_id"], size=document["size"], color=document["color"],
+            available=document.get("available", 0), reserved=document.get("reserved", 0)
+        )
+
+    # ==================== STOCK LEVELS ====================
+
+    async def set_stock(self, product_id: str, size: str, color: str, quantity: int) -> StockLevel:
+        from pymongo import ReturnDocument
+
+        # Pipeline update so available is derived from the reserved count in the same write
+        document = await self.collection.find_one_and_update(
+            {"sku": sku_for(product_id, size, color)},
+            [{"$set": {
+                "product_id": product_id, "size": size, "color": color,
+                "reserved": {"$ifNull": ["$reserved", 0]},
+                "available": {"$subtract": [quantity, {"$ifNull": ["$reserved", 0]}]},
+                "updated_at": "$$NOW"
+            }}],
+            projection={"_id": 0, "holds": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return self._level(document)
+
+    async def adjust_stock(self, product_id: str, size: str, color: str, delta: int) -> Optional[StockLevel]:
+        from pymongo import ReturnDocument
+
+        document = await self.collection.find_one_and_update(
+            {"sku": sku_for(product_id, size, color), "available": {"$gte": -delta}},
+            {"$inc": {"available": delta}, "$currentDate": {"updated_at": True}},
+            projection={"_id": 0, "holds": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        return self._level(document) if document else None
+
+    async def stock(self, product_id: Optional[str] = None) -> List[StockLevel]:
+        query = {"product_id": product_id} if product_id else {}
+        documents = await self.collection.find(query, {"_id": 0, "holds": 0}).sort("sku", 1).to_list(None)
+        return [self._level(document) for document in documents]
+
+    # ==================== RESERVATIONS ====================
+
+    async def reserve(self, order_id: str, items: Iterable[OrderItem]):
+        from pymongo.errors import DuplicateKeyError
+
+        lines = reservation_lines(items)
+        now = datetime.now(timezone.utc)
+        try:
+            await self.reservations.insert_one({
+                "order_id": order_id, "lines": lines, "status": ReservationStatus.HELD.value,
+                "created_at": now, "updated_at": now, "expires_at": self._expires_at(now)
+            })
+        except DuplicateKeyError:
+            # Already reserved by an earlier attempt
+            return
+        await self._hold_lines(order_id, lines)
+
+    async def _hold_lines(self, order_id: str, lines: List[Dict]):
+        short: List[str] = []
+        for line in lines:
+            result = await self.collection.update_one(
+                {"sku": line["sku"], "available": {"$gte": line["quantity"]}, f"holds.{order_id}": {"$exists": False}},
+                {"$inc": {"available": -line["quantity"], "reserved": line["quantity"]},
+                 "$set": {f"holds.{order_id}": line["quantity"]}}
+            )
+            if result.modified_count:
+                continue
+            # Not matched: untracked, already held by this order, or short
+            document = await self.collection.find_one({"sku": line["sku"]}, {"_id": 0, f"holds.{order_id}": 1})
+            if document is not None and order_id not in document.get("holds", {}):
+                short.append(line["sku"])
+                break
+        if short:
+            await self.release(order_id)
+            raise OutOfStockError(short)
+
+    async def renew(self, order_id: str):
+        from pymongo import ReturnDocument
+
+        now = datetime.now(timezone.utc)
+        renewed = await self.reservations.find_one_and_update(
+            {"order_id": order_id, "status": ReservationStatus.HELD.value},
+            {"$set": {"updated_at": now, "expires_at": self._expires_at(now)}}
+        )
+        if renewed is not None:
+            return
+        # Expired and released: hold it again, then take the units back like a new reservation
+        reservation = await self.reservations.find_one_and_update(
+            {"order_id": order_id, "status": ReservationStatus.RELEASED.value},
+            {"$set": {"status": ReservationStatus.HELD.value, "updated_at": now, "expires_at": self._expires_at(now)},
+             "$unset": {"completed_at": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+        if reservation is not None:
+            await self._hold_lines(order_id, reservation["lines"])
+
+    async def _transition(self, order_id: str, from_statuses: List[str], status: ReservationStatus) -> Optional[Dict]:
+        from pymongo import ReturnDocument
+
+        return await self.reservations.find_one_and_update(
+            {"order_id": order_id, "status": {"$in": from_statuses}},
+            {"$set": {"status": status.value, "updated_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _finish(self, reservation: Dict, status: ReservationStatus):
+        now = datetime.now(timezone.utc)
+        await self.reservations.update_one(
+            {"order_id": reservation["order_id"]},
+            {"$set": {"status": status.value, "updated_at": now, "completed_at": now}}
+        )
+
+    async def commit(self, order_id: str) -> bool:
+        reservation = await self._transition(
+            order_id, [ReservationStatus.HELD.value, ReservationStatus.COMMITTING.value], ReservationStatus.COMMITTING
+        )
+        if reservation is None:
+            return await self._commit_late(order_id)
+        for line in reservation["lines"]:
+            await self.collection.update_one(
+                {"sku": line["sku"], f"holds.{order_id}": {"$exists": True}},
+                {"$inc": {"reserved": -line["quantity"]}, "$unset": {f"holds.{order_id}": ""}}
+            )
+        await self._finish(reservation, ReservationStatus.COMMITTED)
+        return True
+
+    async def _commit_late(self, order_id: str) -> bool:
+        # Released while the charge was in flight, after renew(): take the units again if they are still there
+        reservation = await self._transition(order_id, [ReservationStatus.RELEASED.value], ReservationStatus.COMMITTING)
+        if reservation is None:
+            return False
+        for line in reservation["lines"]:
+            result = await self.collection.update_one(
+                {"sku": line["sku"], "available": {"$gte": line["quantity"]}},
+                {"$inc": {"available": -line["quantity"]}}
+            )
+            if not result.matched_count and await self.collection.count_documents({"sku": line["sku"]}, limit=1):
+                logger.warning("Order %s was paid after its stock hold expired; %s is oversold", order_id, line['sku'])
+        await self._finish(reservation, ReservationStatus.COMMITTED)
+        return True
+
+    async def release(self, order_id: str) -> bool:
+        reservation = await self._transition(
+            order_id, [ReservationStatus.HELD.value, ReservationStatus.RELEASING.value], ReservationStatus.RELEASING
+        )
+        if reservation is None:
+            return False
+        await self._release_lines(reservation)
+        await self._finish(reservation, ReservationStatus.RELEASED)
+        return True
+
+    async def _release_lines(self, reservation: Dict):
+        order_id = reservation["order_id"]
+        for line in reservation["lines"]:
+            await self.collection.update_one(
+                {"sku": line["sku"], f"holds.{order_id}": {"$exists": True}},
+                {"$inc": {"available": line["quantity"], "reserved": -line["quantity"]},
+                 "$unset": {f"holds.{order_id}": ""}}
+            )
+
+    async def release_expired(self, now: Optional[datetime] = None, limit: int = RELEASE_BATCH_SIZE) -> int:
+        now = now or datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=STALE_TRANSITION_SECONDS)
+        query = {"$or": [
+            {"status": ReservationStatus.HELD.value, "expires_at": {"$lte": now}},
+            {"status": ReservationStatus.RELEASING.value, "updated_at": {"$lte": stale}},
+            {"status": ReservationStatus.COMMITTING.value, "updated_at": {"$lte": stale}},
+        ]}
+        candidates = await self.reservations.find(query, {"_id": 0, "order_id": 1, "status": 1}).limit(limit).to_list(limit)
+        processed = 0
+        for candidate in candidates:
+            if candidate["status"] == ReservationStatus.COMMITTING.value:
+                processed += await self.commit(candidate["order_id"])
+            else:
+                processed += await self.release(candidate["order_id"])
+        return processed
+
+
+class InMemoryInventoryStore(InventoryStore):
+    """Stock and reservations kept in process, for tests, benchmarks and offline runs
+
+    Every operation completes without awaiting, so each is atomic on the event loop.
+    """
+
+    def __init__(self, reservation_ttl_seconds: float = RESERVATION_TTL_SECONDS):
+        super().__init__(reservation_ttl_seconds)
+        self._stock: Dict[str, Dict] = {}
+        self._reservations: Dict[str, Dict] = {}
+
+    @staticmethod
+    def _level(document: Dict) -> StockLevel:
+        return StockLevel(
+            product_id=document["product_id"], size=document["size"], color=document["color"],
+            available=document["available"], reserved=document["reserved"]
+        )
+
+    async def set_stock(self, product_id: str, size: str, color: str, quantity: int) -> StockLevel:
+        document = self._stock.setdefault(sku_for(product_id, size, color), {
+            "product_id": product_id, "size": size, "color": color, "available": 0, "reserved": 0, "holds": {}
+        })
+        document["available"] = quantity - document["reserved"]
+        return self._level(document)
+
+    async def adjust_stock(self, product_id: str, size: str, color: str, delta: int) -> Optional[StockLevel]:
+        document = self._stock.get(sku_for(product_id, size, color))
+        if document is None or document["available"] + delta < 0:
+            return None
+        document["available"] += delta
+        return self._level(document)
+
+    async def stock(self, product_id: Optional[str] = None) -> List[StockLevel]:
+        return [
+            self._level(self._stock[sku]) for sku in sorted(self._stock)
+            if product_id is None or self._stock[sku]["product_id"] == product_id
+        ]
+
+    async def reserve(self, order_id: str, items: Iterable[OrderItem]):
+        if order_id in self._reservations:
+            return
+        lines = reservation_lines(items)
+        self._hold_lines(order_id, lines)
+        now = datetime.now(timezone.utc)
+        self._reservations[order_id] = {
+            "order_id": order_id, "lines": lines, "status": ReservationStatus.HELD.value,
+            "expires_at": self._expires_at(now)
+        }
+
+    def _hold_lines(self, order_id: str, lines: List[Dict]):
+        short = [
+            line["sku"] for line in lines
+            if line["sku"] in self._stock and self._stock[line["sku"]]["available"] < line["quantity"]
+        ]
+        if short:
+            raise OutOfStockError(short)
+        for line in lines:
+            document = self._stock.get(line["sku"])
+            if document is not None:
+                document["available"] -= line["quantity"]
+                document["reserved"] += line["quantity"]
+                document["holds"][order_id] = line["quantity"]
+
+    async def renew(self, order_id: str):
+        reservation = self._reservations.get(order_id)
+        if reservation is None or reservation["status"] == ReservationStatus.COMMITTED.value:
+            return
+        if reservation["status"] == ReservationStatus.RELEASED.value:
+            self._hold_lines(order_id, reservation["lines"])
+            reservation["status"] = ReservationStatus.HELD.value
+        reservation["expires_at"] = self._expires_at(datetime.now(timezone.utc))
+
+    def _holds(self, order_id: str, lines: List[Dict]) -> List[Tuple[Dict, int]]:
+        held = []
+        for line in lines:
+            document = self._stock.get(line["sku"])
+            if document is not None and order_id in document["holds"]:
+                held.append((document, document["holds"].pop(order_id)))
+        return held
+
+    async def commit(self, order_id: str) -> bool:
+        reservation = self._reservations.get(order_id)
+        if reservation is None or reservation["status"] == ReservationStatus.COMMITTED.value:
+            return False
+        if reservation["status"] == ReservationStatus.RELEASED.value:
+            for line in reservation["lines"]:
+                document = self._stock.get(line["sku"])
+                if document is None:
+                    continue
+                if document["available"] >= line["quantity"]:
+                    document["available"] -= line["quantity"]
+                else:
+                    logger.warning("Order %s was paid after its stock hold expired; %s is oversold", order_id, line['sku'])
+        for document, quantity in self._holds(order_id, reservation["lines"]):
+            document["reserved"] -= quantity
+        reservation["status"] = ReservationStatus.COMMITTED.value
+        return True
+
+    async def release(self, order_id: str) -> bool:
+        reservation = self._reservations.get(order_id)
+        if reservation is None or reservation["status"] != ReservationStatus.HELD.value:
+            return False
+        for document, quantity in self._holds(order_id, reservation["lines"]):
+            document["available"] += quantity
+            document["reserved"] -= quantity
+        reservation["status"] = ReservationStatus.RELEASED.value
+        return True
+
+    async def release_expired(self, now: Optional[datetime] = None, limit: int = RELEASE_BATCH_SIZE) -> int:
+        now = now or datetime.now(timezone.utc)
+        expired = [
+            order_id for order_id, reservation in self._reservations.items()
+            if reservation["status"] == ReservationStatus.HELD.value and reservation["expires_at"] <= now
+        ][:limit]
+        for order_id in expired:
+            await self.release(order_id)
+        return len(expired)
+
+
+class InventoryConsumer(OrderEventConsumer):
+    """Commits an order's stock once it is paid and releases it when the order is cancelled or deleted"""
+
+    name = "inventory"
+    event_types = {OrderEventType.STATUS_CHANGED.value, OrderEventType.DELETED.value}
+
+    def __init__(self, inventory: InventoryStore):
+        self.inventory = inventory
+
+    async def handle(self, event: Dict):
+        if event["type"] == OrderEventType.DELETED.value or event["status"] == OrderStatus.CANCELLED.value:
+            await self.inventory.release(event["order_id"])
+        elif event["status"] != OrderStatus.PENDING_PAYMENT.value:
+            await self.inventory.commit(event["order_id"])
+
+
+async def run_reservation_expiry(inventory: InventoryStore, interval: float):
+    """Release expired reservations every `interval` seconds"""
+    while True:
+        try:
+            released = await inventory.release_expired()
+            if released:
+                logger.info("Released stock held by %s expired reservations", released)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error releasing expired reservations: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,317 @@
+"""
+Invoices
+Print-ready HTML invoices rendered in a process pool and cached on disk
+
+An invoice is rendered from an Order through templates compiled once per process, in a
+ProcessPoolExecutor so a month of invoices does not hold the event loop or the GIL. Each
+rendered invoice is written to `directory`/<order id>/<updated_at>.html; as long as the
+order is unchanged, later downloads are served from that file as a static file, and a
+change to the order (a new updated_at) renders a new version. Older versions are removed
+by a later render once they have been superseded for a while, so a download that already
+resolved one can still send it.
+
+Invoices are HTML with print styles (A4 page, no screen chrome), which browsers print or
+save as PDF; there is no PDF renderer among the backend's dependencies.
+
+Bulk mode renders every paid order created in a month, in parallel, and streams them as
+a zip archive without building it in memory.
+"""
+
+import os
+import html
+import time
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from string import Template
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Union
+
+from models import Order, REVENUE_STATUSES
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+SELLER_NAME = "UNSEEN IL"
+
+# Invoices are only issued for paid orders
+INVOICE_STATUSES = REVENUE_STATUSES
+
+# Renders in flight per worker process during bulk runs, so the pool is never idle
+# waiting on the event loop and memory stays bounded
+BULK_RENDERS_PER_WORKER = 4
+
+# A superseded invoice version is kept this long after the next version was written,
+# for downloads that resolved it just before
+SUPERSEDED_INVOICE_SECONDS = 300
+
+INVOICE_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Invoice $invoice_number</title>
+<style>
+    @page { size: A4; margin: 18mm; }
+    body { font-family: Arial, sans-serif; color: #222; font-size: 13px; line-height: 1.5; margin: 0; }
+    .invoice { max-width: 780px; margin: 0 auto; padding: 24px; }
+    .header { display: flex; justify-content: space-between; border-bottom: 3px solid #D4AF37; padding-bottom: 16px; }
+    .header h1 { margin: 0; font-size: 28px; letter-spacing: 2px; }
+    .meta { text-align: right; }
+    .parties { display: flex; justify-content: space-between; margin: 24px 0; }
+    table { width: 100%; border-collapse: collapse; }
+    th { text-align: left; border-bottom: 2px solid #222; padding: 8px 4px; }
+    td { border-bottom: 1px solid #ddd; padding: 8px 4px; }
+    .number { text-align: right; white-space: nowrap; }
+    .totals { margin-left: auto; margin-top: 16px; width: 320px; }
+    .totals td { border: none; padding: 4px; }
+    .totals .grand td { border-top: 2px solid #222; font-size: 16px; font-weight: bold; }
+    .footer { margin-top: 40px; color: #666; font-size: 11px; text-align: center; }
+</style>
+</head>
+<body>
+<div class="invoice">
+    <div class="header">
+        <h1>$seller</h1>
+        <div class="meta">
+            <strong>Invoice $invoice_number</strong><br>
+            Order $order_number<br>
+            Order date: $order_date<br>
+            Status: $status
+        </div>
+    </div>
+    <div class="parties">
+        <div>
+            <strong>Bill to</strong><br>
+            $customer_name<br>
+            $customer_email<br>
+            $customer_phone
+        </div>
+        <div>
+            <strong>Ship to</strong><br>
+            $address<br>
+            $city $postal_code<br>
+            $country
+        </div>
+        <div>
+            <strong>Payment</strong><br>
+            $payment_method$card$transaction
+        </div>
+    </div>
+    <table>
+        <thead>
+            <tr><th>Item</th><th>Size</th><th>Color</th><th class="number">Qty</th><th class="number">Unit price</th><th class="number">Amount</th></tr>
+        </thead>
+        <tbody>
+$lines
+        </tbody>
+    </table>
+    <table class="totals">
+        <tr><td>Subtotal</td><td class="number">$subtotal</td></tr>
+$discount        <tr><td>Shipping ($shipping_method)</td><td class="number">$shipping_cost</td></tr>
+        <tr class="grand"><td>Total</td><td class="number">$total</td></tr>
+    </table>
+    <div class="footer">$seller &middot; Thank you for your order</div>
+</div>
+</body>
+</html>
+""")
+
+LINE_TEMPLATE = Template(
+    '            <tr><td>$name</td><td>$size</td><td>$color</td><td class="number">$quantity</td>'
+    '<td class="number">$price</td><td class="number">$amount</td></tr>'
+)
+
+DISCOUNT_TEMPLATE = Template(
+    '        <tr><td>Discount$code</td><td class="number">-$amount</td></tr>\n'
+)
+
+
+def _money(amount: float) -> str:
+    return f"&#8362;{amount:,.2f}"
+
+
+def invoice_number(order: Order) -> str:
+    return f"INV-{order.order_number.removeprefix('ORD-')}"
+
+
+def invoice_filename(order_number: str) -> str:
+    """Download name of an order's invoice"""
+    return f"invoice-{order_number.removeprefix('ORD-')}.html"
+
+
+def render_invoice(order: Order) -> str:
+    """Invoice HTML for an order"""
+    escape = html.escape
+    lines = "\n".join(
+        LINE_TEMPLATE.substitute(
+            name=escape(item.name),
+            size=escape(item.selected_size),
+            color=escape(item.selected_color),
+            quantity=item.quantity,
+            price=_money(item.price),
+            amount=_money(item.price * item.quantity)
+        )
+        for item in order.items
+    )
+    discount = ""
+    if order.discount_amount > 0:
+        code = f" ({escape(order.discount_code)})" if order.discount_code else ""
+        discount = DISCOUNT_TEMPLATE.substitute(code=code, amount=_money(order.discount_amount))
+    payment = order.payment_info
+    return INVOICE_TEMPLATE.substitute(
+        seller=SELLER_NAME,
+        invoice_number=invoice_number(order),
+        order_number=escape(order.order_number),
+        order_date=order.created_at.strftime('%d/%m/%Y'),
+        status=order.status.value.replace('_', ' ').title(),
+        customer_name=escape(f"{order.customer_info.first_name} {order.customer_info.last_name}"),
+        customer_email=escape(order.customer_info.email),
+        customer_phone=escape(order.customer_info.phone),
+        address=escape(order.shipping_address.address),
+        city=escape(order.shipping_address.city),
+        postal_code=escape(order.shipping_address.postal_code),
+        country=escape(order.shipping_address.country),
+        payment_method=escape(payment.payment_method.replace('_', ' ').title()),
+        card=f"<br>Card ending {escape(payment.card_last_four)}" if payment.card_last_four else "",
+        transaction=f"<br>Transaction {escape(order.payment_transaction_id)}" if order.payment_transaction_id else "",
+        lines=lines,
+        subtotal=_money(order.subtotal),
+        discount=discount,
+        shipping_method=order.shipping_method.value.title(),
+        shipping_cost=_money(order.shipping_cost),
+        total=_money(order.total)
+    )
+
+
+def _version(updated_at: Union[datetime, str]) -> str:
+    if isinstance(updated_at, str):
+        updated_at = datetime.fromisoformat(updated_at)
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return updated_at.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+
+
+def _write_invoice(document: Dict, path: str) -> str:
+    """Pool task: render a serialized order to `path` and remove long-superseded versions"""
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temporary = target.with_name(f".{uuid.uuid4().hex}.tmp")
+    temporary.write_text(render_invoice(Order.model_validate(document)), encoding="utf-8")
+    # Readers see either no file or the whole invoice
+    os.replace(temporary, target)
+    # Version names sort in updated_at order
+    versions = sorted(target.parent.glob("*.html"))
+    cutoff = time.time() - SUPERSEDED_INVOICE_SECONDS
+    for stale, newer in zip(versions, versions[1:]):
+        try:
+            superseded = newer.stat().st_mtime < cutoff
+        except FileNotFoundError:
+            continue
+        if superseded and stale != target:
+            stale.unlink(missing_ok=True)
+    return path
+
+
+class InvoiceRenderer:
+    """Renders invoices in a process pool into an on-disk cache"""
+
+    def __init__(self, directory: Path, workers: Optional[int] = None):
+        self.directory = Path(directory)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool: Optional['ProcessPoolExecutor'] = None
+        self._rendering: Dict[Path, asyncio.Future] = {}
+
+    @property
+    def pool(self) -> 'ProcessPoolExecutor':
+        # Started on first use; spawned rather than forked from a process running an event loop
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def path_for(self, order_id: str, updated_at: Union[datetime, str]) -> Path:
+        """Cache file of an order's invoice at one version"""
+        return self.directory / os.path.basename(order_id) / f"{_version(updated_at)}.html"
+
+    async def _render(self, document: Dict) -> Path:
+        path = self.path_for(document["id"], document["updated_at"])
+        if path.exists():
+            return path
+        # Concurrent requests for the same invoice share one render
+        future = self._rendering.get(path)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(loop.run_in_executor(self.pool, _write_invoice, document, str(path)))
+            self._rendering[path] = future
+            future.add_done_callback(lambda _: self._rendering.pop(path, None))
+        await asyncio.shield(future)
+        return path
+
+    async def invoice(self, order: Order) -> Path:
+        """Path of the order's current invoice, rendering it if it is not cached"""
+        return await self._render(order.model_dump(mode="json"))
+
+    async def zip_stream(self, documents: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+        """Invoices for serialized orders, rendered in parallel and streamed as a zip archive"""
+        import zipfile
+
+        loop = asyncio.get_running_loop()
+        output = _ZipOutput()
+        archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED)
+        pending = set()
+
+        def add(path: Path, name: str):
+            archive.write(path, name)
+
+        async def next_done():
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path, name = task.result()
+                await loop.run_in_executor(None, add, path, name)
+
+        async def render(document: Dict):
+            return await self._render(document), invoice_filename(document["order_number"])
+
+        try:
+            async for document in documents:
+                pending.add(asyncio.ensure_future(render(document)))
+                if len(pending) >= self.workers * BULK_RENDERS_PER_WORKER:
+                    await next_done()
+                    if output.buffer:
+                        yield output.take()
+            while pending:
+                await next_done()
+                if output.buffer:
+                    yield output.take()
+            await loop.run_in_executor(None, archive.close)
+            yield output.take()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class _ZipOutput:
+    """Write-only file for ZipFile; without tell() or seek() it writes a streamable archive"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Legacy Order Migration
+Rewrites orders stored by the retired OrderService in the current order schema and
+backfills the normalized customer_email and search_prefixes of older orders
+
+Usage (from backend/):
+    python migrate_orders.py --dry-run      # count convertible legacy orders
+    python migrate_orders.py                # convert them in place
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from order_repository import MongoOrderRepository, LEGACY_ORDER_QUERY
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def migrate(args: argparse.Namespace) -> int:
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        repository = MongoOrderRepository(client[args.db_name])
+        pending = await repository.collection.count_documents(LEGACY_ORDER_QUERY)
+        print(f"Legacy orders found: {pending}")
+        migrated = await repository.migrate_legacy_orders(batch_size=args.batch_size, dry_run=args.dry_run)
+        print(f"{'Would migrate' if args.dry_run else 'Migrated'}: {migrated}")
+        if not args.dry_run:
+            backfilled = await repository.backfill_customer_emails()
+            print(f"Backfilled customer emails: {backfilled}")
+            backfilled = await repository.backfill_search_prefixes(batch_size=args.batch_size)
+            print(f"Backfilled search prefixes: {backfilled}")
+            await repository.ensure_indexes()
+        return 0 if migrated == pending else 1
+    finally:
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Convert legacy OrderService documents to the current order schema")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'unseen'))
+    parser.add_argument('--batch-size', type=int, default=1000, help="documents per bulk write (default 1,000)")
+    parser.add_argument('--dry-run', action='store_true', help="convert and validate without writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(migrate(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
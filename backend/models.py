@@ -1,79 +1,102 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
+import uuid
 
 # Order Status Enum
 class OrderStatus(str, Enum):
     PENDING_PAYMENT = "pending_payment"
-    PAYMENT_RECEIVED = "payment_received"
+    PAYMENT_CONFIRMED = "payment_confirmed"
     PROCESSING = "processing"
     SHIPPED = "shipped"
     DELIVERED = "delivered"
     CANCELLED = "cancelled"
 
-# Product Item in Order
+# Statuses that count towards revenue
+REVENUE_STATUSES = [
+    OrderStatus.PAYMENT_CONFIRMED.value,
+    OrderStatus.PROCESSING.value,
+    OrderStatus.SHIPPED.value,
+    OrderStatus.DELIVERED.value
+]
+
+class ShippingMethod(str, Enum):
+    STANDARD = "standard"
+    EXPRESS = "express"
+
+# Order Item Model
 class OrderItem(BaseModel):
     product_id: str
-    product_name: str
+    name: str
     price: float
     quantity: int
-    size: str
-    color: str
+    selected_size: str
+    selected_color: str
     image: Optional[str] = None
 
-# Customer Information
+# Customer Information Model
 class CustomerInfo(BaseModel):
     first_name: str
     last_name: str
     email: EmailStr
     phone: str
+
+# Shipping Address Model
+class ShippingAddress(BaseModel):
     address: str
     city: str
     postal_code: str
     country: str = "Israel"
 
-# Order Model
-class Order(BaseModel):
-    id: Optional[str] = None
-    order_number: Optional[str] = None
-    customer: CustomerInfo
+# Payment Information Model (for mock)
+class PaymentInfo(BaseModel):
+    card_last_four: str
+    card_name: str
+    payment_method: str = "credit_card"
+
+# Order Create Model
+class OrderCreate(BaseModel):
+    customer_info: CustomerInfo
+    shipping_address: ShippingAddress
     items: List[OrderItem]
-    subtotal: float
+    shipping_method: ShippingMethod
     shipping_cost: float
+    subtotal: float
     total: float
-    status: OrderStatus = OrderStatus.PENDING_PAYMENT
-    payment_method: str = "HYP"
-    payment_status: str = "pending"
-    payment_transaction_id: Optional[str] = None
-    shipping_method: str = "standard"
-    tracking_number: Optional[str] = None
-    notes: Optional[str] = None
-    created_at: Optional[datetime] = None
-    updated_at: Optional[datetime] = None
+    payment_info: PaymentInfo
+    discount_code: Optional[str] = None
+    discount_amount: float = 0
 
-# Order Create Request
-class OrderCreate(BaseModel):
-    customer: CustomerInfo
+# Order Response Model
+class Order(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    order_number: str = Field(default_factory=lambda: f"ORD-{uuid.uuid4().hex[:8].upper()}")
+    customer_info: CustomerInfo
+    shipping_address: ShippingAddress
     items: List[OrderItem]
-    subtotal: float
+    shipping_method: ShippingMethod
     shipping_cost: float
+    subtotal: float
     total: float
-    shipping_method: str = "standard"
+    payment_info: PaymentInfo
+    discount_code: Optional[str] = None
+    discount_amount: float = 0
+    status: OrderStatus = OrderStatus.PENDING_PAYMENT
+    payment_transaction_id: Optional[str] = None
+    tracking_number: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     notes: Optional[str] = None
 
-# Order Update Request
+# Order Update Model
 class OrderUpdate(BaseModel):
     status: Optional[OrderStatus] = None
-    payment_status: Optional[str] = None
+    notes: Optional[str] = None
     payment_transaction_id: Optional[str] = None
     tracking_number: Optional[str] = None
-    notes: Optional[str] = None
-
-# Admin User Model
-class AdminUser(BaseModel):
-    username: str
-    password: str
 
 # Order Statistics
 class OrderStats(BaseModel):
@@ -82,3 +105,85 @@ class OrderStats(BaseModel):
     total_revenue: float
     today_orders: int
     today_revenue: float
+
+# Customer-facing order summary (order history)
+class OrderSummary(BaseModel):
+    id: str
+    order_number: str
+    status: OrderStatus
+    total: float
+    item_count: int
+    tracking_number: Optional[str] = None
+    created_at: datetime
+
+# One page of a customer's order history; pass next_cursor to get the next page
+class OrderHistoryPage(BaseModel):
+    orders: List[OrderSummary]
+    next_cursor: Optional[str] = None
+
+# Sales per time bucket (admin analytics)
+class SalesBucket(BaseModel):
+    start: datetime
+    orders: int
+    revenue: float
+    units: int
+
+class SalesTimeseries(BaseModel):
+    granularity: str
+    timezone: str
+    start: datetime
+    end: datetime
+    buckets: List[SalesBucket]
+    # Set when the range reaches back past the archive cutoff: delivered and cancelled
+    # orders created before it are archived and not counted
+    archived_before: Optional[datetime] = None
+
+# Stock of one SKU (product, size and color)
+class StockLevel(BaseModel):
+    product_id: str
+    size: str
+    color: str
+    available: int
+    reserved: int
+
+# ==================== STORAGE HELPERS ====================
+
+def normalize_email(email: str) -> str:
+    """Lowercase and trim an email address so it can be used as a unique key"""
+    return email.strip().lower()
+
+# Helper function to serialize datetime for MongoDB
+def serialize_for_mongo(data: dict) -> dict:
+    """Convert datetime objects to ISO strings for MongoDB storage"""
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.isoformat()
+        elif isinstance(value, dict):
+            data[key] = serialize_for_mongo(value)
+        elif isinstance(value, list):
+            data[key] = [serialize_for_mongo(item) if isinstance(item, dict) else item for item in value]
+    return data
+
+# Helper function to deserialize from MongoDB
+def deserialize_from_mongo(data: dict) -> dict:
+    """Convert ISO string timestamps back to datetime objects"""
+    for key, value in data.items():
+        if key in ['created_at', 'updated_at', 'timestamp'] and isinstance(value, str):
+            try:
+                data[key] = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        elif isinstance(value, dict):
+            data[key] = deserialize_from_mongo(value)
+        elif isinstance(value, list):
+            data[key] = [deserialize_from_mongo(item) if isinstance(item, dict) else item for item in value]
+    return data
+
+def order_document(order: Order) -> dict:
+    """Order as stored, with the normalized customer email and search prefixes used for lookups"""
+    from order_search import search_prefixes
+
+    document = serialize_for_mongo(order.model_dump())
+    document["customer_email"] = normalize_email(order.customer_info.email)
+    document["search_prefixes"] = search_prefixes(document)
+    return document
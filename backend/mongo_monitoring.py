@@ -0,0 +1,144 @@
+"""
+MongoDB Command Monitoring
+PyMongo command and connection pool listeners feeding the metrics registry and the tracer
+
+Kept apart from metrics and tracing so those modules do not import the driver; this
+module is only loaded when the database client is created.
+"""
+
+import threading
+import time
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+from metrics import (
+    MONGO_COMMAND_LATENCY, MONGO_COMMAND_FAILURES, MONGO_POOL_WAIT,
+    MONGO_POOL_CHECKOUT_FAILURES, MONGO_POOL_CONNECTIONS, MONGO_POOL_CHECKED_OUT
+)
+from tracing import Span, Tracer, _current_span
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo command listener recording command latency per collection"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, object], str] = {}
+
+    @staticmethod
+    def _collection_name(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get(event.command_name)
+        if isinstance(target, str):
+            return target
+        # getMore carries the cursor id under the command name
+        return event.command.get("collection", "")
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self._pending[(event.request_id, event.connection_id)] = self._collection_name(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection = self._pending.pop((event.request_id, event.connection_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._pending.pop((event.request_id, event.connection_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+
+class MongoTracingListener(monitoring.CommandListener):
+    """PyMongo command listener recording a span per Mongo command
+
+    Motor runs commands on its executor with a copy of the caller's context, so the
+    current span of the request issuing the command is visible here.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._pending: Dict[tuple, Span] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self._pending[(event.request_id, event.connection_id)] = Span(
+            f"mongodb.{event.command_name}", parent.trace_id, parent.span_id,
+            {"db.collection": collection, "db.name": event.database_name}
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        span = self._pending.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            self.tracer._finish(span)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        span = self._pending.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            span.set_error(event.failure)
+            self.tracer._finish(span)
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """PyMongo pool listener recording checkout wait time and pool occupancy
+
+    A checkout runs start to finish on the thread issuing the command (one of Motor's
+    executor threads), so the start time is kept per thread and address.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _checkout_starts(self) -> Dict[Tuple[str, int], float]:
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = {}
+        return starts
+
+    def connection_check_out_started(self, event):
+        self._checkout_starts()[event.address] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        start = self._checkout_starts().pop(event.address, None)
+        address = _address(event)
+        if start is not None:
+            MONGO_POOL_WAIT.labels(address).observe(time.perf_counter() - start)
+        MONGO_POOL_CHECKED_OUT.labels(address).inc()
+
+    def connection_check_out_failed(self, event):
+        start = self._checkout_starts().pop(event.address, None)
+        address = _address(event)
+        if start is not None:
+            MONGO_POOL_WAIT.labels(address).observe(time.perf_counter() - start)
+        MONGO_POOL_CHECKOUT_FAILURES.labels(address, str(event.reason)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(_address(event)).dec()
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(_address(event)).inc()
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(_address(event)).dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
@@ -0,0 +1,303 @@
+"""
+Order Archive
+Cold storage for old delivered and cancelled orders, and the job that moves them there
+
+Orders in a final status that were created more than a few months ago are rarely read,
+yet they stay in the orders collection and every one of its indexes. OrderArchiver copies
+them in batches to an OrderArchive and then removes them from the hot collection, so the
+indexes the storefront and admin use stay small enough to be served from memory. Lookups
+by id or order number fall back to the archive (see OrderRepository.get_by_id).
+
+MongoOrderArchive keeps archived orders in orders_archive. FileOrderArchive writes
+gzip-compressed JSONL files partitioned by creation date (YYYY/MM/DD.jsonl.gz) with an
+SQLite index of order id and number to partition, for deployments that would rather keep
+old orders out of MongoDB altogether.
+
+Orders are copied before they are removed, and removed only if unchanged since they were
+read, so an interrupted or racing run never loses an order; at worst it is archived twice,
+and lookups prefer the hot collection and then the latest archived copy. Range scans by
+creation date (OrderRepository.created_between, behind the monthly invoice export) cover
+the archive too; the aggregate analytics only see the hot collection.
+"""
+
+import json
+import gzip
+import time
+import fcntl
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from models import OrderStatus
+from metrics import ORDERS_ARCHIVED
+
+logger = logging.getLogger(__name__)
+
+# Only orders in these statuses are archived
+ARCHIVE_STATUSES = [OrderStatus.DELIVERED.value, OrderStatus.CANCELLED.value]
+
+# Orders created more than this long ago are archived
+ARCHIVE_AFTER_DAYS = 180
+
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_MAX_BATCHES = 50
+ARCHIVE_INTERVAL_SECONDS = 3600
+
+
+class OrderArchive(ABC):
+    """Archived order documents, in their serialized form"""
+
+    async def ensure_indexes(self):
+        """Create the indexes lookups rely on"""
+
+    @abstractmethod
+    async def store(self, documents: List[Dict]):
+        """Archive orders; storing an order again replaces the earlier copy"""
+
+    @abstractmethod
+    async def get_by_id(self, order_id: str) -> Optional[Dict]:
+        """Archived order by id"""
+
+    @abstractmethod
+    async def get_by_number(self, order_number: str) -> Optional[Dict]:
+        """Archived order by order number"""
+
+    @abstractmethod
+    def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Latest copy of each order created in [start, end), oldest first, optionally only in `statuses`"""
+
+
+class MongoOrderArchive(OrderArchive):
+    """Archive in the orders_archive collection, indexed only for lookups"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db.orders_archive
+
+    async def ensure_indexes(self):
+        for keys, options in (("id", {"unique": True}), ("order_number", {}), ("created_at", {})):
+            try:
+                await self.collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error("Error creating order archive index %s: %s", keys, e)
+
+    async def store(self, documents: List[Dict]):
+        from pymongo import ReplaceOne
+
+        if documents:
+            await self.collection.bulk_write(
+                [ReplaceOne({"id": document["id"]}, document, upsert=True) for document in documents],
+                ordered=False
+            )
+
+    async def get_by_id(self, order_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": order_id}, {"_id": 0})
+
+    async def get_by_number(self, order_number: str) -> Optional[Dict]:
+        return await self.collection.find_one({"order_number": order_number}, {"_id": 0})
+
+    async def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        query: Dict = {"created_at": {
+            "$gte": start.astimezone(timezone.utc).isoformat(), "$lt": end.astimezone(timezone.utc).isoformat()
+        }}
+        if statuses:
+            query["status"] = {"$in": statuses}
+        async for document in self.collection.find(query, {"_id": 0}).sort("created_at", 1):
+            yield document
+
+
+class FileOrderArchive(OrderArchive):
+    """Archive in gzip JSONL files under `directory`, one per creation day
+
+    Each batch is appended to its partitions as a new gzip member, which gzip readers
+    treat as one continuous stream. File and index access runs in the default executor,
+    under a lock on `directory` that archive_orders.py and the app's own archiver share,
+    so a reader never sees a half-written member.
+    """
+
+    INDEX_FILE = "index.sqlite3"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.directory / self.INDEX_FILE)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS orders (id TEXT PRIMARY KEY, order_number TEXT, partition TEXT NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS orders_by_number ON orders (order_number)")
+        return connection
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """Hold this process's lock and a shared (or exclusive) lock on the directory's lock file"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / self.LOCK_FILE, "a") as lock_file:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+
+    @staticmethod
+    def partition(document: Dict) -> str:
+        """Relative path of the file holding an order, from its creation date"""
+        created = str(document.get("created_at") or "")[:10]
+        try:
+            day = datetime.strptime(created, "%Y-%m-%d")
+        except ValueError:
+            return "undated.jsonl.gz"
+        return f"{day:%Y/%m/%d}.jsonl.gz"
+
+    def _store(self, documents: List[Dict]):
+        partitions: Dict[str, List[Dict]] = {}
+        for document in documents:
+            partitions.setdefault(self.partition(document), []).append(document)
+        with self._locked(exclusive=True):
+            for partition, batch in partitions.items():
+                path = self.directory / partition
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with gzip.open(path, "at", encoding="utf-8") as archive_file:
+                    for document in batch:
+                        archive_file.write(json.dumps(document, default=str, ensure_ascii=False) + "\n")
+            # The index is written last, so it never points at an order that is not on disk
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO orders (id, order_number, partition) VALUES (?, ?, ?)",
+                    [
+                        (document["id"], document.get("order_number"), partition)
+                        for partition, batch in partitions.items() for document in batch
+                    ]
+                )
+            connection.close()
+
+    def _find(self, column: str, value: str) -> Optional[Dict]:
+        with self._locked():
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    f"SELECT id, partition FROM orders WHERE {column} = ? ORDER BY rowid DESC LIMIT 1", (value,)
+                ).fetchone()
+            finally:
+                connection.close()
+            if row is None:
+                return None
+            order_id, partition = row
+            found = None
+            with gzip.open(self.directory / partition, "rt", encoding="utf-8") as archive_file:
+                for line in archive_file:
+                    # Only parse lines that can be the order; the last copy written wins
+                    if order_id in line:
+                        document = json.loads(line)
+                        if document.get("id") == order_id:
+                            found = document
+        return found
+
+    def _read_partition(self, partition: str, start: str, end: str, statuses: Optional[List[str]]) -> List[Dict]:
+        path = self.directory / partition
+        if not path.exists():
+            return []
+        with self._locked():
+            with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+                documents = [json.loads(line) for line in archive_file]
+        # Later copies of an order replace earlier ones
+        latest = {document["id"]: document for document in documents}
+        return sorted(
+            (
+                document for document in latest.values()
+                if start <= document.get("created_at", "") < end and (not statuses or document.get("status") in statuses)
+            ),
+            key=lambda document: document["created_at"]
+        )
+
+    async def store(self, documents: List[Dict]):
+        if documents:
+            await asyncio.get_running_loop().run_in_executor(None, self._store, documents)
+
+    async def get_by_id(self, order_id: str) -> Optional[Dict]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._find, "id", order_id)
+
+    async def get_by_number(self, order_number: str) -> Optional[Dict]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._find, "order_number", order_number)
+
+    async def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Read one day's partition at a time"""
+        start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+        loop = asyncio.get_running_loop()
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < end:
+            partition = self.partition({"created_at": day.isoformat()})
+            for document in await loop.run_in_executor(
+                None, self._read_partition, partition, start.isoformat(), end.isoformat(), statuses
+            ):
+                yield document
+            day += timedelta(days=1)
+
+
+class OrderArchiver:
+    """Moves old delivered and cancelled orders from the order repository to an archive"""
+
+    def __init__(
+        self,
+        orders,
+        archive: OrderArchive,
+        after_days: float = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        max_batches: int = ARCHIVE_MAX_BATCHES
+    ):
+        self.orders = orders
+        self.archive = archive
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.last_report: Optional[Dict] = None
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """Archive up to max_batches batches; returns the counts processed"""
+        started = time.perf_counter()
+        created_before = (now or datetime.now(timezone.utc)) - timedelta(days=self.after_days)
+        report = {"archived": 0, "skipped": 0, "batches": 0, "created_before": created_before.isoformat()}
+        while report["batches"] < self.max_batches:
+            documents = await self.orders.archivable(created_before, ARCHIVE_STATUSES, limit=self.batch_size)
+            if not documents:
+                break
+            await self.archive.store(documents)
+            removed = await self.orders.remove_archived(documents)
+            report["batches"] += 1
+            report["archived"] += removed
+            # Changed since they were read; archived again on a later batch or run
+            report["skipped"] += len(documents) - removed
+            if not removed or len(documents) < self.batch_size:
+                break
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        ORDERS_ARCHIVED.labels().inc(report["archived"])
+        self.last_report = report
+        return report
+
+    async def run(self, interval: float = ARCHIVE_INTERVAL_SECONDS):
+        """Archive every `interval` seconds"""
+        while True:
+            try:
+                report = await self.run_once()
+                if report["archived"] or report["skipped"]:
+                    logger.info(
+                        "Archived %s orders created before %s in %s batches (%s changed meanwhile, %ss)",
+                        report['archived'], report['created_before'], report['batches'], report['skipped'],
+                        report['seconds']
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error archiving orders: %s", e)
+            await asyncio.sleep(interval)
@@ -0,0 +1,74 @@
+"""
+Order Response Cache
+Serialized order lookups with ETags, so polling order confirmation pages are cheap
+
+Confirmation pages poll GET /api/orders/{order_id} and /api/orders/number/{order_number}
+after checkout. Each worker keeps the JSON body of recently requested orders in an LRU
+LocalCache keyed by order id, with an ETag derived from the order's id and updated_at.
+A hit is served without touching MongoDB or pydantic, and a client sending the current
+ETag in If-None-Match gets 304 with no body.
+
+Every order write goes through the order repository, which reports the ids it changed
+(OrderRepository.on_change); those entries are dropped in every worker through the
+cache invalidation bus. Entries also expire after a TTL, which bounds staleness for
+writes made outside the application.
+"""
+
+import hashlib
+from typing import Awaitable, Callable, Optional, Tuple
+
+from cache import LocalCache
+from models import Order
+
+# Order numbers never change, so the number -> id map only needs bounding
+ORDER_NUMBER_TTL_SECONDS = 24 * 3600
+
+
+def order_etag(order: Order) -> str:
+    """Strong ETag for an order's current version"""
+    version = f"{order.id}:{order.updated_at.isoformat()}".encode()
+    return f'"{hashlib.blake2b(version, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 specifies for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+class OrderResponseCache:
+    """Per-worker (ETag, JSON body) of orders by id, plus order number -> id"""
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10_000):
+        self.responses = LocalCache("order_responses", ttl_seconds, max_entries)
+        self.numbers = LocalCache("order_numbers", ORDER_NUMBER_TTL_SECONDS, max_entries)
+
+    async def _load(self, loader: Callable[[], Awaitable[Optional[Order]]]):
+        generation = self.responses.generation
+        order = await loader()
+        if order is None:
+            return None
+        entry = (order_etag(order), order.model_dump_json().encode())
+        # Not stored if the order changed while it was being loaded
+        if generation == self.responses.generation:
+            self.responses.set(order.id, entry)
+            self.numbers.set(order.order_number, order.id)
+        return entry
+
+    async def get(self, order_id: str, loader: Callable[[], Awaitable[Optional[Order]]]) -> Optional[Tuple[str, bytes]]:
+        """(ETag, body) of an order by id, loading it on a miss; None if it does not exist"""
+        entry = self.responses.get(order_id)
+        return entry if entry is not None else await self._load(loader)
+
+    async def get_by_number(self, order_number: str,
+                            loader: Callable[[], Awaitable[Optional[Order]]]) -> Optional[Tuple[str, bytes]]:
+        """(ETag, body) of an order by order number, loading it on a miss"""
+        order_id = self.numbers.get(order_number)
+        entry = self.responses.get(order_id) if order_id is not None else None
+        return entry if entry is not None else await self._load(loader)
+
+    def __len__(self) -> int:
+        return len(self.responses)
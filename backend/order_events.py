@@ -0,0 +1,606 @@
+"""
+Order Events
+Outbox of order changes and the dispatcher that delivers them to side-effect consumers
+
+Order writes append an event (order.created, order.status_changed, order.updated,
+order.deleted) to an outbox next to the order itself; on a replica set both writes share
+a transaction. Handlers therefore only write the order and return, and emails, rollups
+and webhooks run from OrderEventDispatcher in the background.
+
+Each event records the consumers that still have to process it. A consumer claims an
+event with a short lease, handles it and acknowledges it, so every consumer keeps its own
+position in the stream, survives restarts and can run in several workers at once.
+Delivery is at least once: a consumer that fails is retried with backoff, up to
+MAX_ATTEMPTS times. Order is best effort: events are claimed oldest first, but the
+events after a failed one are not held back while it waits for its retry.
+
+OrderEventStore.tail() follows the stream without claiming anything, for live feeds that
+every worker needs to see (see order_stream.py).
+"""
+
+import uuid
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Awaitable, Dict, Iterable, List, Optional, Set
+
+from models import Order, OrderStatus, REVENUE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# A claimed event is redelivered if not acknowledged within this time
+LEASE_SECONDS = 60
+
+# Failed deliveries are retried after RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+RETRY_BACKOFF_SECONDS = 5
+MAX_ATTEMPTS = 5
+
+# Fully delivered events are kept this long; TTL index on completed_at
+EVENT_RETENTION_SECONDS = 7 * 24 * 3600
+
+CLAIM_BATCH_SIZE = 100
+
+# Backlogs are counted up to this many events, so a large one stays cheap to report
+BACKLOG_COUNT_LIMIT = 10_000
+
+# Tailing by polling re-reads this far back, so events committed out of order are not missed
+TAIL_LOOKBACK_SECONDS = 5
+
+# Fields of an event as seen by consumers outside the app (webhooks)
+EVENT_FIELDS = ("id", "type", "order_id", "order_number", "status", "previous_status", "changes", "order", "occurred_at")
+
+
+class OrderEventType(str, Enum):
+    CREATED = "order.created"
+    STATUS_CHANGED = "order.status_changed"
+    UPDATED = "order.updated"
+    DELETED = "order.deleted"
+
+
+def build_event(
+    event_type: OrderEventType,
+    document: Dict,
+    changes: Optional[Dict[str, Any]] = None,
+    previous_status: Optional[str] = None
+) -> Dict:
+    """Event for a stored (serialized) order document"""
+    snapshot = {key: value for key, value in document.items() if key not in ("_id", "search_prefixes")}
+    return {
+        "id": str(uuid.uuid4()),
+        "type": event_type.value,
+        "order_id": snapshot["id"],
+        "order_number": snapshot.get("order_number"),
+        "status": snapshot.get("status"),
+        "previous_status": previous_status,
+        "changes": changes or {},
+        "order": snapshot,
+        "occurred_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def public_event(event: Dict) -> Dict:
+    """Event without the outbox delivery state"""
+    return {key: event[key] for key in EVENT_FIELDS}
+
+
+def events_for_update(before: Dict, fields: Dict[str, Any]) -> Dict:
+    """order.status_changed if the update moves the order to another status, else order.updated"""
+    after = {**before, **fields}
+    if "status" in fields and fields["status"] != before.get("status"):
+        return build_event(OrderEventType.STATUS_CHANGED, after, fields, previous_status=before.get("status"))
+    return build_event(OrderEventType.UPDATED, after, fields)
+
+
+# ==================== CONSUMERS ====================
+
+class OrderEventConsumer(ABC):
+    """Side effect run for order events
+
+    `name` identifies the consumer's delivery state, so it must stay stable across
+    deployments; `event_types` limits which events it receives (None for all).
+    """
+
+    name: str = ""
+    event_types: Optional[Set[str]] = None
+
+    @abstractmethod
+    async def handle(self, event: Dict):
+        """Process one event; raising schedules a retry"""
+
+
+class OrderConfirmationEmailConsumer(OrderEventConsumer):
+    """Sends the order confirmation email for new orders"""
+
+    name = "confirmation_email"
+    event_types = {OrderEventType.CREATED.value}
+
+    def __init__(self, send: Callable[[Order], Awaitable[bool]]):
+        self.send = send
+
+    async def handle(self, event: Dict):
+        if not await self.send(Order.model_validate(event["order"])):
+            raise RuntimeError(f"Order confirmation email for {event['order_number']} was not sent")
+
+
+class ShippingNotificationConsumer(OrderEventConsumer):
+    """Tells the customer their order has shipped"""
+
+    name = "shipping_notification"
+    event_types = {OrderEventType.STATUS_CHANGED.value}
+
+    def __init__(self, email_service):
+        self.email_service = email_service
+
+    async def handle(self, event: Dict):
+        if event["status"] == OrderStatus.SHIPPED.value:
+            await self.email_service.send_shipping_notification(Order.model_validate(event["order"]))
+
+
+class OrderRollupConsumer(OrderEventConsumer):
+    """Daily order and revenue totals in the order_daily_rollups collection
+
+    Days are the UTC date the order was created. Each event is recorded in
+    order_rollup_events (one small document per event, expired by a TTL index) before it
+    is counted, so a redelivered event is not counted twice; if the count then fails, the
+    record is removed again so the retry counts it.
+    """
+
+    name = "daily_rollups"
+    event_types = {OrderEventType.CREATED.value, OrderEventType.STATUS_CHANGED.value}
+
+    def __init__(self, db):
+        self.db = db
+
+    async def ensure_indexes(self):
+        try:
+            await self.db.order_rollup_events.create_index("applied_at", expireAfterSeconds=EVENT_RETENTION_SECONDS)
+        except Exception as e:
+            logger.error("Error creating order rollup index: %s", e)
+
+    def _increments(self, event: Dict) -> Dict[str, float]:
+        increments: Dict[str, float] = {}
+        if event["type"] == OrderEventType.CREATED.value:
+            increments["orders"] = 1
+        paid_before = event["previous_status"] in REVENUE_STATUSES
+        paid_after = event["status"] in REVENUE_STATUSES
+        if paid_after != paid_before:
+            sign = 1 if paid_after else -1
+            increments["paid_orders"] = sign
+            increments["revenue"] = sign * event["order"].get("total", 0)
+        return increments
+
+    async def handle(self, event: Dict):
+        from pymongo.errors import DuplicateKeyError
+
+        increments = self._increments(event)
+        if not increments:
+            return
+        try:
+            await self.db.order_rollup_events.insert_one({"_id": event["id"], "applied_at": datetime.now(timezone.utc)})
+        except DuplicateKeyError:
+            # Already counted
+            return
+        day = event["order"]["created_at"][:10]
+        try:
+            await self.db.order_daily_rollups.update_one({"_id": day}, {"$inc": increments}, upsert=True)
+        except Exception:
+            await self.db.order_rollup_events.delete_one({"_id": event["id"]})
+            raise
+
+
+class WebhookConsumer(OrderEventConsumer):
+    """POSTs every order event as JSON to a URL"""
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"webhook:{url}"
+
+    def _post(self, event: Dict):
+        import requests
+
+        response = requests.post(self.url, json=public_event(event), timeout=self.timeout)
+        response.raise_for_status()
+
+    async def handle(self, event: Dict):
+        await asyncio.get_running_loop().run_in_executor(None, self._post, event)
+
+
+# ==================== EVENT STORES ====================
+
+class OrderEventStore(ABC):
+    """Outbox of order events with per-consumer delivery state"""
+
+    def __init__(self):
+        self.subscriptions: Dict[str, Optional[Set[str]]] = {}
+
+    def subscribe(self, consumer: OrderEventConsumer):
+        """Deliver events appended from now on to the consumer"""
+        self.subscriptions[consumer.name] = consumer.event_types
+
+    def _recipients(self, event: Dict) -> List[str]:
+        return [
+            name for name, event_types in self.subscriptions.items()
+            if event_types is None or event["type"] in event_types
+        ]
+
+    async def ensure_indexes(self):
+        """Create the indexes claims rely on"""
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Session under which an order write and its events commit together, if supported"""
+        yield None
+
+    @abstractmethod
+    async def append(self, events: List[Dict], session=None):
+        """Record events for delivery"""
+
+    @abstractmethod
+    async def claim(self, consumer: str, limit: int = CLAIM_BATCH_SIZE) -> List[Dict]:
+        """Lease the oldest events the consumer has not processed yet"""
+
+    @abstractmethod
+    async def ack(self, consumer: str, event_id: str):
+        """Mark an event as processed by the consumer"""
+
+    @abstractmethod
+    async def fail(self, consumer: str, event: Dict, error: str):
+        """Schedule a retry, or give up after MAX_ATTEMPTS"""
+
+    @abstractmethod
+    async def release(self, consumer: str, event_ids: List[str]):
+        """Drop the consumer's leases on claimed events it did not try, so they can be claimed again"""
+
+    @abstractmethod
+    async def backlog(self, consumer: str, limit: int = BACKLOG_COUNT_LIMIT) -> int:
+        """Events the consumer has not processed yet, counted up to `limit`"""
+
+    @abstractmethod
+    def tail(self, poll_interval: float = 1.0) -> AsyncIterator[Dict]:
+        """Every event appended from now on, by any worker, without delivery state"""
+
+    async def wait(self, timeout: float):
+        """Return when new events may be available, or after `timeout` seconds"""
+        await asyncio.sleep(timeout)
+
+    async def close(self):
+        """Stop any background watcher"""
+
+
+def _retry_at(attempts: int) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+class MongoOrderEventStore(OrderEventStore):
+    """Outbox in the order_events collection
+
+    Appends share the order write's transaction on replica sets and sharded clusters;
+    on a standalone server the event is written right after the order. A change stream
+    on the collection wakes the dispatcher as soon as an event is appended; without
+    change stream support the dispatcher polls.
+
+    Events no consumer subscribes to are still stored, already completed, so tail() sees
+    every change; the TTL index removes them with the rest.
+    """
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self._supports_transactions: Optional[bool] = None
+        self._appended = asyncio.Event()
+        self._watcher: Optional[asyncio.Task] = None
+        self._watch_supported = True
+
+    @property
+    def collection(self):
+        return self.db.order_events
+
+    async def ensure_indexes(self):
+        indexes = [
+            ("id", {"unique": True}),
+            ([("pending", 1), ("occurred_at", 1)], {}),
+            # tail() when change streams are not available
+            ("occurred_at", {}),
+            ("completed_at", {"expireAfterSeconds": EVENT_RETENTION_SECONDS}),
+        ]
+        for keys, options in indexes:
+            try:
+                await self.collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error("Error creating order event index %s: %s", keys, e)
+
+    async def supports_transactions(self) -> bool:
+        if self._supports_transactions is None:
+            try:
+                hello = await self.db.client.admin.command("hello")
+                self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+            except Exception as e:
+                logger.error("Error checking MongoDB transaction support: %s", e)
+                return False
+            if not self._supports_transactions:
+                logger.info("MongoDB is standalone; order events are written after the order, outside a transaction")
+        return self._supports_transactions
+
+    @asynccontextmanager
+    async def transaction(self):
+        if not await self.supports_transactions():
+            yield None
+            return
+        async with await self.db.client.start_session() as session:
+            async with session.start_transaction():
+                yield session
+
+    async def append(self, events: List[Dict], session=None):
+        documents = []
+        for event in events:
+            pending = self._recipients(event)
+            document = {**event, "pending": pending, "leases": {}, "attempts": {}, "failed": []}
+            if not pending:
+                document["completed_at"] = datetime.now(timezone.utc)
+            documents.append(document)
+        if documents:
+            await self.collection.insert_many(documents, session=session)
+            self._appended.set()
+
+    async def claim(self, consumer: str, limit: int = CLAIM_BATCH_SIZE) -> List[Dict]:
+        from pymongo import ReturnDocument
+
+        claimed = []
+        while len(claimed) < limit:
+            now = datetime.now(timezone.utc)
+            event = await self.collection.find_one_and_update(
+                {"pending": consumer, f"leases.{consumer}": {"$not": {"$gt": now}}},
+                {"$set": {f"leases.{consumer}": now + timedelta(seconds=LEASE_SECONDS)}},
+                sort=[("occurred_at", 1)],
+                projection={"_id": 0, "leases": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if event is None:
+                break
+            claimed.append(event)
+        return claimed
+
+    async def _complete(self, consumer: str, event_id: str, update: Dict):
+        update.setdefault("$pull", {})["pending"] = consumer
+        update.setdefault("$unset", {}).update({f"leases.{consumer}": "", f"attempts.{consumer}": ""})
+        await self.collection.update_one({"id": event_id}, update)
+        await self.collection.update_one(
+            {"id": event_id, "pending": {"$size": 0}, "completed_at": {"$exists": False}},
+            {"$set": {"completed_at": datetime.now(timezone.utc)}}
+        )
+
+    async def ack(self, consumer: str, event_id: str):
+        await self._complete(consumer, event_id, {})
+
+    async def fail(self, consumer: str, event: Dict, error: str):
+        attempts = event.get("attempts", {}).get(consumer, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up on order event %s for %s after %s attempts: %s", event['id'], consumer, attempts, error)
+            await self._complete(consumer, event["id"], {"$push": {"failed": {"consumer": consumer, "error": error}}})
+            return
+        await self.collection.update_one(
+            {"id": event["id"]},
+            {"$set": {f"leases.{consumer}": _retry_at(attempts), f"attempts.{consumer}": attempts}}
+        )
+
+    async def release(self, consumer: str, event_ids: List[str]):
+        if event_ids:
+            await self.collection.update_many(
+                {"id": {"$in": event_ids}, "pending": consumer}, {"$unset": {f"leases.{consumer}": ""}}
+            )
+
+    async def backlog(self, consumer: str, limit: int = BACKLOG_COUNT_LIMIT) -> int:
+        return await self.collection.count_documents({"pending": consumer}, limit=limit)
+
+    async def _watch(self):
+        from cache import CHANGE_STREAM_UNSUPPORTED_CODES
+
+        while True:
+            try:
+                async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                    async for _ in stream:
+                        self._appended.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if getattr(e, "code", None) in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.info("Change streams not supported by this MongoDB deployment; polling for order events")
+                    self._watch_supported = False
+                    return
+                logger.error("Order event change stream failed, restarting: %s", e)
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS)
+
+    async def tail(self, poll_interval: float = 1.0) -> AsyncIterator[Dict]:
+        from cache import CHANGE_STREAM_UNSUPPORTED_CODES
+
+        if self._watch_supported:
+            try:
+                async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                    async for change in stream:
+                        yield public_event(change["fullDocument"])
+            except Exception as e:
+                if getattr(e, "code", None) not in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    raise
+                self._watch_supported = False
+
+        since = datetime.now(timezone.utc)
+        seen: Dict[str, str] = {}
+        while True:
+            await asyncio.sleep(poll_interval)
+            poll_started = datetime.now(timezone.utc)
+            cursor = self.collection.find(
+                {"occurred_at": {"$gte": (since - timedelta(seconds=TAIL_LOOKBACK_SECONDS)).isoformat()}},
+                {field: 1 for field in EVENT_FIELDS} | {"_id": 0}
+            ).sort("occurred_at", 1)
+            async for event in cursor:
+                if event["id"] not in seen:
+                    seen[event["id"]] = event["occurred_at"]
+                    yield public_event(event)
+            since = poll_started
+            horizon = (since - timedelta(seconds=2 * TAIL_LOOKBACK_SECONDS)).isoformat()
+            seen = {event_id: occurred_at for event_id, occurred_at in seen.items() if occurred_at >= horizon}
+
+    async def wait(self, timeout: float):
+        if self._watcher is None and self._watch_supported:
+            self._watcher = asyncio.create_task(self._watch())
+        try:
+            await asyncio.wait_for(self._appended.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._appended.clear()
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+
+class InMemoryOrderEventStore(OrderEventStore):
+    """Outbox kept in process, for InMemoryOrderRepository"""
+
+    def __init__(self):
+        super().__init__()
+        self._events: Dict[str, Dict] = {}
+        self._appended = asyncio.Event()
+        self._tails: List[asyncio.Queue] = []
+
+    async def append(self, events: List[Dict], session=None):
+        for event in events:
+            pending = self._recipients(event)
+            if pending:
+                self._events[event["id"]] = {**event, "pending": pending, "leases": {}, "attempts": {}, "failed": []}
+            for queue in self._tails:
+                queue.put_nowait(public_event(event))
+        if events:
+            self._appended.set()
+
+    async def tail(self, poll_interval: float = 1.0) -> AsyncIterator[Dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._tails.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._tails.remove(queue)
+
+    async def claim(self, consumer: str, limit: int = CLAIM_BATCH_SIZE) -> List[Dict]:
+        now = datetime.now(timezone.utc)
+        claimed = []
+        # Dicts keep insertion order, which is event order
+        for event in self._events.values():
+            if consumer not in event["pending"]:
+                continue
+            lease = event["leases"].get(consumer)
+            if lease is not None and lease > now:
+                continue
+            event["leases"][consumer] = now + timedelta(seconds=LEASE_SECONDS)
+            claimed.append(event)
+            if len(claimed) >= limit:
+                break
+        return claimed
+
+    def _complete(self, consumer: str, event_id: str):
+        event = self._events.get(event_id)
+        if event is None:
+            return
+        event["pending"].remove(consumer)
+        event["leases"].pop(consumer, None)
+        event["attempts"].pop(consumer, None)
+        if not event["pending"]:
+            del self._events[event_id]
+
+    async def ack(self, consumer: str, event_id: str):
+        self._complete(consumer, event_id)
+
+    async def fail(self, consumer: str, event: Dict, error: str):
+        stored = self._events.get(event["id"])
+        if stored is None:
+            return
+        attempts = stored["attempts"].get(consumer, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up on order event %s for %s after %s attempts: %s", event['id'], consumer, attempts, error)
+            self._complete(consumer, event["id"])
+            return
+        stored["attempts"][consumer] = attempts
+        stored["leases"][consumer] = _retry_at(attempts)
+
+    async def release(self, consumer: str, event_ids: List[str]):
+        for event_id in event_ids:
+            event = self._events.get(event_id)
+            if event is not None:
+                event["leases"].pop(consumer, None)
+
+    async def backlog(self, consumer: str, limit: int = BACKLOG_COUNT_LIMIT) -> int:
+        return min(limit, sum(1 for event in self._events.values() if consumer in event["pending"]))
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._appended.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._appended.clear()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+# ==================== DISPATCHER ====================
+
+class OrderEventDispatcher:
+    """Delivers outbox events to each registered consumer, oldest first"""
+
+    def __init__(self, store: OrderEventStore, poll_interval: float = 1.0):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.consumers: List[OrderEventConsumer] = []
+
+    def register(self, consumers: Iterable[OrderEventConsumer]):
+        for consumer in consumers:
+            self.consumers.append(consumer)
+            self.store.subscribe(consumer)
+
+    async def ensure_indexes(self):
+        await self.store.ensure_indexes()
+        for consumer in self.consumers:
+            if hasattr(consumer, "ensure_indexes"):
+                await consumer.ensure_indexes()
+
+    async def _deliver(self, consumer: OrderEventConsumer) -> int:
+        events = await self.store.claim(consumer.name)
+        for index, event in enumerate(events):
+            try:
+                await consumer.handle(event)
+            except Exception as e:
+                logger.error("Order event %s for %s failed in %s: %s", event['type'], event['order_number'], consumer.name, e)
+                await self.store.fail(consumer.name, event, str(e))
+                # Hand back the rest of the batch rather than leaving it leased until the lease runs out
+                await self.store.release(consumer.name, [later["id"] for later in events[index + 1:]])
+                return index + 1
+            await self.store.ack(consumer.name, event["id"])
+        return len(events)
+
+    async def run_once(self) -> int:
+        """Deliver everything currently claimable and return how many events were handled"""
+        delivered = await asyncio.gather(*(self._deliver(consumer) for consumer in self.consumers))
+        return sum(delivered)
+
+    async def run(self):
+        """Deliver events until cancelled"""
+        await self.ensure_indexes()
+        try:
+            while True:
+                try:
+                    delivered = await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("Error dispatching order events: %s", e)
+                    delivered = 0
+                if not delivered:
+                    await self.store.wait(self.poll_interval)
+        finally:
+            await self.store.close()
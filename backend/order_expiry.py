@@ -0,0 +1,86 @@
+"""
+Pending Order Expiry
+Cancels orders left in pending_payment after the customer walked away from checkout
+
+Each run cancels stale orders in batches, oldest first, through the (status, created_at)
+index until none are left or max_batches is reached; the rest wait for the next run. Every
+cancellation goes through the order repository, so it emits order.status_changed like any
+other, and the stock each order still holds is released right away rather than when the
+event is delivered.
+"""
+
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from inventory import InventoryStore
+from metrics import PENDING_ORDERS_EXPIRED, PENDING_ORDER_SWEEP_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Pending orders older than this are cancelled
+PENDING_ORDER_MAX_AGE_SECONDS = 24 * 3600
+
+SWEEP_BATCH_SIZE = 500
+SWEEP_MAX_BATCHES = 20
+SWEEP_INTERVAL_SECONDS = 300
+
+
+class PendingOrderSweeper:
+    """Cancels stale pending_payment orders and releases their stock"""
+
+    def __init__(
+        self,
+        orders,
+        inventory: Optional[InventoryStore] = None,
+        max_age_seconds: float = PENDING_ORDER_MAX_AGE_SECONDS,
+        batch_size: int = SWEEP_BATCH_SIZE,
+        max_batches: int = SWEEP_MAX_BATCHES
+    ):
+        self.orders = orders
+        self.inventory = inventory
+        self.max_age_seconds = max_age_seconds
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.last_report: Optional[Dict] = None
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """One sweep; returns the counts processed"""
+        started = time.perf_counter()
+        created_before = (now or datetime.now(timezone.utc)) - timedelta(seconds=self.max_age_seconds)
+        report = {"cancelled": 0, "released": 0, "batches": 0, "created_before": created_before.isoformat()}
+        while report["batches"] < self.max_batches:
+            order_ids = await self.orders.expire_pending(created_before, limit=self.batch_size)
+            if not order_ids:
+                break
+            report["batches"] += 1
+            report["cancelled"] += len(order_ids)
+            if self.inventory is not None:
+                for order_id in order_ids:
+                    report["released"] += await self.inventory.release(order_id)
+            if len(order_ids) < self.batch_size:
+                break
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        PENDING_ORDERS_EXPIRED.labels().inc(report["cancelled"])
+        PENDING_ORDER_SWEEP_DURATION.labels().observe(report["seconds"])
+        self.last_report = report
+        return report
+
+    async def run(self, interval: float = SWEEP_INTERVAL_SECONDS):
+        """Sweep every `interval` seconds"""
+        while True:
+            try:
+                report = await self.run_once()
+                if report["cancelled"]:
+                    logger.info(
+                        "Expired %s pending orders created before %s in %s batches (%s stock holds released, %ss)",
+                        report['cancelled'], report['created_before'], report['batches'], report['released'],
+                        report['seconds']
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error expiring pending orders: %s", e)
+            await asyncio.sleep(interval)
@@ -0,0 +1,1138 @@
+"""
+Order Repository
+Single storage layer for orders: schema, projections, indexes and batched operations
+
+Every handler reads and writes orders through the OrderRepository interface, so caching,
+indexing and query shape changes only need to happen here. MongoOrderRepository is the
+production backend; InMemoryOrderRepository keeps orders in process for tests, benchmarks
+and running the app offline. Documents written by the retired OrderService (nested
+`customer`, `payment_received` status, datetime timestamps) are converted to the current
+schema by MongoOrderRepository.migrate_legacy_orders().
+
+Given an OrderEventStore, both backends append an event for every order they create,
+update or delete (see order_events); Mongo does so in the same transaction when the
+deployment supports transactions.
+"""
+
+import json
+import heapq
+import asyncio
+import base64
+import bisect
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from database import with_read_preference
+from order_events import OrderEventStore, OrderEventType, build_event, events_for_update
+from sales_timeseries import bucket_starts, next_bucket
+from order_archive import OrderArchive
+from order_search import CANDIDATE_LIMIT, index_keys, query_terms, rank, search_prefixes
+from models import (
+    Order, OrderStatus, OrderStats, OrderSummary, OrderHistoryPage, REVENUE_STATUSES,
+    serialize_for_mongo, deserialize_from_mongo, normalize_email, order_document
+)
+
+logger = logging.getLogger(__name__)
+
+# Shared projections; search_prefixes is only used by the index
+ORDER_PROJECTION = {"_id": 0, "search_prefixes": 0}
+EXISTS_PROJECTION = {"_id": 1}
+SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "order_number": 1, "status": 1, "total": 1,
+    "tracking_number": 1, "created_at": 1, "items.quantity": 1
+}
+LEGACY_ORDER_QUERY = {"customer": {"$exists": True}}
+
+# Default number of documents per batched write
+WRITE_BATCH_SIZE = 1000
+
+# Columns of the line item batches streamed to analytics, and rows per batch
+LINE_ITEM_FIELDS = ("order_id", "product_id", "name", "size", "color", "quantity", "price")
+LINE_ITEM_BATCH_SIZE = 50_000
+
+
+class OrderRepository(ABC):
+    """Storage interface for orders"""
+
+    # Outbox receiving an event for every order write, if any
+    events: Optional[OrderEventStore] = None
+
+    # Cold storage that lookups by id and order number fall back to, if any
+    archive: Optional[OrderArchive] = None
+
+    # Called with the ids of existing orders each write changed, after it is committed
+    # (new orders are not reported; nothing can have cached them yet)
+    on_change: Optional[Callable[[List[str]], Awaitable[None]]] = None
+
+    async def ensure_indexes(self):
+        """Create the indexes the order queries rely on"""
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Session shared by an order write and its events (None without transactions)"""
+        if self.events is None:
+            yield None
+            return
+        async with self.events.transaction() as session:
+            yield session
+
+    async def _emit(self, events: List[Dict], session=None):
+        if self.events is not None and events:
+            await self.events.append(events, session=session)
+
+    async def _changed(self, order_ids: List[str]):
+        if self.on_change is not None and order_ids:
+            await self.on_change(order_ids)
+
+    @abstractmethod
+    async def get_by_id(self, order_id: str) -> Optional[Order]:
+        """Get an order by ID"""
+
+    @abstractmethod
+    async def get_by_number(self, order_number: str) -> Optional[Order]:
+        """Get an order by order number"""
+
+    @abstractmethod
+    async def get_many(self, order_ids: Iterable[str]) -> List[Order]:
+        """Get several orders by ID"""
+
+    async def _archived(self, order_id: Optional[str] = None, order_number: Optional[str] = None) -> Optional[Order]:
+        if self.archive is None:
+            return None
+        if order_id is not None:
+            document = await self.archive.get_by_id(order_id)
+        else:
+            document = await self.archive.get_by_number(order_number)
+        return Order.model_validate(document) if document else None
+
+    @abstractmethod
+    async def _stored_ids(self, order_ids: List[str]) -> Set[str]:
+        """Which of the ids are orders in this repository (not counting the archive)"""
+
+    async def _archived_between(self, start: datetime, end: datetime, statuses: Optional[List[str]],
+                                batch_size: int) -> AsyncIterator[Dict]:
+        """Archived orders created in [start, end), without those the hot store also holds"""
+        if self.archive is None:
+            return
+        archived = self.archive.created_between(start, end, statuses)
+        while True:
+            batch: List[Dict] = []
+            async for document in archived:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                return
+            # A copy left in the hot store (changed while it was archived) is the current one
+            stored = await self._stored_ids([document["id"] for document in batch])
+            for document in batch:
+                if document["id"] not in stored:
+                    yield document
+
+    @abstractmethod
+    async def exists(self, order_id: str) -> bool:
+        """Check that an order exists without loading it"""
+
+    @abstractmethod
+    async def list(
+        self,
+        status: Optional[OrderStatus] = None,
+        customer_email: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Order]:
+        """List orders, newest first, with optional filters"""
+
+    @abstractmethod
+    async def customer_orders(self, email: str, cursor: Optional[str] = None, limit: int = 20) -> OrderHistoryPage:
+        """Summaries of a customer's orders, newest first, a page at a time"""
+
+    @abstractmethod
+    async def search(self, query: str, limit: int = 20) -> List[Order]:
+        """Orders matching every term of the query by prefix, best matches first"""
+
+    @abstractmethod
+    async def create(self, order: Order) -> Order:
+        """Store a new order"""
+
+    @abstractmethod
+    async def insert_many(self, orders: Iterable[Order], batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """Store orders in batches and return how many were written; no order events are emitted"""
+
+    @abstractmethod
+    async def update(self, order_id: str, fields: Dict[str, Any],
+                     from_status: Optional[OrderStatus] = None) -> Optional[Order]:
+        """Set fields on an order and return the updated order, or None if it does not exist
+
+        With `from_status`, only an order in that status is updated; None otherwise.
+        """
+
+    @abstractmethod
+    async def update_status_many(self, order_ids: Iterable[str], status: OrderStatus) -> int:
+        """Move several orders to a status and return how many changed"""
+
+    @abstractmethod
+    async def archivable(self, created_before: datetime, statuses: List[str], limit: int = WRITE_BATCH_SIZE) -> List[Dict]:
+        """Stored documents of up to `limit` orders in `statuses` created before a time, oldest first"""
+
+    @abstractmethod
+    async def remove_archived(self, documents: List[Dict]) -> int:
+        """Remove archived orders that are unchanged since they were read, without order events; returns how many"""
+
+    @abstractmethod
+    async def expire_pending(self, created_before: datetime, limit: int = WRITE_BATCH_SIZE) -> List[str]:
+        """Cancel up to `limit` pending_payment orders created before a time, oldest first; returns their ids
+
+        Orders paid in the meantime are left alone, even if they were selected.
+        """
+
+    @abstractmethod
+    async def confirm_payment(self, order_id: str, transaction_id: Optional[str]) -> bool:
+        """Mark a pending_payment order as paid; False if it is not awaiting payment"""
+
+    @abstractmethod
+    async def delete(self, order_id: str) -> bool:
+        """Delete an order"""
+
+    @abstractmethod
+    async def count_by_status(self) -> Dict[str, int]:
+        """Count orders per status"""
+
+    @abstractmethod
+    async def count_since(self, since: datetime) -> int:
+        """Count orders created since a time"""
+
+    @abstractmethod
+    async def total_revenue(self, since: Optional[datetime] = None) -> float:
+        """Sum the totals of paid orders, optionally only those created since a time"""
+
+    @abstractmethod
+    async def popular_products(self, limit: int = 10) -> List[Dict]:
+        """Best-selling products by quantity across all orders"""
+
+    @abstractmethod
+    def line_item_batches(self, batch_size: int = LINE_ITEM_BATCH_SIZE) -> AsyncIterator[Dict[str, List]]:
+        """Every order line item, in batches of column lists keyed by LINE_ITEM_FIELDS
+
+        The rows of an order are adjacent, though an order may straddle two batches.
+        """
+
+    @abstractmethod
+    def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None,
+                        batch_size: int = WRITE_BATCH_SIZE) -> AsyncIterator[Dict]:
+        """Serialized orders created in [start, end), optionally only in `statuses`
+
+        Oldest first, then the archived orders in the range (also oldest first).
+        """
+
+    @abstractmethod
+    async def sales_timeseries(self, start: datetime, end: datetime, granularity: str, tz: str = "UTC") -> List[Dict]:
+        """Orders, paid revenue and paid units per hour, day or week bucket for orders created in [start, end)
+
+        Rows are {"start", "orders", "revenue", "units"} with `start` the bucket start as an
+        aware UTC datetime, in bucket order; buckets without orders are left out.
+        """
+
+    async def get_order_stats(self) -> OrderStats:
+        """Headline order counts and revenue, overall and for today (UTC)"""
+        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        counts = await self.count_by_status()
+        return OrderStats(
+            total_orders=sum(counts.values()),
+            pending_orders=counts[OrderStatus.PENDING_PAYMENT.value],
+            total_revenue=await self.total_revenue(),
+            today_orders=await self.count_since(today_start),
+            today_revenue=await self.total_revenue(since=today_start)
+        )
+
+
+class MongoOrderRepository(OrderRepository):
+    """MongoDB access for the orders collection
+
+    Checkout reads and all writes go to the primary; statistics read with
+    `analytics_read_preference` so they can be served by secondaries.
+    """
+
+    def __init__(self, db, analytics_read_preference: str = "secondaryPreferred",
+                 events: Optional[OrderEventStore] = None, archive: Optional[OrderArchive] = None):
+        self.db = db
+        self.analytics_read_preference = analytics_read_preference
+        self.events = events
+        self.archive = archive
+
+    @property
+    def collection(self):
+        # Resolved per call so a lazily connected database is only touched on first query
+        return self.db.orders
+
+    @property
+    def analytics_collection(self):
+        """Orders collection for statistics reads"""
+        return with_read_preference(self.db.orders, self.analytics_read_preference)
+
+    # ==================== INDEXES ====================
+
+    async def ensure_indexes(self):
+        """Create the indexes the order queries rely on"""
+        indexes = [
+            ("id", {"unique": True}),
+            ("order_number", {"unique": True}),
+            ([("status", 1), ("created_at", -1)], {}),
+            # Customer order history and the customer_email filter, paged by (created_at, id)
+            ([("customer_email", 1), ("created_at", -1), ("id", -1)], {}),
+            # Admin search: equality on one prefix, newest first
+            ([("search_prefixes", 1), ("created_at", -1)], {}),
+            ([("created_at", -1)], {}),
+        ]
+        for keys, options in indexes:
+            try:
+                await self.collection.create_index(keys, **options)
+            except Exception as e:
+                logger.error("Error creating order index %s: %s", keys, e)
+
+    # ==================== READS ====================
+
+    @staticmethod
+    def _to_order(document: Dict) -> Order:
+        return Order(**deserialize_from_mongo(document))
+
+    async def get_by_id(self, order_id: str) -> Optional[Order]:
+        """Get an order by ID"""
+        document = await self.collection.find_one({"id": order_id}, ORDER_PROJECTION)
+        return self._to_order(document) if document else await self._archived(order_id=order_id)
+
+    async def get_by_number(self, order_number: str) -> Optional[Order]:
+        """Get an order by order number"""
+        document = await self.collection.find_one({"order_number": order_number}, ORDER_PROJECTION)
+        return self._to_order(document) if document else await self._archived(order_number=order_number)
+
+    async def get_many(self, order_ids: Iterable[str]) -> List[Order]:
+        """Get several orders by ID in a single query"""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return []
+        documents = await self.collection.find({"id": {"$in": order_ids}}, ORDER_PROJECTION).to_list(len(order_ids))
+        return [self._to_order(document) for document in documents]
+
+    async def exists(self, order_id: str) -> bool:
+        """Check that an order exists without loading it"""
+        return await self.collection.find_one({"id": order_id}, EXISTS_PROJECTION) is not None
+
+    async def _stored_ids(self, order_ids: List[str]) -> Set[str]:
+        documents = await self.collection.find({"id": {"$in": order_ids}}, {"_id": 0, "id": 1}).to_list(len(order_ids))
+        return {document["id"] for document in documents}
+
+    async def list(
+        self,
+        status: Optional[OrderStatus] = None,
+        customer_email: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Order]:
+        """List orders, newest first, with optional filters"""
+        query: Dict[str, Any] = {}
+        if status:
+            query["status"] = status.value
+        if customer_email:
+            query["customer_email"] = normalize_email(customer_email)
+
+        documents = await self.collection.find(query, ORDER_PROJECTION).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+        return [self._to_order(document) for document in documents]
+
+    async def customer_orders(self, email: str, cursor: Optional[str] = None, limit: int = 20) -> OrderHistoryPage:
+        """Summaries of a customer's orders, newest first, paged by (created_at, id) from the index"""
+        query: Dict[str, Any] = {"customer_email": normalize_email(email)}
+        if cursor:
+            created_at, order_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": order_id}}
+            ]
+        documents = await self.collection.find(query, SUMMARY_PROJECTION).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        return history_page(documents, limit)
+
+    async def search(self, query: str, limit: int = 20) -> List[Order]:
+        """Orders matching every term of the query by prefix, best matches first
+
+        The newest CANDIDATE_LIMIT orders holding all the prefixes come from the
+        (search_prefixes, created_at) index and are ranked in process.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        keys = index_keys(terms)
+        documents = await self.collection.find(
+            {"search_prefixes": {"$all": keys}} if len(keys) > 1 else {"search_prefixes": keys[0]},
+            ORDER_PROJECTION
+        ).sort("created_at", -1).limit(CANDIDATE_LIMIT).to_list(CANDIDATE_LIMIT)
+        return [self._to_order(document) for document in rank(documents, terms, limit)]
+
+    # ==================== WRITES ====================
+
+    async def create(self, order: Order) -> Order:
+        """Store a new order"""
+        document = order_document(order)
+        async with self._transaction() as session:
+            await self.collection.insert_one(document, session=session)
+            await self._emit([build_event(OrderEventType.CREATED, document)], session)
+        return order
+
+    async def insert_many(self, orders: Iterable[Order], batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """Store orders in unordered batches and return how many were written, without order events"""
+        written = 0
+        batch: List[Dict] = []
+        for order in orders:
+            batch.append(order_document(order))
+            if len(batch) >= batch_size:
+                result = await self.collection.insert_many(batch, ordered=False)
+                written += len(result.inserted_ids)
+                batch = []
+        if batch:
+            result = await self.collection.insert_many(batch, ordered=False)
+            written += len(result.inserted_ids)
+        return written
+
+    async def update(self, order_id: str, fields: Dict[str, Any],
+                     from_status: Optional[OrderStatus] = None) -> Optional[Order]:
+        """Set fields on an order and return the updated order, or None if it does not exist"""
+        from pymongo import ReturnDocument
+
+        query = {"id": order_id}
+        if from_status is not None:
+            query["status"] = from_status.value
+        fields = serialize_for_mongo(dict(fields))
+        fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+        async with self._transaction() as session:
+            # The previous document tells the event which status the order left
+            before = await self.collection.find_one_and_update(
+                query,
+                {"$set": fields},
+                projection=ORDER_PROJECTION,
+                return_document=ReturnDocument.BEFORE,
+                session=session
+            )
+            if before is None:
+                return None
+            await self._emit([events_for_update(before, fields)], session)
+        await self._changed([order_id])
+        return self._to_order({**before, **fields})
+
+    async def update_status_many(self, order_ids: Iterable[str], status: OrderStatus) -> int:
+        """Move several orders to a status in one write and return how many changed"""
+        order_ids = list(order_ids)
+        fields = {"status": status.value, "updated_at": datetime.now(timezone.utc).isoformat()}
+        async with self._transaction() as session:
+            changing: List[Dict] = []
+            if self.events is not None:
+                changing = await self.collection.find(
+                    {"id": {"$in": order_ids}, "status": {"$ne": status.value}}, ORDER_PROJECTION, session=session
+                ).to_list(len(order_ids))
+            result = await self.collection.update_many({"id": {"$in": order_ids}}, {"$set": fields}, session=session)
+            await self._emit([events_for_update(document, fields) for document in changing], session)
+        if result.modified_count:
+            await self._changed(order_ids)
+        return result.modified_count
+
+    async def confirm_payment(self, order_id: str, transaction_id: Optional[str]) -> bool:
+        """Mark a pending_payment order as paid, in one update that matches on the status"""
+        return await self.update(order_id, {
+            "status": OrderStatus.PAYMENT_CONFIRMED.value,
+            "payment_transaction_id": transaction_id
+        }, from_status=OrderStatus.PENDING_PAYMENT) is not None
+
+    async def archivable(self, created_before: datetime, statuses: List[str], limit: int = WRITE_BATCH_SIZE) -> List[Dict]:
+        """Oldest matching orders, from the (status, created_at) index"""
+        return await self.collection.find(
+            {"status": {"$in": statuses}, "created_at": {"$lt": created_before.astimezone(timezone.utc).isoformat()}},
+            ORDER_PROJECTION
+        ).sort("created_at", 1).limit(limit).to_list(limit)
+
+    async def remove_archived(self, documents: List[Dict]) -> int:
+        """One unordered bulk delete, each delete matching the updated_at that was read"""
+        from pymongo import DeleteOne
+
+        if not documents:
+            return 0
+        result = await self.collection.bulk_write(
+            [DeleteOne({"id": document["id"], "updated_at": document.get("updated_at")}) for document in documents],
+            ordered=False
+        )
+        return result.deleted_count
+
+    async def expire_pending(self, created_before: datetime, limit: int = WRITE_BATCH_SIZE) -> List[str]:
+        """Select stale orders on the (status, created_at) index and cancel them in one guarded update_many"""
+        pending = OrderStatus.PENDING_PAYMENT.value
+        candidates = await self.collection.find(
+            {"status": pending, "created_at": {"$lt": created_before.astimezone(timezone.utc).isoformat()}},
+            ORDER_PROJECTION
+        ).sort("created_at", 1).limit(limit).to_list(limit)
+        if not candidates:
+            return []
+        order_ids = [document["id"] for document in candidates]
+        # The timestamp identifies this write, so orders cancelled by it can be read back
+        fields = {"status": OrderStatus.CANCELLED.value, "updated_at": datetime.now(timezone.utc).isoformat()}
+        async with self._transaction() as session:
+            result = await self.collection.update_many(
+                {"id": {"$in": order_ids}, "status": pending}, {"$set": fields}, session=session
+            )
+            if result.modified_count == len(order_ids):
+                cancelled = order_ids
+            else:
+                cancelled = [
+                    document["id"] for document in await self.collection.find(
+                        {"id": {"$in": order_ids}, **fields}, {"_id": 0, "id": 1}, session=session
+                    ).to_list(len(order_ids))
+                ]
+            changed = set(cancelled)
+            await self._emit(
+                [events_for_update(document, fields) for document in candidates if document["id"] in changed], session
+            )
+        await self._changed(cancelled)
+        return cancelled
+
+    async def delete(self, order_id: str) -> bool:
+        """Delete an order"""
+        async with self._transaction() as session:
+            document = await self.collection.find_one_and_delete({"id": order_id}, projection=ORDER_PROJECTION, session=session)
+            if document is None:
+                return False
+            await self._emit([build_event(OrderEventType.DELETED, document)], session)
+        await self._changed([order_id])
+        return True
+
+    # ==================== STATISTICS ====================
+
+    async def count_by_status(self) -> Dict[str, int]:
+        """Count orders per status in a single aggregation"""
+        counts = {status.value: 0 for status in OrderStatus}
+        pipeline = [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        async for row in self.analytics_collection.aggregate(pipeline):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    async def total_revenue(self, since: Optional[datetime] = None) -> float:
+        """Sum the totals of paid orders, optionally only those created since a time"""
+        match: Dict[str, Any] = {"status": {"$in": REVENUE_STATUSES}}
+        if since:
+            match["created_at"] = {"$gte": since.isoformat()}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": None, "total": {"$sum": "$total"}}}
+        ]
+        rows = await self.analytics_collection.aggregate(pipeline).to_list(1)
+        return rows[0]["total"] if rows else 0
+
+    async def popular_products(self, limit: int = 10) -> List[Dict]:
+        """Best-selling products by quantity across all orders"""
+        pipeline = [
+            {"$unwind": "$items"},
+            {
+                "$group": {
+                    "_id": "$items.product_id",
+                    "name": {"$first": "$items.name"},
+                    "total_quantity": {"$sum": "$items.quantity"},
+                    "total_revenue": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}}
+                }
+            },
+            {"$sort": {"total_quantity": -1}},
+            {"$limit": limit}
+        ]
+        rows = await self.analytics_collection.aggregate(pipeline).to_list(limit)
+        return [
+            {
+                "product_id": row["_id"],
+                "name": row["name"],
+                "total_quantity": row["total_quantity"],
+                "total_revenue": row["total_revenue"]
+            }
+            for row in rows
+        ]
+
+    async def count_since(self, since: datetime) -> int:
+        """Count orders created since a time"""
+        return await self.analytics_collection.count_documents({"created_at": {"$gte": since.isoformat()}})
+
+    async def line_item_batches(self, batch_size: int = LINE_ITEM_BATCH_SIZE) -> AsyncIterator[Dict[str, List]]:
+        """Line items unwound server side and streamed with cursor batches of `batch_size`"""
+        pipeline = [
+            {"$project": {"_id": 0, "id": 1, "items": 1}},
+            {"$unwind": "$items"},
+            {"$project": {
+                "order_id": "$id",
+                "product_id": "$items.product_id",
+                "name": "$items.name",
+                "size": "$items.selected_size",
+                "color": "$items.selected_color",
+                "quantity": "$items.quantity",
+                "price": "$items.price"
+            }}
+        ]
+        rows: List[Dict] = []
+        async for row in self.analytics_collection.aggregate(pipeline, batchSize=batch_size):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield {field: [row.get(field) for row in rows] for field in LINE_ITEM_FIELDS}
+                rows = []
+        if rows:
+            yield {field: [row.get(field) for row in rows] for field in LINE_ITEM_FIELDS}
+
+    async def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None,
+                              batch_size: int = WRITE_BATCH_SIZE) -> AsyncIterator[Dict]:
+        """Streamed from the created_at (or status, created_at) index in cursor batches of `batch_size`"""
+        query: Dict[str, Any] = {"created_at": {
+            "$gte": start.astimezone(timezone.utc).isoformat(), "$lt": end.astimezone(timezone.utc).isoformat()
+        }}
+        if statuses:
+            query["status"] = {"$in": statuses}
+        cursor = self.analytics_collection.find(query, ORDER_PROJECTION).sort("created_at", 1).batch_size(batch_size)
+        async for document in cursor:
+            yield document
+        async for document in self._archived_between(start, end, statuses, batch_size):
+            yield document
+
+    async def sales_timeseries(self, start: datetime, end: datetime, granularity: str, tz: str = "UTC") -> List[Dict]:
+        """Per-bucket sales from one aggregation; the range match uses the created_at index
+
+        Buckets come from $dateTrunc (MongoDB 5.0+) on the parsed created_at, in the given
+        time zone, with weeks starting on Monday.
+        """
+        paid = {"$in": ["$status", REVENUE_STATUSES]}
+        pipeline = [
+            {"$match": {"created_at": {
+                "$gte": start.astimezone(timezone.utc).isoformat(),
+                "$lt": end.astimezone(timezone.utc).isoformat()
+            }}},
+            {"$group": {
+                "_id": {"$dateTrunc": {
+                    "date": {"$dateFromString": {"dateString": "$created_at"}},
+                    "unit": granularity,
+                    "timezone": tz,
+                    "startOfWeek": "monday"
+                }},
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": {"$cond": [paid, "$total", 0]}},
+                "units": {"$sum": {"$cond": [paid, {"$sum": "$items.quantity"}, 0]}}
+            }},
+            {"$sort": {"_id": 1}}
+        ]
+        rows = await self.analytics_collection.aggregate(pipeline).to_list(None)
+        return [
+            {
+                # Motor returns naive UTC datetimes
+                "start": row["_id"].replace(tzinfo=timezone.utc),
+                "orders": row["orders"],
+                "revenue": row["revenue"],
+                "units": row["units"]
+            }
+            for row in rows
+        ]
+
+    # ==================== LEGACY MIGRATION ====================
+
+    async def backfill_customer_emails(self) -> int:
+        """Set customer_email on orders stored before it existed, in one server-side update"""
+        result = await self.collection.update_many(
+            {"customer_email": {"$exists": False}, "customer_info.email": {"$type": "string"}},
+            [{"$set": {"customer_email": {"$toLower": {"$trim": {"input": "$customer_info.email"}}}}}]
+        )
+        return result.modified_count
+
+    async def backfill_search_prefixes(self, batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """Compute search_prefixes for orders stored before the search index existed"""
+        from pymongo import UpdateOne
+
+        updated = 0
+        operations: List["UpdateOne"] = []
+        fields = {"_id": 1, "order_number": 1, "customer_info": 1, "items.name": 1}
+        async for document in self.collection.find({"search_prefixes": {"$exists": False}}, fields):
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$set": {"search_prefixes": search_prefixes(document)}}))
+            if len(operations) >= batch_size:
+                updated += (await self.collection.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated += (await self.collection.bulk_write(operations, ordered=False)).modified_count
+        return updated
+
+    async def migrate_legacy_orders(self, batch_size: int = WRITE_BATCH_SIZE, dry_run: bool = False) -> int:
+        """Rewrite documents stored by the old OrderService in the current schema"""
+        from pymongo import ReplaceOne
+
+        migrated = 0
+        operations: List["ReplaceOne"] = []
+        async for document in self.collection.find(LEGACY_ORDER_QUERY):
+            converted = convert_legacy_order(document)
+            # Validate before writing so a malformed legacy document is skipped, not stored half-converted
+            try:
+                Order(**deserialize_from_mongo(dict(converted)))
+            except Exception as e:
+                logger.error("Skipping legacy order %s: %s", document.get('order_number'), e)
+                continue
+            operations.append(ReplaceOne({"_id": document["_id"]}, converted))
+            if len(operations) >= batch_size:
+                migrated += await self._replace_batch(operations, dry_run)
+                operations = []
+        if operations:
+            migrated += await self._replace_batch(operations, dry_run)
+        return migrated
+
+    async def _replace_batch(self, operations: List, dry_run: bool) -> int:
+        if dry_run:
+            return len(operations)
+        result = await self.collection.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+
+def _iso(value: Any) -> Any:
+    """ISO string for a stored timestamp; naive datetimes were written as UTC"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(created_at: str, order_id: str) -> str:
+    """Opaque order history cursor for the last order of a page"""
+    return base64.urlsafe_b64encode(json.dumps([created_at, order_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) of a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(order_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, order_id
+
+
+def history_page(documents: List[Dict], limit: int) -> OrderHistoryPage:
+    """Page of summaries from up to limit + 1 documents; the extra one signals a next page"""
+    summaries = [
+        OrderSummary(
+            id=document["id"],
+            order_number=document["order_number"],
+            status=document["status"],
+            total=document["total"],
+            item_count=sum(item.get("quantity", 0) for item in document.get("items", [])),
+            tracking_number=document.get("tracking_number"),
+            created_at=document["created_at"]
+        )
+        for document in documents[:limit]
+    ]
+    next_cursor = None
+    if len(documents) > limit:
+        last = documents[limit - 1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return OrderHistoryPage(orders=summaries, next_cursor=next_cursor)
+
+
+def convert_legacy_order(document: Dict) -> Dict:
+    """Map an OrderService document onto the current order schema"""
+    customer = document.get("customer") or {}
+    customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
+
+    status = document.get("status") or OrderStatus.PENDING_PAYMENT.value
+    if status == "payment_received" or (
+        status == OrderStatus.PENDING_PAYMENT.value and document.get("payment_status") == "paid"
+    ):
+        status = OrderStatus.PAYMENT_CONFIRMED.value
+
+    now = datetime.now(timezone.utc).isoformat()
+    created_at = _iso(document.get("created_at")) or now
+
+    return {
+        "_id": document["_id"],
+        "id": document.get("id") or str(document["_id"]),
+        "order_number": document.get("order_number") or f"UNS-{document['_id']}",
+        "customer_info": {
+            "first_name": customer.get("first_name", ""),
+            "last_name": customer.get("last_name", ""),
+            "email": customer.get("email"),
+            "phone": customer.get("phone", "")
+        },
+        "customer_email": normalize_email(customer["email"]) if customer.get("email") else None,
+        "shipping_address": {
+            "address": customer.get("address", ""),
+            "city": customer.get("city", ""),
+            "postal_code": customer.get("postal_code", ""),
+            "country": customer.get("country", "Israel")
+        },
+        "items": [
+            {
+                "product_id": item.get("product_id"),
+                "name": item.get("product_name", item.get("name")),
+                "price": item.get("price", 0),
+                "quantity": item.get("quantity", 1),
+                "selected_size": item.get("size", item.get("selected_size", "")),
+                "selected_color": item.get("color", item.get("selected_color", "")),
+                "image": item.get("image")
+            }
+            for item in document.get("items", [])
+        ],
+        "shipping_method": document.get("shipping_method") or "standard",
+        "shipping_cost": document.get("shipping_cost", 0),
+        "subtotal": document.get("subtotal", 0),
+        "total": document.get("total", 0),
+        "payment_info": {
+            "card_last_four": "",
+            "card_name": customer_name,
+            "payment_method": (document.get("payment_method") or "HYP").lower()
+        },
+        "discount_code": None,
+        "discount_amount": 0,
+        "status": status,
+        "payment_transaction_id": document.get("payment_transaction_id"),
+        "tracking_number": document.get("tracking_number"),
+        "created_at": created_at,
+        "updated_at": _iso(document.get("updated_at")) or created_at,
+        "notes": document.get("notes")
+    }
+
+
+class InMemoryOrderRepository(OrderRepository):
+    """Orders kept in process, indexed by id, order_number, status and customer email
+
+    Documents are stored in their serialized (Mongo) form so reads behave like the
+    Mongo backend, and (created_at, id) lists kept in sorted order, overall and per
+    customer, serve newest-first listings without sorting on every request.
+    """
+
+    def __init__(self, events: Optional[OrderEventStore] = None, archive: Optional[OrderArchive] = None):
+        self.events = events
+        self.archive = archive
+        self._orders: Dict[str, Dict] = {}
+        self._by_number: Dict[str, str] = {}
+        self._by_status: Dict[str, Set[str]] = {status.value: set() for status in OrderStatus}
+        self._by_created: List[Tuple[str, str]] = []
+        self._by_email: Dict[str, List[Tuple[str, str]]] = {}
+        # Search prefix -> order ids, built on the first search and maintained from then on
+        self._by_prefix: Optional[Dict[str, Set[str]]] = None
+
+    def reset(self, documents: Iterable[Dict]):
+        """Replace all orders with already-serialized documents in one go"""
+        self._orders = {}
+        self._by_number = {}
+        self._by_status = {status.value: set() for status in OrderStatus}
+        self._by_email = {}
+        self._by_prefix = None
+        for document in documents:
+            self._index(document)
+        self._by_created = sorted((document["created_at"], order_id) for order_id, document in self._orders.items())
+        for created_at, order_id in self._by_created:
+            self._by_email.setdefault(self._email_key(self._orders[order_id]), []).append((created_at, order_id))
+
+    def _index(self, document: Dict):
+        order_id = document["id"]
+        self._orders[order_id] = document
+        self._by_number[document["order_number"]] = order_id
+        self._by_status.setdefault(document["status"], set()).add(order_id)
+
+    def _index_prefixes(self, document: Dict):
+        for prefix in document.get("search_prefixes") or search_prefixes(document):
+            self._by_prefix.setdefault(prefix, set()).add(document["id"])
+
+    @staticmethod
+    def _email_key(document: Dict) -> str:
+        # Documents loaded with reset() may predate the stored customer_email
+        return document.get("customer_email") or normalize_email(document["customer_info"]["email"])
+
+    @staticmethod
+    def _to_order(document: Dict) -> Order:
+        # Pydantic parses the ISO timestamps itself, leaving the stored document untouched
+        return Order.model_validate(document)
+
+    # ==================== READS ====================
+
+    async def get_by_id(self, order_id: str) -> Optional[Order]:
+        """Get an order by ID"""
+        document = self._orders.get(order_id)
+        return self._to_order(document) if document else await self._archived(order_id=order_id)
+
+    async def get_by_number(self, order_number: str) -> Optional[Order]:
+        """Get an order by order number"""
+        order_id = self._by_number.get(order_number)
+        return await self.get_by_id(order_id) if order_id else await self._archived(order_number=order_number)
+
+    async def get_many(self, order_ids: Iterable[str]) -> List[Order]:
+        """Get several orders by ID"""
+        return [self._to_order(self._orders[order_id]) for order_id in order_ids if order_id in self._orders]
+
+    async def exists(self, order_id: str) -> bool:
+        """Check that an order exists"""
+        return order_id in self._orders
+
+    async def _stored_ids(self, order_ids: List[str]) -> Set[str]:
+        return {order_id for order_id in order_ids if order_id in self._orders}
+
+    async def list(
+        self,
+        status: Optional[OrderStatus] = None,
+        customer_email: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Order]:
+        """List orders, newest first, with optional filters"""
+        status_ids = self._by_status.get(status.value, set()) if status else None
+        results: List[Order] = []
+        for _, order_id in reversed(self._by_created):
+            if status_ids is not None and order_id not in status_ids:
+                continue
+            document = self._orders[order_id]
+            if customer_email and self._email_key(document) != normalize_email(customer_email):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            results.append(self._to_order(document))
+            if len(results) >= limit:
+                break
+        return results
+
+    async def customer_orders(self, email: str, cursor: Optional[str] = None, limit: int = 20) -> OrderHistoryPage:
+        """Summaries of a customer's orders, newest first, a page at a time"""
+        keys = self._by_email.get(normalize_email(email), [])
+        end = bisect.bisect_left(keys, decode_cursor(cursor)) if cursor else len(keys)
+        documents = [self._orders[order_id] for _, order_id in reversed(keys[max(end - limit - 1, 0):end])]
+        return history_page(documents, limit)
+
+    async def search(self, query: str, limit: int = 20) -> List[Order]:
+        """Orders matching every term of the query by prefix, best matches first
+
+        Like the Mongo backend, the newest CANDIDATE_LIMIT orders holding every prefix
+        are ranked; the prefix index is built on the first search.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        if self._by_prefix is None:
+            self._by_prefix = {}
+            for document in self._orders.values():
+                self._index_prefixes(document)
+        matches = sorted((self._by_prefix.get(key, set()) for key in index_keys(terms)), key=len)
+        order_ids = matches[0].intersection(*matches[1:])
+        newest = heapq.nlargest(CANDIDATE_LIMIT, order_ids, key=lambda order_id: (self._orders[order_id]["created_at"], order_id))
+        candidates = [self._orders[order_id] for order_id in newest]
+        return [self._to_order(document) for document in rank(candidates, terms, limit)]
+
+    # ==================== WRITES ====================
+
+    async def create(self, order: Order) -> Order:
+        """Store a new order"""
+        document = self._add(order)
+        await self._emit([build_event(OrderEventType.CREATED, document)])
+        return order
+
+    def _add(self, order: Order) -> Dict:
+        document = order_document(order)
+        self._index(document)
+        key = (document["created_at"], document["id"])
+        bisect.insort(self._by_created, key)
+        bisect.insort(self._by_email.setdefault(document["customer_email"], []), key)
+        if self._by_prefix is not None:
+            self._index_prefixes(document)
+        return document
+
+    async def insert_many(self, orders: Iterable[Order], batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """Store orders and return how many were written, without emitting order events"""
+        written = 0
+        for order in orders:
+            self._add(order)
+            written += 1
+        return written
+
+    async def update(self, order_id: str, fields: Dict[str, Any],
+                     from_status: Optional[OrderStatus] = None) -> Optional[Order]:
+        """Set fields on an order and return the updated order, or None if it does not exist"""
+        document = self._orders.get(order_id)
+        if document is None or (from_status is not None and document["status"] != from_status.value):
+            return None
+        fields = serialize_for_mongo(dict(fields))
+        fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+        if "status" in fields and fields["status"] != document["status"]:
+            self._by_status[document["status"]].discard(order_id)
+            self._by_status.setdefault(fields["status"], set()).add(order_id)
+        # Replace rather than mutate so orders handed out earlier keep their values
+        self._orders[order_id] = {**document, **fields}
+        await self._emit([events_for_update(document, fields)])
+        await self._changed([order_id])
+        return self._to_order(self._orders[order_id])
+
+    async def update_status_many(self, order_ids: Iterable[str], status: OrderStatus) -> int:
+        """Move several orders to a status and return how many changed"""
+        changed = 0
+        for order_id in order_ids:
+            document = self._orders.get(order_id)
+            if document is not None and document["status"] != status.value:
+                await self.update(order_id, {"status": status.value})
+                changed += 1
+        return changed
+
+    async def confirm_payment(self, order_id: str, transaction_id: Optional[str]) -> bool:
+        """Mark a pending_payment order as paid"""
+        return await self.update(order_id, {
+            "status": OrderStatus.PAYMENT_CONFIRMED.value,
+            "payment_transaction_id": transaction_id
+        }, from_status=OrderStatus.PENDING_PAYMENT) is not None
+
+    async def archivable(self, created_before: datetime, statuses: List[str], limit: int = WRITE_BATCH_SIZE) -> List[Dict]:
+        """Oldest matching orders from the status index"""
+        threshold = created_before.astimezone(timezone.utc).isoformat()
+        matching = sorted(
+            (self._orders[order_id]["created_at"], order_id)
+            for status in statuses
+            for order_id in self._by_status.get(status, ())
+            if self._orders[order_id]["created_at"] < threshold
+        )[:limit]
+        return [dict(self._orders[order_id]) for _, order_id in matching]
+
+    async def remove_archived(self, documents: List[Dict]) -> int:
+        """Remove the orders whose updated_at still matches"""
+        removed = 0
+        for document in documents:
+            stored = self._orders.get(document["id"])
+            if stored is not None and stored.get("updated_at") == document.get("updated_at"):
+                self._remove(document["id"])
+                removed += 1
+        return removed
+
+    async def expire_pending(self, created_before: datetime, limit: int = WRITE_BATCH_SIZE) -> List[str]:
+        """Cancel the oldest stale orders from the pending_payment status index"""
+        threshold = created_before.astimezone(timezone.utc).isoformat()
+        stale = sorted(
+            (self._orders[order_id]["created_at"], order_id)
+            for order_id in self._by_status.get(OrderStatus.PENDING_PAYMENT.value, ())
+            if self._orders[order_id]["created_at"] < threshold
+        )[:limit]
+        for _, order_id in stale:
+            await self.update(order_id, {"status": OrderStatus.CANCELLED.value})
+        return [order_id for _, order_id in stale]
+
+    async def delete(self, order_id: str) -> bool:
+        """Delete an order"""
+        document = self._remove(order_id)
+        if document is None:
+            return False
+        await self._emit([build_event(OrderEventType.DELETED, document)])
+        await self._changed([order_id])
+        return True
+
+    def _remove(self, order_id: str) -> Optional[Dict]:
+        document = self._orders.pop(order_id, None)
+        if document is None:
+            return None
+        self._by_number.pop(document["order_number"], None)
+        self._by_status[document["status"]].discard(order_id)
+        key = (document["created_at"], order_id)
+        position = bisect.bisect_left(self._by_created, key)
+        if position < len(self._by_created) and self._by_created[position] == key:
+            del self._by_created[position]
+        if self._by_prefix is not None:
+            for prefix in document.get("search_prefixes") or search_prefixes(document):
+                self._by_prefix.get(prefix, set()).discard(order_id)
+        customer_keys = self._by_email.get(self._email_key(document), [])
+        position = bisect.bisect_left(customer_keys, key)
+        if position < len(customer_keys) and customer_keys[position] == key:
+            del customer_keys[position]
+        return document
+
+    # ==================== STATISTICS ====================
+
+    async def count_by_status(self) -> Dict[str, int]:
+        """Count orders per status from the status index"""
+        counts = {status.value: 0 for status in OrderStatus}
+        counts.update({status: len(order_ids) for status, order_ids in self._by_status.items()})
+        return counts
+
+    async def count_since(self, since: datetime) -> int:
+        """Count orders created since a time"""
+        return len(self._by_created) - bisect.bisect_left(self._by_created, (since.isoformat(), ""))
+
+    async def total_revenue(self, since: Optional[datetime] = None) -> float:
+        """Sum the totals of paid orders, optionally only those created since a time"""
+        threshold = since.isoformat() if since else None
+        total = 0
+        for status in REVENUE_STATUSES:
+            for order_id in self._by_status.get(status, ()):
+                document = self._orders[order_id]
+                if threshold is None or document["created_at"] >= threshold:
+                    total += document.get("total", 0)
+        return total
+
+    async def popular_products(self, limit: int = 10) -> List[Dict]:
+        """Best-selling products by quantity across all orders"""
+        product_sales: Dict[str, Dict] = {}
+        for document in self._orders.values():
+            for item in document.get("items", []):
+                sales = product_sales.get(item["product_id"])
+                if sales is None:
+                    sales = product_sales[item["product_id"]] = {
+                        "product_id": item["product_id"],
+                        "name": item.get("name"),
+                        "total_quantity": 0,
+                        "total_revenue": 0
+                    }
+                sales["total_quantity"] += item.get("quantity", 0)
+                sales["total_revenue"] += item.get("price", 0) * item.get("quantity", 0)
+        return sorted(product_sales.values(), key=lambda sales: sales["total_quantity"], reverse=True)[:limit]
+
+    async def line_item_batches(self, batch_size: int = LINE_ITEM_BATCH_SIZE) -> AsyncIterator[Dict[str, List]]:
+        """Line items of the stored documents, yielding to the event loop between batches"""
+        documents = list(self._orders.values())
+        # Documents per batch, at the catalog's typical two to three items an order
+        step = max(batch_size // 2, 1)
+        for offset in range(0, len(documents), step):
+            chunk = documents[offset:offset + step]
+            # One comprehension per column: no per-row containers for the collector to trace
+            items = [item for document in chunk for item in document["items"]]
+            yield {
+                "order_id": [document["id"] for document in chunk for _ in document["items"]],
+                "product_id": [item["product_id"] for item in items],
+                "name": [item.get("name") for item in items],
+                "size": [item.get("selected_size") for item in items],
+                "color": [item.get("selected_color") for item in items],
+                "quantity": [item.get("quantity", 0) for item in items],
+                "price": [item.get("price", 0) for item in items]
+            }
+            await asyncio.sleep(0)
+
+    async def created_between(self, start: datetime, end: datetime, statuses: Optional[List[str]] = None,
+                              batch_size: int = WRITE_BATCH_SIZE) -> AsyncIterator[Dict]:
+        """Sliced from the created_at list, yielding to the event loop between batches"""
+        low = bisect.bisect_left(self._by_created, (start.astimezone(timezone.utc).isoformat(), ""))
+        high = bisect.bisect_left(self._by_created, (end.astimezone(timezone.utc).isoformat(), ""))
+        keys = self._by_created[low:high]
+        for offset in range(0, len(keys), batch_size):
+            for _, order_id in keys[offset:offset + batch_size]:
+                document = self._orders.get(order_id)
+                if document is not None and (not statuses or document["status"] in statuses):
+                    yield dict(document)
+            await asyncio.sleep(0)
+        async for document in self._archived_between(start, end, statuses, batch_size):
+            yield document
+
+    async def sales_timeseries(self, start: datetime, end: datetime, granularity: str, tz: str = "UTC") -> List[Dict]:
+        """Per-bucket sales, slicing the created_at list at each bucket boundary"""
+        start, end, zone = start.astimezone(timezone.utc), end.astimezone(timezone.utc), ZoneInfo(tz)
+        rows = []
+        for bucket in bucket_starts(start, end, granularity, zone):
+            bucket_end = min(next_bucket(bucket, granularity, zone), end)
+            low = bisect.bisect_left(self._by_created, (max(bucket, start).isoformat(), ""))
+            high = bisect.bisect_left(self._by_created, (bucket_end.isoformat(), ""))
+            if low == high:
+                continue
+            row = {"start": bucket, "orders": high - low, "revenue": 0, "units": 0}
+            for _, order_id in self._by_created[low:high]:
+                document = self._orders[order_id]
+                if document["status"] in REVENUE_STATUSES:
+                    row["revenue"] += document.get("total", 0)
+                    row["units"] += sum(item.get("quantity", 0) for item in document.get("items", []))
+            rows.append(row)
+        return rows
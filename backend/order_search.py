@@ -0,0 +1,110 @@
+"""
+Order Search
+Prefix index over customer name, email, phone, order number and item names
+
+Every stored order carries `search_prefixes`: the leading 2..MAX_PREFIX characters of each
+of its search tokens. Tokens longer than MAX_PREFIX are kept whole, so exact matches on
+long tokens still work. A query term is then an equality match on that multikey field,
+which an index on (search_prefixes, created_at) answers newest first without scanning.
+The candidates are ranked here by field and by exact versus prefix matches.
+"""
+
+import re
+from typing import Dict, Iterable, List
+
+MIN_PREFIX = 2
+MAX_PREFIX = 12
+
+# Newest matching orders considered for ranking
+CANDIDATE_LIMIT = 200
+
+# Per-term score by the field it matched; exact token matches count double
+FIELD_WEIGHTS = {
+    "order_number": 8,
+    "email": 4,
+    "phone": 4,
+    "name": 3,
+    "items": 1,
+}
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; \\w keeps Hebrew letters"""
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _phone_tokens(phone: str) -> List[str]:
+    digits = re.sub(r"\D", "", phone or "")
+    tokens = tokenize(phone)
+    if digits:
+        tokens.append(digits)
+        # +972-54-... is searched as 054...
+        if digits.startswith("972"):
+            tokens.append("0" + digits[3:])
+    return tokens
+
+
+def field_tokens(document: Dict) -> Dict[str, List[str]]:
+    """Search tokens of a stored order, by field"""
+    customer = document.get("customer_info") or {}
+    return {
+        "order_number": tokenize(document.get("order_number", "")),
+        "email": tokenize(customer.get("email", "")),
+        "phone": _phone_tokens(customer.get("phone", "")),
+        "name": tokenize(f"{customer.get('first_name', '')} {customer.get('last_name', '')}"),
+        "items": [token for item in document.get("items", []) for token in tokenize(item.get("name", ""))],
+    }
+
+
+def search_prefixes(document: Dict) -> List[str]:
+    """Values stored in search_prefixes for a serialized order"""
+    prefixes = set()
+    for tokens in field_tokens(document).values():
+        for token in tokens:
+            if len(token) > MAX_PREFIX:
+                prefixes.add(token)
+            for length in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1):
+                prefixes.add(token[:length])
+    return sorted(prefixes)
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct search terms of a query; single characters are too broad to index"""
+    terms: List[str] = []
+    for term in tokenize(query):
+        if len(term) >= MIN_PREFIX and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def index_keys(terms: Iterable[str]) -> List[str]:
+    """search_prefixes values to look up; longer terms are matched on their indexed prefix"""
+    return [term[:MAX_PREFIX] for term in terms]
+
+
+def score(document: Dict, terms: List[str]) -> float:
+    """Relevance of an order for the terms; 0 if any term matches nothing"""
+    tokens = field_tokens(document)
+    total = 0.0
+    for term in terms:
+        best = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokens[field]:
+                if token == term:
+                    best = max(best, 2 * weight)
+                elif token.startswith(term):
+                    best = max(best, weight)
+        if not best:
+            return 0.0
+        total += best
+    return total
+
+
+def rank(documents: List[Dict], terms: List[str], limit: int) -> List[Dict]:
+    """Best `limit` documents by score; documents arrive newest first, which breaks ties"""
+    scored = [(score(document, terms), position, document) for position, document in enumerate(documents)]
+    scored = [entry for entry in scored if entry[0] > 0]
+    scored.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [document for _, _, document in scored[:limit]]
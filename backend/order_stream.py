@@ -0,0 +1,111 @@
+"""
+Live Order Stream
+Order changes pushed to browsers as server-sent events, fanned out in process
+
+Order confirmation pages and the admin dashboard subscribe instead of refetching. Each
+worker follows the order event outbox once (OrderEventStore.tail(): a change stream, or
+polling without one) and OrderStreamHub hands every event to the subscribers of that
+order and of the admin feed, so the cost of watching MongoDB does not grow with the
+number of open streams.
+
+Every subscriber has a bounded queue. One that falls behind is dropped rather than
+allowed to hold memory or slow the others; its stream ends and the browser's EventSource
+reconnects and starts again from a fresh snapshot.
+"""
+
+import json
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set, Union
+
+from order_events import OrderEventStore
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Comment lines sent on idle streams so proxies do not time them out
+KEEPALIVE_SECONDS = 15
+
+# Delay before following the outbox again after the tail fails
+RETRY_SECONDS = 5
+
+
+class Subscription:
+    """Events for one stream: a single order, or every order when order_id is None"""
+
+    __slots__ = ('order_id', 'queue', 'overflowed')
+
+    def __init__(self, order_id: Optional[str], queue_size: int):
+        self.order_id = order_id
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    async def next(self, timeout: float) -> Optional[Dict]:
+        """Next event, or None if there was none within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class OrderStreamHub:
+    """Fans out one worker's tail of the order event outbox to its subscriptions"""
+
+    def __init__(self, store: OrderEventStore, poll_interval: float = 1.0,
+                 queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._by_order: Dict[str, Set[Subscription]] = {}
+        self._all: Set[Subscription] = set()
+
+    @contextmanager
+    def subscribe(self, order_id: Optional[str] = None) -> Iterator[Subscription]:
+        """Receive events for one order, or for all orders, while the block runs"""
+        subscription = Subscription(order_id, self.queue_size)
+        subscribers = self._all if order_id is None else self._by_order.setdefault(order_id, set())
+        subscribers.add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers.discard(subscription)
+            if order_id is not None and not subscribers:
+                self._by_order.pop(order_id, None)
+
+    def publish(self, event: Dict):
+        """Queue an event for every subscription it concerns"""
+        for subscription in (*self._all, *self._by_order.get(event["order_id"], ())):
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+    async def run(self):
+        """Follow the outbox until cancelled"""
+        while True:
+            try:
+                async for event in self.store.tail(self.poll_interval):
+                    self.publish(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events appended meanwhile are missed; streams resync on their next snapshot
+                logger.error("Order stream stopped following order events, restarting: %s", e)
+                await asyncio.sleep(RETRY_SECONDS)
+
+    def __len__(self) -> int:
+        return len(self._all) + sum(len(subscribers) for subscribers in self._by_order.values())
+
+
+def sse_message(event: str, data: Union[Dict, str], event_id: Optional[str] = None) -> str:
+    """One server-sent event; `data` is a dict or already serialized (single-line) JSON"""
+    if not isinstance(data, str):
+        data = json.dumps(data, default=str, separators=(',', ':'))
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
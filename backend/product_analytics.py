@@ -0,0 +1,164 @@
+"""
+Product Analytics
+Quantity and revenue per product and per size/color variant, attach rates and basket sizes
+
+Line items stream from the order repository in batches and are packed into NumPy columns
+as they arrive: an order number within the scan, integer codes for product, size and color,
+quantity and price. A million line items then cost a handful of arrays instead of a million
+dicts, and every figure is a vectorized group-by over them. numpy and pandas are imported
+here only, and this module only on first use, to keep them out of the app's cold start.
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class _Codes:
+    """Stable integer codes for the distinct values of a column, across batches"""
+
+    def __init__(self):
+        self.values: List = []
+        self._codes: Dict = {}
+
+    def code(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, column: np.ndarray) -> np.ndarray:
+        # Hash the batch in C, then map its few distinct values to the global codes. Missing
+        # values get a code of their own (rather than -1) and are labelled None
+        local_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        mapping = np.fromiter((self.code(None if pd.isna(value) else value) for value in uniques),
+                              dtype=np.int32, count=len(uniques))
+        return mapping[local_codes]
+
+
+class LineItemColumns:
+    """Line item rows accumulated batch by batch as NumPy columns"""
+
+    def __init__(self):
+        self.products = _Codes()
+        self.sizes = _Codes()
+        self.colors = _Codes()
+        # First name seen per product code
+        self.names: List[Optional[str]] = []
+        self.order_count = 0
+        self._last_order_id = None
+        self._columns: Dict[str, List[np.ndarray]] = {
+            "order": [], "product": [], "size": [], "color": [], "quantity": [], "price": []
+        }
+
+    def add(self, batch: Dict[str, List]):
+        """Append a batch from OrderRepository.line_item_batches()"""
+        count = len(batch["order_id"])
+        if not count:
+            return
+        order_ids = np.array(batch["order_id"], dtype=object)
+        # Rows of an order are adjacent, so a new order starts wherever the id changes
+        starts = np.empty(count, dtype=bool)
+        starts[0] = order_ids[0] != self._last_order_id
+        starts[1:] = order_ids[1:] != order_ids[:-1]
+        self._columns["order"].append(self.order_count - 1 + np.cumsum(starts))
+        self.order_count += int(starts.sum())
+        self._last_order_id = order_ids[-1]
+
+        products = self.products.encode(np.array(batch["product_id"], dtype=object))
+        for code in range(len(self.names), len(self.products.values)):
+            self.names.append(batch["name"][int(np.argmax(products == code))])
+        self._columns["product"].append(products)
+        self._columns["size"].append(self.sizes.encode(np.array(batch["size"], dtype=object)))
+        self._columns["color"].append(self.colors.encode(np.array(batch["color"], dtype=object)))
+        self._columns["quantity"].append(np.array(batch["quantity"], dtype=np.float64).astype(np.int64))
+        self._columns["price"].append(np.array(batch["price"], dtype=np.float64))
+
+    def frame(self) -> pd.DataFrame:
+        """All rows added so far, with revenue per row"""
+        frame = pd.DataFrame({
+            name: np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+            for name, chunks in self._columns.items()
+        })
+        frame["revenue"] = frame["price"] * frame["quantity"]
+        return frame
+
+
+def summarize(columns: LineItemColumns, variant_limit: int = 50) -> Dict:
+    """Product, variant and basket figures over the collected line items
+
+    `order_share` is the share of orders containing a product and `attach_rate` the share
+    of those orders that contain at least one other product as well.
+    """
+    frame = columns.frame()
+    order_count = columns.order_count
+    product_count = len(columns.products.values)
+    order = frame["order"].to_numpy()
+    product = frame["product"].to_numpy()
+    quantity = frame["quantity"].to_numpy()
+    revenue = frame["revenue"].to_numpy()
+
+    # Distinct (order, product) pairs
+    pairs = pd.unique(order.astype(np.int64) * max(product_count, 1) + product)
+    pair_order, pair_product = np.divmod(pairs, max(product_count, 1))
+    products_per_order = np.bincount(pair_order, minlength=order_count)
+    orders_with = np.bincount(pair_product, minlength=product_count)
+    attached = np.bincount(pair_product[products_per_order[pair_order] > 1], minlength=product_count)
+
+    product_quantity = np.bincount(product, weights=quantity, minlength=product_count)
+    product_revenue = np.bincount(product, weights=revenue, minlength=product_count)
+    products = [
+        {
+            "product_id": columns.products.values[code],
+            "name": columns.names[code],
+            "total_quantity": int(product_quantity[code]),
+            "total_revenue": float(product_revenue[code]),
+            "orders": int(orders_with[code]),
+            "order_share": float(orders_with[code] / order_count),
+            "attach_rate": float(attached[code] / orders_with[code]) if orders_with[code] else 0.0
+        }
+        for code in np.argsort(-product_quantity, kind="stable")
+    ]
+
+    variants = (
+        frame.groupby(["product", "size", "color"], sort=False)
+        .agg(total_quantity=("quantity", "sum"), total_revenue=("revenue", "sum"))
+        .sort_values("total_quantity", ascending=False, kind="stable")
+        .head(variant_limit)
+    )
+    variant_rows = [
+        {
+            "product_id": columns.products.values[product_code],
+            "name": columns.names[product_code],
+            "size": columns.sizes.values[size_code],
+            "color": columns.colors.values[color_code],
+            "total_quantity": int(total_quantity),
+            "total_revenue": float(total_revenue)
+        }
+        for (product_code, size_code, color_code), total_quantity, total_revenue in zip(
+            variants.index, variants["total_quantity"], variants["total_revenue"]
+        )
+    ]
+
+    basket = {"orders": order_count, "avg_lines": 0.0, "avg_products": 0.0, "avg_units": 0.0, "avg_value": 0.0}
+    if order_count:
+        basket.update({
+            "avg_lines": float(np.bincount(order, minlength=order_count).mean()),
+            "avg_products": float(products_per_order.mean()),
+            "avg_units": float(np.bincount(order, weights=quantity, minlength=order_count).mean()),
+            "avg_value": float(np.bincount(order, weights=revenue, minlength=order_count).mean())
+        })
+
+    return {"products": products, "variants": variant_rows, "basket": basket}
+
+
+async def product_analytics(orders, variant_limit: int = 50, batch_size: Optional[int] = None) -> Dict:
+    """Stream every line item from an OrderRepository and summarize them"""
+    columns = LineItemColumns()
+    batches = orders.line_item_batches(batch_size) if batch_size else orders.line_item_batches()
+    async for batch in batches:
+        columns.add(batch)
+    return await asyncio.get_running_loop().run_in_executor(None, summarize, columns, variant_limit)
@@ -0,0 +1,231 @@
+"""
+Request Profiler
+Samples the event-loop stack while requests run and keeps collapsed-stack dumps of slow
+or explicitly requested requests in a rolling on-disk store
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-debug-profile"
+
+# Stack recorded while the profiled request is suspended (awaiting Mongo, HYP, ...)
+AWAITING_FRAME = "[awaiting]"
+
+
+class ProfilerSettings:
+    """Runtime-adjustable profiler settings"""
+
+    def __init__(self, enabled: bool = False, threshold_ms: float = 500.0,
+                 interval_ms: float = 5.0, max_files: int = 200):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.max_files = max_files
+
+    @classmethod
+    def from_env(cls) -> 'ProfilerSettings':
+        return cls(
+            enabled=os.getenv('PROFILER_ENABLED', 'false').lower() == 'true',
+            threshold_ms=float(os.getenv('PROFILER_THRESHOLD_MS', '500')),
+            interval_ms=float(os.getenv('PROFILER_INTERVAL_MS', '5')),
+            max_files=int(os.getenv('PROFILER_MAX_FILES', '200')),
+        )
+
+    def update(self, values: Dict):
+        for key in ('enabled', 'threshold_ms', 'interval_ms', 'max_files'):
+            value = values.get(key)
+            if value is None:
+                continue
+            if key == 'enabled' and isinstance(value, str):
+                value = value.lower() == 'true'
+            setattr(self, key, type(getattr(self, key))(value))
+
+    def to_dict(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'interval_ms': self.interval_ms,
+            'max_files': self.max_files,
+        }
+
+
+class _Session:
+    """Samples collected for one in-flight request"""
+
+    __slots__ = ('task', 'stacks', 'forced')
+
+    def __init__(self, task: Optional[asyncio.Task], forced: bool):
+        self.task = task
+        self.stacks: Counter = Counter()
+        self.forced = forced
+
+
+def _collapse(frame) -> str:
+    """Render a frame and its callers as a semicolon-separated collapsed stack"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class ProfileStore:
+    """Rolling directory of collapsed-stack (.folded) files, ready for flamegraph.pl or speedscope"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def save(self, name: str, stacks: Counter, max_files: int) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{name}.folded"
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune(max_files)
+        return path.name
+
+    def _prune(self, max_files: int):
+        files = sorted(self.directory.glob('*.folded'), key=lambda p: p.stat().st_mtime)
+        for path in files[:max(len(files) - max_files, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def list(self) -> List[Dict]:
+        if not self.directory.exists():
+            return []
+        files = sorted(self.directory.glob('*.folded'), key=lambda p: p.stat().st_mtime, reverse=True)
+        return [{'name': p.name, 'size': p.stat().st_size, 'created_at': p.stat().st_mtime} for p in files]
+
+    def path_for(self, name: str) -> Optional[Path]:
+        path = self.directory / os.path.basename(name)
+        return path if path.suffix == '.folded' and path.exists() else None
+
+
+class RequestProfiler:
+    """Samples the event-loop thread on a background thread while profiled requests are in flight
+
+    Each sample is attributed to the request whose task is currently running on the
+    loop; requests that are suspended get an AWAITING_FRAME sample instead, so the dump
+    shows both on-CPU stacks and time spent waiting on I/O.
+    """
+
+    def __init__(self, settings: ProfilerSettings, store: ProfileStore):
+        self.settings = settings
+        self.store = store
+        self._sessions: Dict[int, _Session] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def start(self, forced: bool) -> _Session:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+        session = _Session(asyncio.current_task(), forced)
+        with self._lock:
+            self._sessions[id(session)] = session
+        self._ensure_thread()
+        self._wakeup.set()
+        return session
+
+    def stop(self, session: _Session):
+        with self._lock:
+            self._sessions.pop(id(session), None)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                sessions = list(self._sessions.values())
+                if not sessions:
+                    self._wakeup.clear()
+                    continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            running = asyncio.tasks._current_tasks.get(self._loop)
+            stack = _collapse(frame) if frame is not None else AWAITING_FRAME
+            for session in sessions:
+                if session.task is not None and session.task is running:
+                    session.stacks[stack] += 1
+                else:
+                    session.stacks[AWAITING_FRAME] += 1
+            del frame
+
+            time.sleep(self.settings.interval_ms / 1000)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling slow requests, or any request carrying an admin debug header
+
+    The X-Debug-Profile header must carry a token accepted by ``authorize`` (an admin
+    access token); anyone else's header is ignored.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler, authorize: Callable[[str], bool]):
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+
+    def _forced(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return self.authorize(value.decode('latin-1'))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        forced = self._forced(scope)
+        # Event streams stay open for minutes; only profile them on request
+        if not forced and (not self.profiler.settings.enabled or scope["path"].endswith("/events")):
+            await self.app(scope, receive, send)
+            return
+
+        session = self.profiler.start(forced)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.stop(session)
+            duration_ms = (time.perf_counter() - start) * 1000
+            if session.stacks and (forced or duration_ms >= self.profiler.settings.threshold_ms):
+                route = getattr(scope.get("route"), "path", None) or scope["path"]
+                name = "{}_{}_{}_{}ms".format(
+                    time.strftime('%Y%m%dT%H%M%S'),
+                    scope["method"],
+                    re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-') or 'root',
+                    int(duration_ms),
+                )
+                loop = asyncio.get_running_loop()
+                loop.run_in_executor(None, self._save, name, session.stacks)
+
+    def _save(self, name: str, stacks: Counter):
+        try:
+            saved = self.profiler.store.save(name, stacks, self.profiler.settings.max_files)
+            logger.info("Saved request profile %s", saved)
+        except Exception as e:
+            logger.error("Error saving request profile %s: %s", name, e)
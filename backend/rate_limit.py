@@ -0,0 +1,265 @@
+"""
+Rate Limiting
+Per-client, per-route request limits for the public write endpoints
+
+Checkout, payment, discount validation, newsletter signup and admin login can be called
+by anyone, and each costs MongoDB round trips (login also costs a bcrypt hash). The
+RateLimitMiddleware answers a client that is over a route's limit with 429 and a
+Retry-After header before routing, so a throttled request never reaches a handler.
+
+Each worker keeps a token bucket per (route, client IP): the bucket holds up to `requests`
+tokens and refills continuously at requests / period, so a client can burst up to the
+limit and is then held to the average rate. With a shared store, requests that pass the
+local bucket are also counted in MongoDB with a sliding window counter, which holds the
+limit across all workers; if the shared store cannot be reached, requests are let through
+on the local limit alone.
+
+The client IP is the ASGI client address. Behind a reverse proxy, run uvicorn with
+--proxy-headers and --forwarded-allow-ips so that is the address from X-Forwarded-For.
+"""
+
+import math
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+# Limits per "METHOD /path"; RATE_LIMITS overrides them route by route
+DEFAULT_RATE_LIMITS = {
+    "POST /api/orders": "10/minute",
+    "POST /api/payment/process": "10/minute",
+    "POST /api/discount/validate": "30/minute",
+    "POST /api/newsletter/subscribe": "5/minute",
+    "POST /api/admin/login": "5/minute",
+}
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Buckets kept per worker; the least recently used are dropped beyond this
+MAX_BUCKETS = 100_000
+
+
+class RateLimit:
+    """`requests` per `period` seconds, allowing bursts of up to `requests`"""
+
+    __slots__ = ('requests', 'period')
+
+    def __init__(self, requests: int, period: float):
+        if requests < 1 or period <= 0:
+            raise ValueError(f"Invalid rate limit: {requests}/{period}s")
+        self.requests = requests
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> 'RateLimit':
+        """Parse "10/minute" (second, minute, hour or day)"""
+        requests, _, period = value.strip().partition("/")
+        if period.strip() not in PERIODS:
+            raise ValueError(f"Invalid rate limit: {value}")
+        return cls(int(requests), PERIODS[period.strip()])
+
+    def __repr__(self) -> str:
+        return f"RateLimit({self.requests}/{self.period}s)"
+
+
+def parse_limits(spec: str = "", defaults: Dict[str, str] = DEFAULT_RATE_LIMITS) -> Dict[Tuple[str, str], RateLimit]:
+    """Route limits from the defaults, overridden by a spec like
+    "POST /api/orders=20/minute,POST /api/admin/login=off"
+    """
+    values = dict(defaults)
+    for entry in spec.split(","):
+        if entry.strip():
+            route, _, value = entry.partition("=")
+            values[" ".join(route.split())] = value.strip()
+    limits = {}
+    for route, value in values.items():
+        if value.lower() == "off":
+            continue
+        method, _, path = route.partition(" ")
+        limits[(method.upper(), path)] = RateLimit.parse(value)
+    return limits
+
+
+def sliding_window_wait(count: int, previous: int, elapsed: float, limit: RateLimit) -> float:
+    """Seconds until another request fits the sliding window; 0 if this one does
+
+    `count` requests (this one included) were made in the current fixed window and
+    `previous` in the one before; `elapsed` is the fraction of the current window gone.
+    """
+    if previous * (1 - elapsed) + count <= limit.requests:
+        return 0.0
+    if count + 1 > limit.requests:
+        # Over the limit within this window alone; wait until enough of it has slid out
+        # of the next one, where these requests count as the previous window
+        return ((1 - elapsed) + (1 - (limit.requests - 1) / count)) * limit.period
+    # Wait until enough of the previous window has slid out for one more request
+    return ((1 - (limit.requests - count - 1) / previous) - elapsed) * limit.period
+
+
+class RateLimitStore(ABC):
+    """Counts requests per key against a limit"""
+
+    async def ensure_indexes(self):
+        """Create the indexes the store relies on"""
+
+    @abstractmethod
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        """Count a request; 0 if it is allowed, otherwise seconds until one would be"""
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Token buckets in this worker, with LRU eviction"""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        """hit() without the coroutine, for the middleware's fast path"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit.requests), now]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(limit.requests), bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / limit.rate
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        return self.take(key, limit)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class MongoRateLimitStore(RateLimitStore):
+    """Sliding window counters in the rate_limits collection, shared by every worker
+
+    One document per key holds the count for the current fixed window and the one before;
+    the previous count is weighted by how much of it still overlaps the sliding window.
+    Each request is a single atomic update. Documents expire through a TTL index.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db[RATE_LIMIT_COLLECTION]
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error("Error creating rate limit index: %s", e)
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        now = time.time()
+        window = int(now // limit.period)
+        elapsed = now / limit.period - window
+        # Every expression sees the document as it was before this update
+        update = [{"$set": {
+            "previous": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$window", window]}, "then": "$previous"},
+                    {"case": {"$eq": ["$window", window - 1]}, "then": "$count"},
+                ],
+                "default": 0
+            }},
+            "count": {"$cond": [{"$eq": ["$window", window]}, {"$add": ["$count", 1]}, 1]},
+            "window": window,
+            "expires_at": datetime.fromtimestamp((window + 2) * limit.period, timezone.utc)
+        }}]
+        try:
+            document = await self.collection.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker created the document first
+            document = await self.collection.find_one_and_update(
+                {"_id": key}, update, return_document=ReturnDocument.AFTER
+            )
+        if document is None:
+            return 0.0
+
+        return sliding_window_wait(document["count"], document["previous"], elapsed, limit)
+
+
+class RateLimiter:
+    """Route limits checked against per-worker buckets and an optional shared store"""
+
+    def __init__(self, limits: Dict[Tuple[str, str], RateLimit], shared: Optional[RateLimitStore] = None,
+                 enabled: bool = True):
+        self.limits = limits
+        self.shared = shared
+        self.enabled = enabled
+        self.local = InMemoryRateLimitStore()
+
+    def limit_for(self, method: str, path: str) -> Optional[RateLimit]:
+        if not self.enabled:
+            return None
+        return self.limits.get((method, path.rstrip("/") or "/"))
+
+    async def check(self, route: str, client: str, limit: RateLimit) -> float:
+        """0 if the request may proceed, otherwise seconds the client should wait"""
+        key = f"{route}|{client}"
+        retry_after = self.local.take(key, limit)
+        if retry_after or self.shared is None:
+            return retry_after
+        try:
+            return await self.shared.hit(key, limit)
+        except Exception as e:
+            logger.error("Error checking shared rate limit: %s", e)
+            return 0.0
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 to clients over a route's limit, before routing"""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limiter.limit_for(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = f"{scope['method']} {scope['path'].rstrip('/')}"
+        client = scope.get("client")
+        retry_after = await self.limiter.check(route, client[0] if client else "unknown", limit)
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        RATE_LIMITED.labels(route).inc()
+        response = JSONResponse(
+            {"detail": "Too many requests, please try again later"},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
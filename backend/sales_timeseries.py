@@ -0,0 +1,148 @@
+"""
+Sales Time Series
+Revenue, order count and units sold per hour, day or week, with per-range caching
+
+Buckets start on the hour, at local midnight or on Monday at local midnight in the
+requested time zone, and are keyed by their start as a UTC instant. Totals of closed
+buckets are cached per (granularity, time zone) for TIMESERIES_CACHE_SECONDS and shared by
+every range that covers them, so a rolling window only queries the buckets it has not
+seen yet; the bucket still in progress is recomputed on every request from the orders
+created since it started, which the created_at index keeps cheap.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from cache import LocalCache
+from models import SalesBucket, SalesTimeseries
+
+GRANULARITIES = ("hour", "day", "week")
+
+# Longest series served, in buckets
+MAX_BUCKETS = 2000
+
+TIMESERIES_CACHE_SECONDS = 300
+
+# Range served when the request gives no start
+DEFAULT_RANGE = timedelta(days=30)
+
+
+def bucket_start(moment: datetime, granularity: str, tz: ZoneInfo) -> datetime:
+    """Start (UTC) of the bucket holding an instant, matching $dateTrunc with startOfWeek monday"""
+    local = moment.astimezone(tz)
+    if granularity == "hour":
+        local = local.replace(minute=0, second=0, microsecond=0)
+    else:
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        if granularity == "week":
+            local -= timedelta(days=local.weekday())
+        # Re-resolve the offset in case midnight and the instant straddle a DST change
+        local = local.replace(tzinfo=None).replace(tzinfo=tz)
+    return local.astimezone(timezone.utc)
+
+
+def next_bucket(start: datetime, granularity: str, tz: ZoneInfo) -> datetime:
+    """Start of the bucket after the one starting at `start`"""
+    if granularity == "hour":
+        return start + timedelta(hours=1)
+    local = start.astimezone(tz).replace(tzinfo=None)
+    local += timedelta(days=7 if granularity == "week" else 1)
+    return local.replace(tzinfo=tz).astimezone(timezone.utc)
+
+
+def bucket_starts(start: datetime, end: datetime, granularity: str, tz: ZoneInfo) -> List[datetime]:
+    """Starts of the buckets overlapping [start, end)"""
+    starts = []
+    current = bucket_start(start, granularity, tz)
+    while current < end:
+        starts.append(current)
+        current = next_bucket(current, granularity, tz)
+    return starts
+
+
+def _merge(rows: List[Dict], into: Dict[datetime, Dict]):
+    for row in rows:
+        bucket = into.setdefault(row["start"], {"orders": 0, "revenue": 0.0, "units": 0})
+        bucket["orders"] += row["orders"]
+        bucket["revenue"] += row["revenue"]
+        bucket["units"] += row["units"]
+
+
+def _runs(starts: List[datetime], missing: List[bool]) -> List[Tuple[int, int]]:
+    # [first, last] index pairs of consecutive missing buckets
+    runs: List[Tuple[int, int]] = []
+    for index, is_missing in enumerate(missing):
+        if not is_missing:
+            continue
+        if runs and runs[-1][1] == index - 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+class SalesTimeseriesService:
+    """Serves sales time series from the order repository, caching closed buckets"""
+
+    def __init__(self, cache_seconds: float = TIMESERIES_CACHE_SECONDS):
+        # (granularity, time zone) -> {bucket start: totals} for closed buckets
+        self.cache = LocalCache("sales_timeseries", ttl_seconds=cache_seconds, max_entries=256)
+
+    async def get(self, orders, start: Optional[datetime], end: Optional[datetime], granularity: str,
+                  tz_name: str = "UTC", now: Optional[datetime] = None) -> SalesTimeseries:
+        """Series for [start, end); raises ValueError for an unknown granularity or zone, or too many buckets
+
+        Without an end the series runs to the end of the current bucket, and without a start it
+        covers DEFAULT_RANGE before that.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+        try:
+            tz = ZoneInfo(tz_name)
+        except Exception:
+            raise ValueError(f"Unknown time zone: {tz_name}")
+        now = _utc(now or datetime.now(timezone.utc))
+        end = _utc(end) if end else next_bucket(bucket_start(now, granularity, tz), granularity, tz)
+        start = _utc(start) if start else bucket_start(end - DEFAULT_RANGE, granularity, tz)
+        if end <= start:
+            raise ValueError("end must be after start")
+        starts = bucket_starts(start, end, granularity, tz)
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f"Range spans more than {MAX_BUCKETS} {granularity} buckets")
+        ends = starts[1:] + [next_bucket(starts[-1], granularity, tz)]
+
+        # Only closed buckets the range covers entirely are cached; one cut short by the
+        # range, and the bucket in progress, are always recomputed
+        current = bucket_start(now, granularity, tz)
+        cacheable = [bucket >= start and bucket_end <= end and bucket_end <= current
+                     for bucket, bucket_end in zip(starts, ends)]
+        cached = self.cache.get((granularity, tz_name))
+        if cached is None:
+            cached = {}
+            self.cache.set((granularity, tz_name), cached)
+
+        buckets: Dict[datetime, Dict] = {}
+        missing = [not ok or bucket not in cached for bucket, ok in zip(starts, cacheable)]
+        for first, last in _runs(starts, missing):
+            run_start, run_end = max(starts[first], start), min(ends[last], end)
+            _merge(await orders.sales_timeseries(run_start, run_end, granularity, tz_name), buckets)
+        for bucket, ok in zip(starts, cacheable):
+            if ok:
+                # Filled in place so the entry keeps its original expiry
+                cached.setdefault(bucket, buckets.get(bucket, {"orders": 0, "revenue": 0.0, "units": 0}))
+                buckets[bucket] = cached[bucket]
+
+        empty = {"orders": 0, "revenue": 0.0, "units": 0}
+        return SalesTimeseries(
+            granularity=granularity,
+            timezone=tz_name,
+            start=start,
+            end=end,
+            buckets=[SalesBucket(start=bucket, **buckets.get(bucket, empty)) for bucket in starts]
+        )
+
+
+def _utc(moment: datetime) -> datetime:
+    # Naive datetimes are taken as UTC, like the stored timestamps
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
@@ -1,62 +1,323 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Header, UploadFile, File, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import Response, JSONResponse, FileResponse, StreamingResponse
+from email_validator import validate_email, EmailNotValidError
 import os
+import asyncio
+import csv
+import io
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Tuple
 import uuid
+import time
 from datetime import datetime, timezone, timedelta
-from enum import Enum
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
+from contextlib import asynccontextmanager
+from zoneinfo import ZoneInfo
+from functools import lru_cache
+from database import Database, MongoSettings, with_read_preference
+from cache import LocalCache, InvalidationBus
+from order_cache import OrderResponseCache, etag_matches
+from order_stream import OrderStreamHub, KEEPALIVE_SECONDS, sse_message
+from metrics import MetricsMiddleware, EMAIL_SEND_LATENCY, CONTENT_TYPE_LATEST, render_latest
+from tracing import tracer, TracingMiddleware
+from profiler import RequestProfiler, ProfilerSettings, ProfileStore, ProfilerMiddleware
+from rate_limit import RateLimiter, RateLimitMiddleware, MongoRateLimitStore, parse_limits
+from structured_logging import configure_logging, parse_sample_rates, RequestIdMiddleware
+from circuit_breaker import hyp_circuit
+from health import HealthChecker
+from models import (
+    OrderStatus, OrderCreate, Order, OrderUpdate, OrderHistoryPage, SalesTimeseries, StockLevel,
+    serialize_for_mongo, deserialize_from_mongo, normalize_email
+)
+from order_repository import OrderRepository, MongoOrderRepository, InMemoryOrderRepository
+from sales_timeseries import SalesTimeseriesService
+from order_expiry import PendingOrderSweeper
+from order_archive import OrderArchive, MongoOrderArchive, FileOrderArchive, OrderArchiver
+from invoices import InvoiceRenderer, INVOICE_STATUSES, invoice_filename
+from inventory import (
+    InventoryStore, MongoInventoryStore, InMemoryInventoryStore, InventoryConsumer, OutOfStockError,
+    run_reservation_expiry
+)
+from order_events import (
+    OrderEventType, OrderEventDispatcher, MongoOrderEventStore, InMemoryOrderEventStore,
+    OrderConfirmationEmailConsumer, ShippingNotificationConsumer, OrderRollupConsumer, WebhookConsumer
+)
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Tracing is configured through TRACE_EXPORTER, TRACE_FILE and TRACE_SAMPLE_RATE
+tracer.configure_from_env()
+
+# Logs are written by a background thread, as JSON unless LOG_FORMAT=text. LOG_SAMPLE_RATES
+# keeps a fraction of chatty loggers' info lines, e.g. "hyp_client=0.1,email_service=0.25"
+configure_logging(
+    os.environ.get('LOG_LEVEL', 'INFO'),
+    os.environ.get('LOG_FORMAT', 'json').lower(),
+    parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', ''))
+)
+
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-this-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# Customer order history tokens carry this scope and are never accepted as admin tokens
+CUSTOMER_TOKEN_SCOPE = "customer_orders"
+CUSTOMER_TOKEN_EXPIRE_MINUTES = 60
+CUSTOMER_ORDERS_URL = os.environ.get('CUSTOMER_ORDERS_URL', 'https://unseen.il/my-orders')
+
+# EventSource cannot send headers, so admin streams are opened with a token of this scope
+# in the query string instead of the admin token; it is only checked when connecting
+STREAM_TOKEN_SCOPE = "admin_stream"
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+
 # SendGrid Configuration
 SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
 SENDGRID_FROM_EMAIL = os.environ.get('SENDGRID_FROM_EMAIL')
 SENDGRID_FROM_NAME = os.environ.get('SENDGRID_FROM_NAME')
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+# Browsers' EventSource cannot send headers, so admin streams also accept ?token=
+optional_security = HTTPBearer(auto_error=False)
+
+# MongoDB connection; the Motor client is created on first use. Pool size, compression,
+# retries and the analytics read preference are set through MONGO_* variables
+MONGO_SETTINGS = MongoSettings.from_env()
+db = Database(
+    os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+    os.environ.get('DB_NAME', 'unseen'),
+    MONGO_SETTINGS
+)
+
+# Pooled connections opened by the startup warmup
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', '4'))
+
+# Order storage backend: "mongo" (default) or "memory" to keep orders in process
+ORDER_STORAGE = os.environ.get('ORDER_STORAGE', 'mongo')
+
+# Newsletter bulk import is written in chunks of this many upserts
+NEWSLETTER_IMPORT_CHUNK_SIZE = 1000
+
+# Request profiler; settings can be changed at runtime through /api/admin/profiler
+request_profiler = RequestProfiler(
+    ProfilerSettings.from_env(),
+    ProfileStore(Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles')))
+)
+PROFILER_SETTINGS_POLL_SECONDS = 10
+
+# Per-worker caches, kept consistent across uvicorn workers by the invalidation bus.
+# CACHE_INVALIDATION_MODE is auto (change streams, polling on a standalone server),
+# change_stream, poll or off; off by default with ORDER_STORAGE=memory, which keeps
+# orders in a single process anyway
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+invalidation_bus = InvalidationBus(
+    db,
+    mode=os.environ.get('CACHE_INVALIDATION_MODE', 'off' if ORDER_STORAGE == 'memory' else 'auto'),
+    poll_interval=float(os.environ.get('CACHE_INVALIDATION_POLL_SECONDS', '1'))
+)
+discount_code_cache = invalidation_bus.register(LocalCache('discount_codes', CACHE_TTL_SECONDS))
+admin_cache = invalidation_bus.register(LocalCache('admins', CACHE_TTL_SECONDS))
+
+# Serialized order lookups polled by confirmation pages, dropped on every order write
+order_response_cache = OrderResponseCache(
+    float(os.environ.get('ORDER_RESPONSE_CACHE_SECONDS', '60')),
+    int(os.environ.get('ORDER_RESPONSE_CACHE_SIZE', '10000'))
+)
+invalidation_bus.register(order_response_cache.responses)
+
+# Closed time-series buckets are cached per worker; later changes to old orders
+# (cancellations, refunds) show up once the entry expires
+sales_timeseries = SalesTimeseriesService(float(os.environ.get('SALES_TIMESERIES_CACHE_SECONDS', '300')))
+
+# Order side effects run from the order event outbox. ORDER_WEBHOOK_URLS is a
+# comma-separated list of endpoints that receive every order event
+ORDER_WEBHOOK_URLS = [url.strip() for url in os.environ.get('ORDER_WEBHOOK_URLS', '').split(',') if url.strip()]
+ORDER_EVENTS_POLL_SECONDS = float(os.environ.get('ORDER_EVENTS_POLL_SECONDS', '1'))
+
+# Stock is held for unpaid orders this long, and expired holds are released every
+# RESERVATION_RELEASE_SECONDS
+RESERVATION_TTL_MINUTES = float(os.environ.get('RESERVATION_TTL_MINUTES', '15'))
+RESERVATION_RELEASE_SECONDS = float(os.environ.get('RESERVATION_RELEASE_SECONDS', '30'))
+
+# Orders still awaiting payment after PENDING_ORDER_EXPIRY_HOURS are cancelled every
+# PENDING_ORDER_SWEEP_SECONDS, at most PENDING_ORDER_SWEEP_BATCHES batches of
+# PENDING_ORDER_SWEEP_BATCH_SIZE per run
+PENDING_ORDER_EXPIRY_HOURS = float(os.environ.get('PENDING_ORDER_EXPIRY_HOURS', '24'))
+PENDING_ORDER_SWEEP_SECONDS = float(os.environ.get('PENDING_ORDER_SWEEP_SECONDS', '300'))
+PENDING_ORDER_SWEEP_BATCH_SIZE = int(os.environ.get('PENDING_ORDER_SWEEP_BATCH_SIZE', '500'))
+PENDING_ORDER_SWEEP_BATCHES = int(os.environ.get('PENDING_ORDER_SWEEP_BATCHES', '20'))
+
+# Cold tier for old delivered and cancelled orders: ORDER_ARCHIVE is off (default), mongo
+# (orders_archive collection) or files (gzip JSONL under ORDER_ARCHIVE_DIR). Orders created
+# more than ORDER_ARCHIVE_AFTER_DAYS ago are moved every ORDER_ARCHIVE_INTERVAL_SECONDS
+ORDER_ARCHIVE = os.environ.get('ORDER_ARCHIVE', 'off')
+ORDER_ARCHIVE_DIR = Path(os.environ.get('ORDER_ARCHIVE_DIR', ROOT_DIR / 'order_archive'))
+ORDER_ARCHIVE_AFTER_DAYS = float(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', '180'))
+ORDER_ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ORDER_ARCHIVE_INTERVAL_SECONDS', '3600'))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', '1000'))
+
+# Invoices are rendered by INVOICE_WORKERS processes (default: up to 4) and cached
+# under INVOICE_DIR, one file per order version
+INVOICE_DIR = Path(os.environ.get('INVOICE_DIR', ROOT_DIR / 'invoices'))
+INVOICE_WORKERS = int(os.environ.get('INVOICE_WORKERS', '0')) or None
+
+# Public write endpoints are rate limited per client IP and route. RATE_LIMITS overrides
+# the limits in rate_limit.DEFAULT_RATE_LIMITS, e.g. "POST /api/orders=20/minute" (or
+# "=off"). RATE_LIMIT_STORE is memory (per worker, default), mongo (shared by all
+# workers on top of the per-worker limit) or off
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+rate_limiter = RateLimiter(
+    parse_limits(os.environ.get('RATE_LIMITS', '')),
+    shared=MongoRateLimitStore(db) if RATE_LIMIT_STORE == 'mongo' else None,
+    enabled=RATE_LIMIT_STORE != 'off'
+)
+
+# /readyz pings MongoDB with this timeout and reuses its result for READINESS_CACHE_SECONDS
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_CHECK_TIMEOUT_SECONDS', '1'))
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', '1'))
+
+# Payments fail fast after HYP_CIRCUIT_FAILURES consecutive gateway errors, for
+# HYP_CIRCUIT_RESET_SECONDS before one is tried again
+hyp_circuit.configure_from_env('HYP')
+
+def build_order_archive() -> Optional[OrderArchive]:
+    """Archive selected by ORDER_ARCHIVE, or None when archiving is off"""
+    if ORDER_ARCHIVE == 'files':
+        return FileOrderArchive(ORDER_ARCHIVE_DIR)
+    if ORDER_ARCHIVE == 'mongo' and ORDER_STORAGE != 'memory':
+        return MongoOrderArchive(db)
+    return None
+
+async def publish_order_changes(order_ids: List[str]):
+    """Drop changed orders from the order response cache in every worker
+
+    Only this worker's entries are dropped before the response; the broadcast to the others
+    runs in the background, so an order write never waits on the invalidation collection.
+    """
+    invalidation_bus.publish_many_nowait(order_response_cache.responses.name, order_ids)
+
+def build_order_repository() -> OrderRepository:
+    """Create the order storage backend selected by ORDER_STORAGE, with its event outbox and archive"""
+    if ORDER_STORAGE == 'memory':
+        repository = InMemoryOrderRepository(events=InMemoryOrderEventStore(), archive=build_order_archive())
+    else:
+        repository = MongoOrderRepository(
+            db,
+            analytics_read_preference=MONGO_SETTINGS.analytics_read_preference,
+            events=MongoOrderEventStore(db),
+            archive=build_order_archive()
+        )
+    repository.on_change = publish_order_changes
+    return repository
+
+def build_inventory() -> InventoryStore:
+    """Stock store matching the ORDER_STORAGE backend"""
+    if ORDER_STORAGE == 'memory':
+        return InMemoryInventoryStore(RESERVATION_TTL_MINUTES * 60)
+    return MongoInventoryStore(db, RESERVATION_TTL_MINUTES * 60)
+
+def build_order_event_dispatcher(repository: OrderRepository, inventory: InventoryStore) -> OrderEventDispatcher:
+    """Dispatcher delivering the repository's order events to emails, stock, rollups and webhooks"""
+    # email_service pulls in smtplib and ssl, so it is only imported when the app is built
+    from email_service import EmailService
+
+    dispatcher = OrderEventDispatcher(repository.events, poll_interval=ORDER_EVENTS_POLL_SECONDS)
+    consumers = [
+        ShippingNotificationConsumer(EmailService()),
+        InventoryConsumer(inventory)
+    ]
+    # Without SendGrid every send fails, so confirmation emails are not queued for retries
+    if SENDGRID_API_KEY:
+        consumers.append(OrderConfirmationEmailConsumer(send_order_confirmation_email))
+    if ORDER_STORAGE != 'memory':
+        consumers.append(OrderRollupConsumer(db))
+    consumers.extend(WebhookConsumer(url) for url in ORDER_WEBHOOK_URLS)
+    dispatcher.register(consumers)
+    return dispatcher
+
+def build_health_checker(dispatcher: OrderEventDispatcher) -> HealthChecker:
+    """Readiness checks over MongoDB, the HYP circuit and the email consumers' backlog"""
+    email_consumers = [
+        consumer.name for consumer in dispatcher.consumers
+        if isinstance(consumer, (OrderConfirmationEmailConsumer, ShippingNotificationConsumer))
+    ]
+    return HealthChecker(
+        db, dispatcher.store, hyp_circuit, email_consumers,
+        timeout_seconds=HEALTH_CHECK_TIMEOUT_SECONDS, ttl_seconds=READINESS_CACHE_SECONDS
+    )
+
+def get_order_repository(request: Request) -> OrderRepository:
+    """Order repository dependency"""
+    return request.app.state.order_repository
+
+def archived_before(orders: OrderRepository) -> Optional[datetime]:
+    """Delivered and cancelled orders created before this are in the archive, which analytics do not read"""
+    if orders.archive is None:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)
+
+def build_pending_order_sweeper(repository: OrderRepository, inventory: InventoryStore) -> PendingOrderSweeper:
+    """Sweeper cancelling abandoned pending_payment orders"""
+    return PendingOrderSweeper(
+        repository,
+        inventory,
+        max_age_seconds=PENDING_ORDER_EXPIRY_HOURS * 3600,
+        batch_size=PENDING_ORDER_SWEEP_BATCH_SIZE,
+        max_batches=PENDING_ORDER_SWEEP_BATCHES
+    )
+
+def build_order_archiver(repository: OrderRepository) -> Optional[OrderArchiver]:
+    """Job moving old orders into the repository's archive, if it has one"""
+    if repository.archive is None:
+        return None
+    return OrderArchiver(
+        repository,
+        repository.archive,
+        after_days=ORDER_ARCHIVE_AFTER_DAYS,
+        batch_size=ORDER_ARCHIVE_BATCH_SIZE
+    )
+
+def get_inventory(request: Request) -> InventoryStore:
+    """Inventory store dependency"""
+    return request.app.state.inventory
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+def get_invoice_renderer(request: Request) -> InvoiceRenderer:
+    """Invoice renderer dependency"""
+    return request.app.state.invoices
 
-# Create the main app without a prefix
-app = FastAPI()
+def get_order_stream(request: Request) -> OrderStreamHub:
+    """Live order event fan-out dependency"""
+    return request.app.state.order_stream
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # ==================== AUTHENTICATION UTILITIES ====================
 
+@lru_cache(maxsize=None)
+def password_context():
+    """Password hashing context, built on first use"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -66,22 +327,56 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def is_admin_token(token: str) -> bool:
+    """Check that a JWT access token is valid without a database lookup"""
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload.get("sub") is not None and payload.get("scope") is None
+    except JWTError:
+        return False
+
 async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Verify JWT token and return admin user"""
+    return await authenticate_admin(credentials.credentials)
+
+async def get_current_admin_for_stream(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    token: Optional[str] = Query(None, description="Stream token from POST /api/admin/stream-token, for EventSource clients")
+) -> dict:
+    """get_current_admin, also accepting a stream token (never an access token) as a query parameter"""
+    if credentials:
+        return await authenticate_admin(credentials.credentials)
+    return await authenticate_admin(token or "", scope=STREAM_TOKEN_SCOPE)
+
+def create_stream_token(username: str) -> str:
+    """Short-lived token that only opens admin event streams"""
+    return create_access_token(
+        data={"sub": username, "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+
+async def authenticate_admin(token: str, scope: Optional[str] = None) -> dict:
+    """Admin user for an access token (or a token of `scope`), or 401"""
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("scope") != scope:
             raise credentials_exception
         
-        # Verify admin exists in database
-        admin = await db.admins.find_one({"username": username}, {"_id": 0})
+        # Verify admin exists; principals are cached and invalidated when admins change
+        admin = await admin_cache.get_or_load(
+            username,
+            lambda: db.admins.find_one({"username": username}, {"_id": 0})
+        )
         if admin is None:
             raise credentials_exception
         
@@ -89,20 +384,31 @@ async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(
     except JWTError:
         raise credentials_exception
 
+def create_customer_token(email: str) -> str:
+    """Short-lived token giving access to one customer's order history"""
+    return create_access_token(
+        data={"sub": normalize_email(email), "scope": CUSTOMER_TOKEN_SCOPE},
+        expires_delta=timedelta(minutes=CUSTOMER_TOKEN_EXPIRE_MINUTES)
+    )
 
+async def get_current_customer(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Verify a customer token and return the customer's normalized email"""
+    from jose import JWTError, jwt
+
+    credentials_exception = HTTPException(
+        status_code=401,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("scope") != CUSTOMER_TOKEN_SCOPE or not payload.get("sub"):
+        raise credentials_exception
+    return payload["sub"]
 
-# Define Enums
-class OrderStatus(str, Enum):
-    PENDING_PAYMENT = "pending_payment"
-    PAYMENT_CONFIRMED = "payment_confirmed"
-    PROCESSING = "processing"
-    SHIPPED = "shipped"
-    DELIVERED = "delivered"
-    CANCELLED = "cancelled"
 
-class ShippingMethod(str, Enum):
-    STANDARD = "standard"
-    EXPRESS = "express"
 
 # Discount Code Models
 class DiscountCode(BaseModel):
@@ -180,77 +486,6 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
-# Order Item Model
-class OrderItem(BaseModel):
-    product_id: str
-    name: str
-    price: float
-    quantity: int
-    selected_size: str
-    selected_color: str
-    image: Optional[str] = None
-
-# Customer Information Model
-class CustomerInfo(BaseModel):
-    first_name: str
-    last_name: str
-    email: EmailStr
-    phone: str
-
-# Shipping Address Model
-class ShippingAddress(BaseModel):
-    address: str
-    city: str
-    postal_code: str
-    country: str = "Israel"
-
-# Payment Information Model (for mock)
-class PaymentInfo(BaseModel):
-    card_last_four: str
-    card_name: str
-    payment_method: str = "credit_card"
-
-# Order Create Model
-class OrderCreate(BaseModel):
-    customer_info: CustomerInfo
-    shipping_address: ShippingAddress
-    items: List[OrderItem]
-    shipping_method: ShippingMethod
-    shipping_cost: float
-    subtotal: float
-    total: float
-    payment_info: PaymentInfo
-    discount_code: Optional[str] = None
-    discount_amount: float = 0
-
-# Order Response Model
-class Order(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    order_number: str = Field(default_factory=lambda: f"ORD-{uuid.uuid4().hex[:8].upper()}")
-    customer_info: CustomerInfo
-    shipping_address: ShippingAddress
-    items: List[OrderItem]
-    shipping_method: ShippingMethod
-    shipping_cost: float
-    subtotal: float
-    total: float
-    payment_info: PaymentInfo
-    discount_code: Optional[str] = None
-    discount_amount: float = 0
-    status: OrderStatus = OrderStatus.PENDING_PAYMENT
-    payment_transaction_id: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    notes: Optional[str] = None
-
-# Order Update Model
-class OrderUpdate(BaseModel):
-    status: Optional[OrderStatus] = None
-    notes: Optional[str] = None
-    payment_transaction_id: Optional[str] = None
-
 # Payment Mock Model
 class PaymentRequest(BaseModel):
     order_id: str
@@ -266,6 +501,38 @@ class PaymentResponse(BaseModel):
     message: str
     order_id: str
 
+# Customer Order History Models
+class CustomerLoginLinkRequest(BaseModel):
+    email: EmailStr
+
+class CustomerOrderLogin(BaseModel):
+    order_number: str
+    email: EmailStr
+
+class CustomerTokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int = CUSTOMER_TOKEN_EXPIRE_MINUTES * 60
+
+class StreamTokenResponse(BaseModel):
+    token: str
+    expires_in: int = STREAM_TOKEN_EXPIRE_SECONDS
+
+# Inventory Models
+class StockUpdate(BaseModel):
+    quantity: int = Field(..., ge=0)
+
+class StockAdjustment(BaseModel):
+    delta: int
+
+# Profiler Models
+class ProfilerSettingsUpdate(BaseModel):
+    """Profiler settings to change; omitted fields keep their current value"""
+    enabled: Optional[bool] = None
+    threshold_ms: Optional[float] = Field(None, ge=0)
+    interval_ms: Optional[float] = Field(None, ge=1, le=1000)
+    max_files: Optional[int] = Field(None, ge=1, le=100_000)
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -277,41 +544,52 @@ async def root():
 async def subscribe_to_newsletter(subscription: NewsletterSubscribe):
     """Subscribe to newsletter and receive welcome email with UNSEEN FAM code"""
     try:
-        # Check if already subscribed
-        existing = await db.newsletter_subscribers.find_one({"email": subscription.email}, {"_id": 0})
-        if existing:
-            return {
-                "success": True,
-                "message": "You're already subscribed to our newsletter!",
-                "already_subscribed": True
-            }
+        email = normalize_email(subscription.email)
         
         # Create subscriber
         subscriber = NewsletterSubscriber(
-            email=subscription.email,
+            email=email,
             name=subscription.name
         )
         
         subscriber_dict = subscriber.model_dump()
         subscriber_dict = serialize_for_mongo(subscriber_dict)
         
-        # Save to database
-        await db.newsletter_subscribers.insert_one(subscriber_dict)
+        # Single upsert against the unique email index: only the request that
+        # actually inserts the document gets to send the welcome email
+        from pymongo.errors import DuplicateKeyError
+        try:
+            result = await db.newsletter_subscribers.update_one(
+                {"email": email},
+                {"$setOnInsert": subscriber_dict},
+                upsert=True
+            )
+            inserted = result.upserted_id is not None
+        except DuplicateKeyError:
+            # A concurrent signup for the same address won the insert
+            inserted = False
+        
+        if not inserted:
+            return {
+                "success": True,
+                "message": "You're already subscribed to our newsletter!",
+                "already_subscribed": True
+            }
         
         # Send welcome email with discount code
         email_sent = await send_newsletter_welcome_email(
-            subscription.email,
+            email,
             subscription.name
         )
         
         if email_sent:
             # Update that welcome email was sent
             await db.newsletter_subscribers.update_one(
-                {"email": subscription.email},
+                {"email": email},
                 {"$set": {"welcome_email_sent": True}}
             )
         
-        logger.info(f"New newsletter subscriber: {subscription.email}")
+        logger.info("New newsletter subscriber: %s", email)
         
         return {
             "success": True,
@@ -319,13 +597,97 @@ async def subscribe_to_newsletter(subscription: NewsletterSubscribe):
             "already_subscribed": False
         }
     except Exception as e:
-        logger.error(f"Error subscribing to newsletter: {str(e)}")
+        logger.error("Error subscribing to newsletter: %s", e)
         raise HTTPException(status_code=500, detail="Failed to subscribe to newsletter")
 
+@api_router.post("/admin/newsletter/import", response_model=dict)
+async def import_newsletter_subscribers(file: UploadFile = File(...), admin: dict = Depends(get_current_admin)):
+    """Bulk import newsletter subscribers from a CSV file (admin only)
+
+    The CSV needs an ``email`` column and may have a ``name`` column. Rows are
+    upserted in unordered ``bulk_write`` chunks, so existing subscribers are left
+    untouched and no welcome emails are sent for imported addresses.
+    """
+    from pymongo import UpdateOne
+
+    content = await file.read()
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+    
+    reader = csv.DictReader(io.StringIO(text))
+    fieldnames = {name.strip().lower(): name for name in (reader.fieldnames or [])}
+    if 'email' not in fieldnames:
+        raise HTTPException(status_code=400, detail="CSV file must have an 'email' column")
+    email_field = fieldnames['email']
+    name_field = fieldnames.get('name')
+    
+    stats = {"rows": 0, "inserted": 0, "existing": 0, "invalid": 0, "duplicates": 0}
+    imported_at = datetime.now(timezone.utc).isoformat()
+    seen = set()
+    operations = []
+    
+    for row in reader:
+        stats["rows"] += 1
+        raw_email = (row.get(email_field) or '').strip()
+        try:
+            email = normalize_email(validate_email(raw_email, check_deliverability=False).normalized)
+        except EmailNotValidError:
+            stats["invalid"] += 1
+            continue
+        
+        if email in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(email)
+        
+        name = (row.get(name_field) or '').strip() if name_field else ''
+        subscriber_dict = {
+            "id": str(uuid.uuid4()),
+            "email": email,
+            "name": name or None,
+            "subscribed_at": imported_at,
+            "welcome_email_sent": False
+        }
+        operations.append(UpdateOne({"email": email}, {"$setOnInsert": subscriber_dict}, upsert=True))
+        
+        if len(operations) >= NEWSLETTER_IMPORT_CHUNK_SIZE:
+            await _write_newsletter_chunk(operations, stats)
+            operations = []
+    
+    if operations:
+        await _write_newsletter_chunk(operations, stats)
+    
+    logger.info("Newsletter import by %s: %s", admin['username'], stats)
+    return {"message": "Newsletter import completed", **stats}
+
+async def _write_newsletter_chunk(operations: list, stats: dict):
+    """Upsert one chunk of imported subscribers and tally the outcome"""
+    from pymongo.errors import BulkWriteError
+
+    try:
+        result = await db.newsletter_subscribers.bulk_write(operations, ordered=False)
+        stats["inserted"] += result.upserted_count
+        stats["existing"] += result.matched_count
+    except BulkWriteError as e:
+        # Concurrent inserts of the same address surface as duplicate key errors;
+        # those rows are already subscribed, anything else is a real failure
+        details = e.details
+        stats["inserted"] += details.get('nUpserted', 0)
+        stats["existing"] += details.get('nMatched', 0)
+        errors = details.get('writeErrors', [])
+        if any(error.get('code') != 11000 for error in errors):
+            logger.error("Error importing newsletter subscribers: %s", errors[:5])
+            raise HTTPException(status_code=500, detail="Failed to import newsletter subscribers")
+        stats["existing"] += len(errors)
+
 @api_router.get("/admin/newsletter/subscribers", response_model=List[dict])
 async def list_newsletter_subscribers(admin: dict = Depends(get_current_admin)):
     """List all newsletter subscribers (admin only)"""
-    subscribers = await db.newsletter_subscribers.find({}, {"_id": 0}).sort("subscribed_at", -1).to_list(1000)
+    # Export read: may be served by a secondary
+    subscribers_collection = with_read_preference(db.newsletter_subscribers, MONGO_SETTINGS.analytics_read_preference)
+    subscribers = await subscribers_collection.find({}, {"_id": 0}).sort("subscribed_at", -1).to_list(1000)
     for sub in subscribers:
         sub = deserialize_from_mongo(sub)
     return subscribers
@@ -349,8 +711,9 @@ async def setup_admin(admin_data: AdminLogin):
     admin_dict['created_at'] = admin_dict['created_at'].isoformat()
     
     await db.admins.insert_one(admin_dict)
+    await invalidation_bus.publish('admins', admin_data.username)
     
-    logger.info(f"Admin user created: {admin_data.username}")
+    logger.info("Admin user created: %s", admin_data.username)
     return {"message": "Admin user created successfully", "username": admin_data.username}
 
 @api_router.post("/admin/login", response_model=AdminLoginResponse)
@@ -368,7 +731,7 @@ async def admin_login(login_data: AdminLogin):
     # Create access token
     access_token = create_access_token(data={"sub": admin['username']})
     
-    logger.info(f"Admin logged in: {admin['username']}")
+    logger.info("Admin logged in: %s", admin['username'])
     return AdminLoginResponse(
         access_token=access_token,
         username=admin['username']
@@ -385,10 +748,11 @@ async def verify_admin(admin: dict = Depends(get_current_admin)):
 async def validate_discount_code(validation: DiscountCodeValidation):
     """Validate a discount code"""
     try:
-        # Find discount code
-        code = await db.discount_codes.find_one(
-            {"code": validation.code.upper(), "active": True},
-            {"_id": 0}
+        # Find discount code; misses are cached too, creating a code invalidates them
+        code_key = validation.code.upper()
+        code = await discount_code_cache.get_or_load(
+            code_key,
+            lambda: db.discount_codes.find_one({"code": code_key, "active": True}, {"_id": 0})
         )
         
         if not code:
@@ -437,7 +801,7 @@ async def validate_discount_code(validation: DiscountCodeValidation):
             code=code['code']
         )
     except Exception as e:
-        logger.error(f"Error validating discount code: {str(e)}")
+        logger.error("Error validating discount code: %s", e)
         return DiscountCodeResponse(
             valid=False,
             message="Error validating discount code"
@@ -466,13 +830,14 @@ async def create_discount_code(code_data: DiscountCodeCreate, admin: dict = Depe
         code_dict = serialize_for_mongo(code_dict)
         
         await db.discount_codes.insert_one(code_dict)
+        await invalidation_bus.publish('discount_codes', discount_code.code)
         
-        logger.info(f"Discount code created by {admin['username']}: {code_data.code}")
+        logger.info("Discount code created by %s: %s", admin['username'], code_data.code)
         return {"message": "Discount code created successfully", "code": code_data.code.upper()}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating discount code: {str(e)}")
+        logger.error("Error creating discount code: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create discount code")
 
 @api_router.get("/admin/discount-codes", response_model=List[dict])
@@ -489,8 +854,9 @@ async def delete_discount_code(code: str, admin: dict = Depends(get_current_admi
     result = await db.discount_codes.delete_one({"code": code.upper()})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Discount code not found")
+    await invalidation_bus.publish('discount_codes', code.upper())
     
-    logger.info(f"Discount code deleted by {admin['username']}: {code}")
+    logger.info("Discount code deleted by %s: %s", admin['username'], code)
     return {"message": "Discount code deleted successfully"}
 
 @api_router.post("/admin/discount-codes/create-sample")
@@ -531,6 +897,7 @@ async def create_sample_discount_codes(admin: dict = Depends(get_current_admin))
             code_dict = discount_code.model_dump()
             code_dict = serialize_for_mongo(code_dict)
             await db.discount_codes.insert_one(code_dict)
+            await invalidation_bus.publish('discount_codes', code_data["code"])
             created.append(code_data["code"])
     
     return {"message": "Sample discount codes created", "codes": created}
@@ -553,8 +920,9 @@ async def create_admin(admin_data: AdminLogin, current_admin: dict = Depends(get
     admin_dict['created_at'] = admin_dict['created_at'].isoformat()
     
     await db.admins.insert_one(admin_dict)
+    await invalidation_bus.publish('admins', admin_data.username)
     
-    logger.info(f"New admin user created by {current_admin['username']}: {admin_data.username}")
+    logger.info("New admin user created by %s: %s", current_admin['username'], admin_data.username)
     return {"message": "Admin user created successfully", "username": admin_data.username}
 
 @api_router.post("/admin/change-password", response_model=dict)
@@ -571,8 +939,9 @@ async def change_password(password_data: dict, current_admin: dict = Depends(get
         {"username": current_admin['username']},
         {"$set": {"password_hash": new_hash}}
     )
+    await invalidation_bus.publish('admins', current_admin['username'])
     
-    logger.info(f"Admin password changed: {current_admin['username']}")
+    logger.info("Admin password changed: %s", current_admin['username'])
     return {"message": "Password changed successfully"}
 
 @api_router.delete("/admin/delete/{username}")
@@ -584,8 +953,9 @@ async def delete_admin(username: str, current_admin: dict = Depends(get_current_
     result = await db.admins.delete_one({"username": username})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Admin user not found")
+    await invalidation_bus.publish('admins', username)
     
-    logger.info(f"Admin user deleted by {current_admin['username']}: {username}")
+    logger.info("Admin user deleted by %s: %s", current_admin['username'], username)
     return {"message": "Admin user deleted successfully", "username": username}
 
 @api_router.post("/status", response_model=StatusCheck)
@@ -614,32 +984,18 @@ async def get_status_checks():
 
 # ==================== ORDER MANAGEMENT ENDPOINTS ====================
 
-# Helper function to serialize datetime for MongoDB
-def serialize_for_mongo(data: dict) -> dict:
-    """Convert datetime objects to ISO strings for MongoDB storage"""
-    for key, value in data.items():
-        if isinstance(value, datetime):
-            data[key] = value.isoformat()
-        elif isinstance(value, dict):
-            data[key] = serialize_for_mongo(value)
-        elif isinstance(value, list):
-            data[key] = [serialize_for_mongo(item) if isinstance(item, dict) else item for item in value]
-    return data
-
-# Helper function to deserialize from MongoDB
-def deserialize_from_mongo(data: dict) -> dict:
-    """Convert ISO string timestamps back to datetime objects"""
-    for key, value in data.items():
-        if key in ['created_at', 'updated_at', 'timestamp'] and isinstance(value, str):
-            try:
-                data[key] = datetime.fromisoformat(value)
-            except ValueError:
-                pass
-        elif isinstance(value, dict):
-            data[key] = deserialize_from_mongo(value)
-        elif isinstance(value, list):
-            data[key] = [deserialize_from_mongo(item) if isinstance(item, dict) else item for item in value]
-    return data
+# Helper function to send through SendGrid while recording latency and a trace span
+def timed_sendgrid_send(sg, message, email_type: str):
+    """Send a SendGrid message and record its latency and outcome"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.start_span("sendgrid.send", email_type=email_type):
+            response = sg.send(message)
+        outcome = "success"
+        return response
+    finally:
+        EMAIL_SEND_LATENCY.labels(email_type, outcome).observe(time.perf_counter() - start)
 
 # SendGrid Email Service
 async def send_order_confirmation_email(order: Order):
@@ -763,6 +1119,7 @@ async def send_order_confirmation_email(order: Order):
         """
         
         # Create SendGrid message
+        from sendgrid.helpers.mail import Mail, Email, To, Content
         message = Mail(
             from_email=Email(SENDGRID_FROM_EMAIL, SENDGRID_FROM_NAME),
             to_emails=To(order.customer_info.email),
@@ -773,19 +1130,20 @@ async def send_order_confirmation_email(order: Order):
         
         # Send email
         if SENDGRID_API_KEY:
+            from sendgrid import SendGridAPIClient
             sg = SendGridAPIClient(SENDGRID_API_KEY)
-            response = sg.send(message)
-            logger.info(f"Order confirmation email sent to {order.customer_info.email} - Status: {response.status_code}")
+            response = timed_sendgrid_send(sg, message, "order_confirmation")
+            logger.info("Order confirmation email sent to %s - Status: %s", order.customer_info.email, response.status_code)
             return True
         else:
             logger.warning("SendGrid API key not configured. Email not sent.")
             return False
             
     except Exception as e:
-        logger.error(f"Error sending order confirmation email: {str(e)}")
+        logger.error("Error sending order confirmation email: %s", e)
         # Log more details for debugging
         if hasattr(e, 'body'):
-            logger.error(f"SendGrid error details: {e.body}")
+            logger.error("SendGrid error details: %s", e.body)
         return False
 
 # Newsletter Welcome Email
@@ -917,6 +1275,7 @@ async def send_newsletter_welcome_email(subscriber_email: str, subscriber_name:
         """
         
         # Create SendGrid message
+        from sendgrid.helpers.mail import Mail, Email, To, Content
         message = Mail(
             from_email=Email(SENDGRID_FROM_EMAIL, SENDGRID_FROM_NAME),
             to_emails=To(subscriber_email),
@@ -927,24 +1286,75 @@ async def send_newsletter_welcome_email(subscriber_email: str, subscriber_name:
         
         # Send email
         if SENDGRID_API_KEY:
+            from sendgrid import SendGridAPIClient
             sg = SendGridAPIClient(SENDGRID_API_KEY)
-            response = sg.send(message)
-            logger.info(f"Newsletter welcome email sent to {subscriber_email} - Status: {response.status_code}")
+            response = timed_sendgrid_send(sg, message, "newsletter_welcome")
+            logger.info("Newsletter welcome email sent to %s - Status: %s", subscriber_email, response.status_code)
             return True
         else:
             logger.warning("SendGrid API key not configured. Welcome email not sent.")
             return False
             
     except Exception as e:
-        logger.error(f"Error sending newsletter welcome email: {str(e)}")
+        logger.error("Error sending newsletter welcome email: %s", e)
+        if hasattr(e, 'body'):
+            logger.error("SendGrid error details: %s", e.body)
+        return False
+
+# Customer Order History Sign-in Email
+async def send_customer_login_email(customer_email: str, link: str):
+    """Send the order history sign-in link via SendGrid"""
+    try:
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <h2>Your UNSEEN IL orders</h2>
+            <p>Use the button below to see your orders. The link works for {CUSTOMER_TOKEN_EXPIRE_MINUTES} minutes.</p>
+            <p><a href="{link}" style="display: inline-block; padding: 12px 24px; background-color: #0A0A0A; color: #FFFFFF; text-decoration: none;">View my orders</a></p>
+            <p>If you did not ask for this link, you can ignore this email.</p>
+        </body>
+        </html>
+        """
+        text_content = f"""
+        View your UNSEEN IL orders: {link}
+
+        The link works for {CUSTOMER_TOKEN_EXPIRE_MINUTES} minutes. If you did not ask for it, you can ignore this email.
+        """
+
+        from sendgrid.helpers.mail import Mail, Email, To, Content
+        message = Mail(
+            from_email=Email(SENDGRID_FROM_EMAIL, SENDGRID_FROM_NAME),
+            to_emails=To(customer_email),
+            subject='Your UNSEEN IL orders',
+            plain_text_content=Content("text/plain", text_content),
+            html_content=Content("text/html", html_content)
+        )
+
+        if SENDGRID_API_KEY:
+            from sendgrid import SendGridAPIClient
+            sg = SendGridAPIClient(SENDGRID_API_KEY)
+            response = timed_sendgrid_send(sg, message, "customer_login")
+            logger.info("Order history sign-in link sent to %s - Status: %s", customer_email, response.status_code)
+            return True
+        else:
+            logger.warning("SendGrid API key not configured. Sign-in link not sent.")
+            return False
+
+    except Exception as e:
+        logger.error("Error sending order history sign-in email: %s", e)
         if hasattr(e, 'body'):
-            logger.error(f"SendGrid error details: {e.body}")
+            logger.error("SendGrid error details: %s", e.body)
         return False
 
 # Create Order
 @api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate):
-    """Create a new order"""
+async def create_order(
+    order_data: OrderCreate,
+    orders: OrderRepository = Depends(get_order_repository),
+    inventory: InventoryStore = Depends(get_inventory)
+):
+    """Create a new order, holding its stock until it is paid"""
     try:
         # Create order object
         order = Order(
@@ -959,43 +1369,95 @@ async def create_order(order_data: OrderCreate):
             status=OrderStatus.PENDING_PAYMENT
         )
         
-        # Convert to dict and serialize datetime to ISO string for MongoDB
-        order_dict = order.model_dump()
-        order_dict = serialize_for_mongo(order_dict)
+        # Hold stock before the order exists, so a sold-out SKU never produces an order
+        await inventory.reserve(order.id, order.items)
         
-        # Save to database
-        await db.orders.insert_one(order_dict)
+        # Save to database; the confirmation email is sent from the order.created event
+        try:
+            await orders.create(order)
+        except Exception:
+            await inventory.release(order.id)
+            raise
         
-        # Send confirmation email (mock)
-        await send_order_confirmation_email(order)
-        
-        logger.info(f"Order created successfully: {order.order_number}")
+        logger.info("Order created successfully: %s", order.order_number)
         return order
+    except OutOfStockError as e:
+        logger.info("Order rejected: %s", e)
+        raise HTTPException(status_code=409, detail={"message": "Some items are out of stock", "skus": e.skus})
     except Exception as e:
-        logger.error(f"Error creating order: {str(e)}")
+        logger.error("Error creating order: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to create order: {str(e)}")
 
+def order_response(entry: Optional[Tuple[str, bytes]], if_none_match: Optional[str]) -> Response:
+    """Cached order body with its ETag, or 304 when the client already has this version"""
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    etag, body = entry
+    # Browsers revalidate on every poll instead of reusing a stale copy
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # Get Order by ID
 @api_router.get("/orders/{order_id}", response_model=Order)
-async def get_order(order_id: str):
+async def get_order(
+    order_id: str,
+    if_none_match: Optional[str] = Header(None),
+    orders: OrderRepository = Depends(get_order_repository)
+):
     """Get order by ID"""
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order = deserialize_from_mongo(order)
-    return Order(**order)
+    entry = await order_response_cache.get(order_id, lambda: orders.get_by_id(order_id))
+    return order_response(entry, if_none_match)
 
 # Get Order by Order Number
 @api_router.get("/orders/number/{order_number}", response_model=Order)
-async def get_order_by_number(order_number: str):
+async def get_order_by_number(
+    order_number: str,
+    if_none_match: Optional[str] = Header(None),
+    orders: OrderRepository = Depends(get_order_repository)
+):
     """Get order by order number"""
-    order = await db.orders.find_one({"order_number": order_number}, {"_id": 0})
-    if not order:
+    entry = await order_response_cache.get_by_number(order_number, lambda: orders.get_by_number(order_number))
+    return order_response(entry, if_none_match)
+
+async def order_event_stream(hub: OrderStreamHub, order_id: Optional[str] = None, snapshot=None):
+    """Server-sent events from the order stream hub, after an optional order.snapshot"""
+    with hub.subscribe(order_id) as subscription:
+        # Subscribed first, so no change between the snapshot and the stream is lost
+        if snapshot is not None:
+            entry = await snapshot()
+            if entry is not None:
+                yield sse_message("order.snapshot", entry[1].decode())
+        while not subscription.overflowed:
+            event = await subscription.next(KEEPALIVE_SECONDS)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_message(event["type"], event, event["id"])
+            if order_id is not None and event["type"] == OrderEventType.DELETED.value:
+                break
+
+def event_stream_response(events) -> StreamingResponse:
+    """text/event-stream response; X-Accel-Buffering stops nginx from holding events back"""
+    return StreamingResponse(
+        events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Live Order Status
+@api_router.get("/orders/{order_id}/events")
+async def stream_order_events(
+    order_id: str,
+    orders: OrderRepository = Depends(get_order_repository),
+    hub: OrderStreamHub = Depends(get_order_stream)
+):
+    """Server-sent events for one order: an order.snapshot, then each change to it"""
+    async def snapshot():
+        return await order_response_cache.get(order_id, lambda: orders.get_by_id(order_id))
+
+    if await snapshot() is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    order = deserialize_from_mongo(order)
-    return Order(**order)
+    return event_stream_response(order_event_stream(hub, order_id, snapshot))
 
 # List All Orders
 @api_router.get("/orders", response_model=List[Order])
@@ -1003,31 +1465,16 @@ async def list_orders(
     status: Optional[OrderStatus] = Query(None, description="Filter by order status"),
     customer_email: Optional[str] = Query(None, description="Filter by customer email"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of orders to return"),
-    skip: int = Query(0, ge=0, description="Number of orders to skip")
+    skip: int = Query(0, ge=0, description="Number of orders to skip"),
+    orders: OrderRepository = Depends(get_order_repository)
 ):
     """List all orders with optional filters"""
-    query = {}
-    
-    if status:
-        query["status"] = status.value
-    if customer_email:
-        query["customer_info.email"] = customer_email
-    
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    
-    for order in orders:
-        order = deserialize_from_mongo(order)
-    
-    return [Order(**order) for order in orders]
+    return await orders.list(status=status, customer_email=customer_email, skip=skip, limit=limit)
 
 # Update Order Status
 @api_router.patch("/orders/{order_id}", response_model=Order)
-async def update_order(order_id: str, update_data: OrderUpdate):
-    """Update order status and notes"""
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
+async def update_order(order_id: str, update_data: OrderUpdate, orders: OrderRepository = Depends(get_order_repository)):
+    """Update order status, notes and tracking details"""
     update_fields = {}
     if update_data.status:
         update_fields["status"] = update_data.status.value
@@ -1035,46 +1482,143 @@ async def update_order(order_id: str, update_data: OrderUpdate):
         update_fields["notes"] = update_data.notes
     if update_data.payment_transaction_id:
         update_fields["payment_transaction_id"] = update_data.payment_transaction_id
+    if update_data.tracking_number:
+        update_fields["tracking_number"] = update_data.tracking_number
     
-    update_fields["updated_at"] = datetime.now(timezone.utc).isoformat()
-    
-    await db.orders.update_one({"id": order_id}, {"$set": update_fields})
-    
-    # Get updated order
-    updated_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    updated_order = deserialize_from_mongo(updated_order)
+    updated_order = await orders.update(order_id, update_fields)
+    if not updated_order:
+        raise HTTPException(status_code=404, detail="Order not found")
     
-    logger.info(f"Order {order_id} updated successfully")
-    return Order(**updated_order)
+    logger.info("Order %s updated successfully", order_id)
+    return updated_order
 
 # Delete Order (Admin only)
 @api_router.delete("/orders/{order_id}")
-async def delete_order(order_id: str):
+async def delete_order(order_id: str, orders: OrderRepository = Depends(get_order_repository)):
     """Delete an order"""
-    result = await db.orders.delete_one({"id": order_id})
-    if result.deleted_count == 0:
+    if not await orders.delete(order_id):
         raise HTTPException(status_code=404, detail="Order not found")
     
-    logger.info(f"Order {order_id} deleted successfully")
+    logger.info("Order %s deleted successfully", order_id)
     return {"message": "Order deleted successfully", "order_id": order_id}
 
-# ==================== PAYMENT MOCK ENDPOINTS ====================
+# ==================== INVENTORY ENDPOINTS ====================
 
-# Import HYP client
-from hyp_client import hyp_client
+@api_router.get("/inventory/{product_id}", response_model=List[StockLevel])
+async def get_product_stock(product_id: str, inventory: InventoryStore = Depends(get_inventory)):
+    """Available units per size and color of a product; untracked variants are not listed"""
+    return await inventory.stock(product_id)
+
+@api_router.get("/admin/inventory", response_model=List[StockLevel])
+async def list_stock(
+    product_id: Optional[str] = Query(None, description="Only this product's variants"),
+    admin: dict = Depends(get_current_admin),
+    inventory: InventoryStore = Depends(get_inventory)
+):
+    """Stock levels of all tracked SKUs (admin only)"""
+    return await inventory.stock(product_id)
+
+@api_router.put("/admin/inventory/{product_id}/{size}/{color}", response_model=StockLevel)
+async def set_stock(
+    product_id: str,
+    size: str,
+    color: str,
+    update: StockUpdate,
+    admin: dict = Depends(get_current_admin),
+    inventory: InventoryStore = Depends(get_inventory)
+):
+    """Set the units on hand for a SKU, starting to track it if needed (admin only)"""
+    level = await inventory.set_stock(product_id, size, color, update.quantity)
+    logger.info("Stock of %s/%s/%s set to %s by %s", product_id, size, color, update.quantity, admin['username'])
+    return level
+
+@api_router.post("/admin/inventory/{product_id}/{size}/{color}/adjust", response_model=StockLevel)
+async def adjust_stock(
+    product_id: str,
+    size: str,
+    color: str,
+    adjustment: StockAdjustment,
+    admin: dict = Depends(get_current_admin),
+    inventory: InventoryStore = Depends(get_inventory)
+):
+    """Add or remove available units of a tracked SKU, e.g. for a restock (admin only)"""
+    level = await inventory.adjust_stock(product_id, size, color, adjustment.delta)
+    if level is None:
+        raise HTTPException(status_code=409, detail="SKU is not tracked or has fewer units available")
+    return level
+
+# ==================== CUSTOMER ORDER HISTORY ENDPOINTS ====================
+
+@api_router.post("/customer/login-link")
+async def request_customer_login_link(
+    request_data: CustomerLoginLinkRequest,
+    orders: OrderRepository = Depends(get_order_repository)
+):
+    """Email a sign-in link for the customer's order history"""
+    email = normalize_email(request_data.email)
+    # Only customers with orders get an email, but the response never says whether one was sent
+    page = await orders.customer_orders(email, limit=1)
+    if page.orders:
+        link = f"{CUSTOMER_ORDERS_URL}?token={create_customer_token(email)}"
+        await send_customer_login_email(email, link)
+    return {"message": "If we have orders for this email, a sign-in link is on its way"}
+
+@api_router.post("/customer/session", response_model=CustomerTokenResponse)
+async def create_customer_session(login_data: CustomerOrderLogin, orders: OrderRepository = Depends(get_order_repository)):
+    """Sign in to the order history with an order number and the email it was placed with"""
+    order = await orders.get_by_number(login_data.order_number.strip())
+    if not order or normalize_email(order.customer_info.email) != normalize_email(login_data.email):
+        raise HTTPException(status_code=401, detail="Order number and email do not match")
+    return CustomerTokenResponse(access_token=create_customer_token(login_data.email))
+
+@api_router.get("/customer/orders", response_model=OrderHistoryPage)
+async def get_customer_orders(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=50, description="Maximum number of orders to return"),
+    email: str = Depends(get_current_customer),
+    orders: OrderRepository = Depends(get_order_repository)
+):
+    """The signed-in customer's orders, newest first"""
+    try:
+        return await orders.customer_orders(email, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# ==================== PAYMENT MOCK ENDPOINTS ====================
 
 @api_router.post("/payment/process", response_model=PaymentResponse)
-async def process_payment(payment_data: PaymentRequest):
+async def process_payment(
+    payment_data: PaymentRequest,
+    orders: OrderRepository = Depends(get_order_repository),
+    inventory: InventoryStore = Depends(get_inventory)
+):
     """Process payment through HYP gateway"""
     try:
-        # Get order to verify it exists
-        order = await db.orders.find_one({"id": payment_data.order_id}, {"_id": 0})
-        if not order:
+        # Get order to verify it exists and is still awaiting payment
+        order = await orders.get_by_id(payment_data.order_id)
+        if order is None:
             return PaymentResponse(
                 success=False,
                 message="Order not found",
                 order_id=payment_data.order_id
             )
+        if order.status != OrderStatus.PENDING_PAYMENT:
+            return PaymentResponse(
+                success=False,
+                message="Order is not awaiting payment",
+                order_id=payment_data.order_id
+            )
+        
+        # Make sure the stock is still held (or can be held again) before charging the card
+        try:
+            await inventory.renew(payment_data.order_id)
+        except OutOfStockError as e:
+            logger.info("Payment refused for order %s: %s", payment_data.order_id, e)
+            return PaymentResponse(
+                success=False,
+                message="Some items are no longer in stock",
+                order_id=payment_data.order_id
+            )
         
         # Parse expiry date from MM/YY format
         if '/' in payment_data.expiry_date:
@@ -1085,7 +1629,8 @@ async def process_payment(payment_data: PaymentRequest):
             year = payment_data.expiry_date[2:]
         
         # Process payment with HYP
-        hyp_result = hyp_client.process_payment(
+        from hyp_client import get_hyp_client
+        hyp_result = get_hyp_client().process_payment(
             amount=payment_data.amount,
             card_number=payment_data.card_number,
             expiry_month=month,
@@ -1097,18 +1642,18 @@ async def process_payment(payment_data: PaymentRequest):
         
         # Update order with payment result
         if hyp_result['success']:
-            await db.orders.update_one(
-                {"id": payment_data.order_id},
-                {
-                    "$set": {
-                        "status": OrderStatus.PAYMENT_CONFIRMED.value,
-                        "payment_transaction_id": hyp_result.get('transaction_id'),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
-                }
-            )
+            if not await orders.confirm_payment(payment_data.order_id, hyp_result.get('transaction_id')):
+                # Cancelled (or paid) while the charge was in flight; the charge needs reversing
+                logger.error("Order %s was charged (%s) but is no longer awaiting payment",
+                             payment_data.order_id, hyp_result.get('transaction_id'))
+                return PaymentResponse(
+                    success=False,
+                    transaction_id=hyp_result.get('transaction_id'),
+                    message="Order is no longer awaiting payment",
+                    order_id=payment_data.order_id
+                )
             
-            logger.info(f"Payment processed successfully for order {payment_data.order_id}: {hyp_result.get('transaction_id')}")
+            logger.info("Payment processed successfully for order %s: %s", payment_data.order_id, hyp_result.get('transaction_id'))
             
             return PaymentResponse(
                 success=True,
@@ -1118,7 +1663,7 @@ async def process_payment(payment_data: PaymentRequest):
             )
         else:
             # Payment failed
-            logger.warning(f"Payment failed for order {payment_data.order_id}: {hyp_result.get('response_message')}")
+            logger.warning("Payment failed for order %s: %s", payment_data.order_id, hyp_result.get('response_message'))
             
             return PaymentResponse(
                 success=False,
@@ -1127,7 +1672,7 @@ async def process_payment(payment_data: PaymentRequest):
             )
     
     except Exception as e:
-        logger.error(f"Payment processing error: {str(e)}")
+        logger.error("Payment processing error: %s", e)
         return PaymentResponse(
             success=False,
             message=f"Payment processing failed: {str(e)}",
@@ -1137,95 +1682,370 @@ async def process_payment(payment_data: PaymentRequest):
 # ==================== ADMIN DASHBOARD ENDPOINTS ====================
 
 @api_router.get("/admin/analytics")
-async def get_analytics(admin: dict = Depends(get_current_admin)):
-    """Get sales analytics for admin dashboard"""
+async def get_analytics(admin: dict = Depends(get_current_admin), orders: OrderRepository = Depends(get_order_repository)):
+    """Get sales analytics for admin dashboard
+
+    Counts, revenue and popular products cover the orders collection only; with archiving
+    on, `archived_before` says from when delivered and cancelled orders are left out.
+    """
     try:
-        # Get total orders count
-        total_orders = await db.orders.count_documents({})
-        
-        # Get orders by status
-        status_counts = {}
-        for status in OrderStatus:
-            count = await db.orders.count_documents({"status": status.value})
-            status_counts[status.value] = count
+        # Orders by status, in one aggregation
+        status_counts = await orders.count_by_status()
+        total_orders = sum(status_counts.values())
         
-        # Get total revenue (only from confirmed/processing/shipped/delivered orders)
-        revenue_statuses = [
-            OrderStatus.PAYMENT_CONFIRMED.value,
-            OrderStatus.PROCESSING.value,
-            OrderStatus.SHIPPED.value,
-            OrderStatus.DELIVERED.value
-        ]
+        # Total revenue (only from confirmed/processing/shipped/delivered orders)
+        total_revenue = await orders.total_revenue()
         
-        revenue_orders = await db.orders.find(
-            {"status": {"$in": revenue_statuses}},
-            {"_id": 0, "total": 1}
-        ).to_list(10000)
+        # Popular products
+        popular_products = await orders.popular_products(limit=10)
         
-        total_revenue = sum(order.get("total", 0) for order in revenue_orders)
-        
-        # Get popular products
-        all_orders = await db.orders.find({}, {"_id": 0, "items": 1}).to_list(10000)
-        product_sales: Dict[str, Any] = {}
-        
-        for order in all_orders:
-            for item in order.get("items", []):
-                product_id = item.get("product_id")
-                if product_id not in product_sales:
-                    product_sales[product_id] = {
-                        "product_id": product_id,
-                        "name": item.get("name"),
-                        "total_quantity": 0,
-                        "total_revenue": 0
-                    }
-                product_sales[product_id]["total_quantity"] += item.get("quantity", 0)
-                product_sales[product_id]["total_revenue"] += item.get("price", 0) * item.get("quantity", 0)
-        
-        # Sort by quantity
-        popular_products = sorted(
-            product_sales.values(),
-            key=lambda x: x["total_quantity"],
-            reverse=True
-        )[:10]
-        
-        # Get recent orders
-        recent_orders = await db.orders.find(
-            {},
-            {"_id": 0}
-        ).sort("created_at", -1).limit(10).to_list(10)
-        
-        for order in recent_orders:
-            order = deserialize_from_mongo(order)
+        # Recent orders
+        recent_orders = await orders.list(limit=10)
         
         return {
             "total_orders": total_orders,
             "total_revenue": round(total_revenue, 2),
             "orders_by_status": status_counts,
             "popular_products": popular_products,
-            "recent_orders": recent_orders
+            "recent_orders": recent_orders,
+            "archived_before": archived_before(orders)
         }
     except Exception as e:
-        logger.error(f"Error fetching analytics: {str(e)}")
+        logger.error("Error fetching analytics: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch analytics: {str(e)}")
 
-# Include the router in the main app
-app.include_router(api_router)
+@api_router.get("/admin/analytics/products")
+async def get_product_analytics(
+    variant_limit: int = Query(50, ge=1, le=500, description="Maximum number of size/color variants to return"),
+    admin: dict = Depends(get_current_admin),
+    orders: OrderRepository = Depends(get_order_repository)
+):
+    """Quantity and revenue per product and variant, attach rates and basket sizes over all orders
+    not archived; see `archived_before` (admin only)"""
+    # numpy and pandas stay out of the cold start until the first request
+    from product_analytics import product_analytics
+    try:
+        return {**await product_analytics(orders, variant_limit=variant_limit), "archived_before": archived_before(orders)}
+    except Exception as e:
+        logger.error("Error fetching product analytics: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to fetch product analytics: {str(e)}")
+
+@api_router.post("/admin/orders/expire-pending")
+async def expire_pending_orders_now(request: Request, admin: dict = Depends(get_current_admin)):
+    """Run the pending order expiry sweep now and return its counts (admin only)"""
+    report = await request.app.state.pending_order_sweeper.run_once()
+    logger.info("Pending order sweep run by %s: %s", admin['username'], report)
+    return report
+
+@api_router.post("/admin/orders/archive")
+async def archive_orders_now(request: Request, admin: dict = Depends(get_current_admin)):
+    """Run the order archival job now and return its counts (admin only)"""
+    if request.app.state.order_archiver is None:
+        raise HTTPException(status_code=409, detail="Order archiving is not configured")
+    report = await request.app.state.order_archiver.run_once()
+    logger.info("Order archival run by %s: %s", admin['username'], report)
+    return report
+
+@api_router.post("/admin/stream-token", response_model=StreamTokenResponse)
+async def issue_stream_token(admin: dict = Depends(get_current_admin)):
+    """Token for opening admin event streams with EventSource, valid for a minute (admin only)"""
+    return StreamTokenResponse(token=create_stream_token(admin['username']))
+
+@api_router.get("/admin/orders/events")
+async def stream_all_order_events(
+    admin: dict = Depends(get_current_admin_for_stream),
+    hub: OrderStreamHub = Depends(get_order_stream)
+):
+    """Server-sent events for every new and changed order"""
+    return event_stream_response(order_event_stream(hub))
+
+@api_router.get("/admin/orders/{order_id}/invoice")
+async def download_invoice(
+    order_id: str,
+    admin: dict = Depends(get_current_admin),
+    orders: OrderRepository = Depends(get_order_repository),
+    invoices: InvoiceRenderer = Depends(get_invoice_renderer)
+):
+    """Printable HTML invoice for a paid order, served from the invoice cache (admin only)"""
+    order = await orders.get_by_id(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.status.value not in INVOICE_STATUSES:
+        raise HTTPException(status_code=409, detail="Invoices are only issued for paid orders")
+    path = await invoices.invoice(order)
+    return FileResponse(
+        path, media_type="text/html", filename=invoice_filename(order.order_number), content_disposition_type="inline"
+    )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.get("/admin/invoices")
+async def download_monthly_invoices(
+    month: str = Query(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="Month as YYYY-MM"),
+    tz: str = Query("UTC", max_length=64, description="IANA time zone the month is taken in"),
+    admin: dict = Depends(get_current_admin),
+    orders: OrderRepository = Depends(get_order_repository),
+    invoices: InvoiceRenderer = Depends(get_invoice_renderer)
+):
+    """Zip of the invoices of every paid order created in a month, archived or not, rendered in parallel (admin only)"""
+    try:
+        zone = ZoneInfo(tz)
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Unknown time zone: {tz}")
+    year, month_number = (int(part) for part in month.split("-"))
+    start = datetime(year, month_number, 1, tzinfo=zone)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1, tzinfo=zone)
+    return StreamingResponse(
+        invoices.zip_stream(orders.created_between(start, end, INVOICE_STATUSES)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="invoices-{month}.zip"'}
+    )
+
+@api_router.get("/admin/orders/search", response_model=List[Order])
+async def search_orders(
+    q: str = Query(..., min_length=2, max_length=200, description="Name, email, phone, order number or item name, or the start of one"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of orders to return"),
+    admin: dict = Depends(get_current_admin),
+    orders: OrderRepository = Depends(get_order_repository)
+):
+    """Find orders by partial customer details, order number or item names, best matches first (admin only)"""
+    return await orders.search(q, limit=limit)
+
+@api_router.get("/admin/analytics/timeseries", response_model=SalesTimeseries)
+async def get_sales_timeseries(
+    start: Optional[datetime] = Query(None, description="Range start; defaults to 30 days before end. Naive times are UTC"),
+    end: Optional[datetime] = Query(None, description="Range end (exclusive); defaults to the end of the current bucket"),
+    granularity: str = Query("day", pattern="^(hour|day|week)$", description="Bucket size: hour, day or week"),
+    tz: str = Query("UTC", max_length=64, description="IANA time zone the buckets are aligned to"),
+    admin: dict = Depends(get_current_admin),
+    orders: OrderRepository = Depends(get_order_repository)
+):
+    """Revenue, order count and units sold per bucket over a date range (admin only)
+
+    Archived orders are not counted; `archived_before` is set when the range reaches the archive.
+    """
+    try:
+        series = await sales_timeseries.get(orders, start, end, granularity, tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cutoff = archived_before(orders)
+    if cutoff is not None and series.start < cutoff:
+        series = series.model_copy(update={"archived_before": cutoff})
+    return series
+
+# ==================== PROFILER ENDPOINTS ====================
+
+@api_router.get("/admin/profiler")
+async def get_profiler(admin: dict = Depends(get_current_admin)):
+    """Get profiler settings and the stored profiles (admin only)"""
+    loop = asyncio.get_running_loop()
+    profiles = await loop.run_in_executor(None, request_profiler.store.list)
+    return {"settings": request_profiler.settings.to_dict(), "profiles": profiles}
+
+@api_router.put("/admin/profiler")
+async def update_profiler(settings_data: ProfilerSettingsUpdate, admin: dict = Depends(get_current_admin)):
+    """Change profiler settings on every worker without a restart (admin only)"""
+    request_profiler.settings.update(settings_data.model_dump(exclude_none=True))
+    await db.app_settings.update_one(
+        {"_id": "profiler"},
+        {"$set": request_profiler.settings.to_dict()},
+        upsert=True
+    )
+    logger.info("Profiler settings changed by %s: %s", admin['username'], request_profiler.settings.to_dict())
+    return {"settings": request_profiler.settings.to_dict()}
+
+@api_router.get("/admin/profiler/profiles/{name}")
+async def download_profile(name: str, admin: dict = Depends(get_current_admin)):
+    """Download a collapsed-stack profile (admin only)"""
+    path = request_profiler.store.path_for(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=path.name)
+
+async def poll_profiler_settings():
+    """Pick up profiler settings changed through another worker"""
+    while True:
+        # Sleep first so the initial read happens after the startup warmup
+        await asyncio.sleep(PROFILER_SETTINGS_POLL_SECONDS)
+        try:
+            settings_doc = await db.app_settings.find_one({"_id": "profiler"})
+            if settings_doc:
+                request_profiler.settings.update(settings_doc)
+        except Exception as e:
+            logger.error("Error refreshing profiler settings: %s", e)
+
+async def dispatch_order_events(app: FastAPI):
+    """Run order side effects (emails, rollups, webhooks) from the order event outbox"""
+    try:
+        await app.state.order_events.run()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error("Order event dispatcher stopped: %s", e)
+
+async def expire_pending_orders(app: FastAPI):
+    """Cancel orders that were never paid"""
+    await app.state.pending_order_sweeper.run(PENDING_ORDER_SWEEP_SECONDS)
+
+async def archive_orders(app: FastAPI):
+    """Move old delivered and cancelled orders to the archive, when one is configured"""
+    if app.state.order_archiver is not None:
+        await app.state.order_archiver.run(ORDER_ARCHIVE_INTERVAL_SECONDS)
+
+async def stream_order_changes(app: FastAPI):
+    """Follow the order event outbox for this worker's live order streams"""
+    await app.state.order_stream.run()
+
+async def release_expired_reservations(app: FastAPI):
+    """Return stock held by orders that were never paid"""
+    await run_reservation_expiry(app.state.inventory, RESERVATION_RELEASE_SECONDS)
+
+async def run_cache_invalidation():
+    """Apply cache invalidations published by other workers"""
+    try:
+        await invalidation_bus.run()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Caches still expire after CACHE_TTL_SECONDS
+        logger.error("Cache invalidation channel stopped: %s", e)
+
+# ==================== HEALTH ENDPOINTS ====================
+
+async def healthz(request: Request):
+    """Liveness: the worker is up and serving, without any I/O"""
+    return request.app.state.health.liveness()
+
+async def readyz(request: Request):
+    """Readiness: 200 when MongoDB answers, 503 otherwise, with the state of each dependency"""
+    ready, report = await request.app.state.health.readiness()
+    return JSONResponse(report, status_code=200 if ready else 503, headers={"Cache-Control": "no-store"})
+
+# ==================== METRICS ENDPOINT ====================
+
+async def metrics():
+    """Expose application metrics in the Prometheus text format"""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def create_indexes(app: FastAPI):
+    """Create the indexes the handlers rely on"""
+    await app.state.order_repository.ensure_indexes()
+    await app.state.inventory.ensure_indexes()
+    if app.state.order_repository.archive is not None:
+        await app.state.order_repository.archive.ensure_indexes()
+    if rate_limiter.shared is not None:
+        await rate_limiter.shared.ensure_indexes()
+    try:
+        await normalize_newsletter_emails()
+        await db.newsletter_subscribers.create_index("email", unique=True)
+    except Exception as e:
+        logger.error("Error creating newsletter subscriber index: %s", e)
+
+async def normalize_newsletter_emails():
+    """Normalize subscriber emails stored before subscribe did, merging the duplicates that reveals
+
+    Of each group of addresses equal once normalized, the earliest subscriber is kept and
+    marked as welcomed if any of them was; the others are deleted.
+    """
+    normalized = {"$toLower": {"$trim": {"input": "$email"}}}
+    duplicates = db.newsletter_subscribers.aggregate([
+        {"$match": {"email": {"$type": "string"}}},
+        {"$sort": {"subscribed_at": 1}},
+        {"$group": {
+            "_id": normalized,
+            "ids": {"$push": "$_id"},
+            "welcomed": {"$max": {"$ifNull": ["$welcome_email_sent", False]}}
+        }},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ])
+    merged = 0
+    async for group in duplicates:
+        keep, *extra = group["ids"]
+        await db.newsletter_subscribers.delete_many({"_id": {"$in": extra}})
+        if group["welcomed"]:
+            await db.newsletter_subscribers.update_one({"_id": keep}, {"$set": {"welcome_email_sent": True}})
+        merged += len(extra)
+    result = await db.newsletter_subscribers.update_many(
+        {"email": {"$type": "string"}, "$expr": {"$ne": ["$email", normalized]}},
+        [{"$set": {"email": normalized}}]
+    )
+    if merged or result.modified_count:
+        logger.info(
+            "Normalized %s newsletter subscriber emails and merged %s duplicates", result.modified_count, merged
+        )
+
+async def warm_up(app: FastAPI):
+    """Open connection pools and load deferred clients in parallel, off the startup path"""
+    loop = asyncio.get_running_loop()
+    from hyp_client import get_hyp_client
+    await asyncio.gather(
+        db.warmup(MONGO_WARMUP_CONNECTIONS),
+        loop.run_in_executor(None, get_hyp_client),
+        loop.run_in_executor(None, password_context)
+    )
+    await create_indexes(app)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work on startup and release clients on shutdown"""
+    # Nothing here waits on MongoDB, so the app starts serving immediately
+    tasks = [
+        asyncio.create_task(warm_up(app)),
+        asyncio.create_task(poll_profiler_settings()),
+        asyncio.create_task(run_cache_invalidation()),
+        asyncio.create_task(dispatch_order_events(app)),
+        asyncio.create_task(release_expired_reservations(app)),
+        asyncio.create_task(expire_pending_orders(app)),
+        asyncio.create_task(archive_orders(app)),
+        asyncio.create_task(stream_order_changes(app))
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    # Let each task run its cleanup (closing change streams, the event store watcher) before the client goes
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await invalidation_bus.drain()
+    app.state.invoices.close()
+    db.close()
+    tracer.close()
+
+def create_app() -> FastAPI:
+    """Build the application with its routes, middleware and order storage"""
+    app = FastAPI(lifespan=lifespan)
+
+    # All order reads and writes go through the repository, injected with get_order_repository
+    app.state.order_repository = build_order_repository()
+    app.state.inventory = build_inventory()
+    app.state.order_events = build_order_event_dispatcher(app.state.order_repository, app.state.inventory)
+    app.state.pending_order_sweeper = build_pending_order_sweeper(app.state.order_repository, app.state.inventory)
+    app.state.order_archiver = build_order_archiver(app.state.order_repository)
+    app.state.invoices = InvoiceRenderer(INVOICE_DIR, INVOICE_WORKERS)
+    app.state.order_stream = OrderStreamHub(app.state.order_repository.events, ORDER_EVENTS_POLL_SECONDS)
+    app.state.health = build_health_checker(app.state.order_events)
+
+    # Include the router in the main app
+    app.include_router(api_router)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
+    app.add_api_route("/healthz", healthz, include_in_schema=False)
+    app.add_api_route("/readyz", readyz, include_in_schema=False)
+
+    # Innermost, so throttled requests still get CORS headers and show up in metrics,
+    # but are answered before routing and any database work
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    app.add_middleware(ProfilerMiddleware, profiler=request_profiler, authorize=is_admin_token)
+    # Outermost, so everything logged while serving a request carries its ID
+    app.add_middleware(RequestIdMiddleware)
+    return app
+
+app = create_app()
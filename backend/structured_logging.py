@@ -0,0 +1,218 @@
+"""
+Structured Logging
+JSON log lines written by a background thread, tagged with request and trace IDs
+
+Handlers log from the event loop, and a synchronous write to stderr blocks the loop when
+the pipe or the disk is slow. configure_logging() gives the root logger a single handler
+that only puts the record on a bounded queue; a QueueListener thread formats and writes
+it. Messages use lazy %-style arguments, and the arguments are interpolated on that
+thread too, so a record that is filtered out or sampled away is never formatted.
+
+Every record carries the ID of the request being handled (X-Request-ID, set by
+RequestIdMiddleware) and its trace ID when the request is traced. Chatty modules can have
+their info and debug lines sampled; warnings and errors are always kept. If the writer
+falls behind and the queue fills up, records are dropped and counted in
+log_records_dropped_total rather than blocking the loop.
+"""
+
+import re
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+
+from metrics import LOG_RECORDS_DROPPED
+from tracing import current_trace_id
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records waiting for the writer thread; beyond this they are dropped
+LOG_QUEUE_SIZE = 10_000
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+# Incoming request IDs are logged verbatim, so only plain tokens are accepted
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# ID of the request being handled; None outside a request
+_request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "trace_id"
+}
+
+_listener: Optional[QueueListener] = None
+
+
+def current_request_id() -> Optional[str]:
+    """ID of the request being handled"""
+    return _request_id.get()
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Per-logger sample rates from a spec like "hyp_client=0.1,email_service=0.25" """
+    rates = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            name, _, value = entry.partition("=")
+            rate = float(value)
+            if not 0 <= rate <= 1:
+                raise ValueError(f"Invalid log sample rate: {entry}")
+            rates[name.strip()] = rate
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Tags records with the current request and trace IDs while still on the logging thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.trace_id = current_trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the info and debug records of the configured loggers
+
+    A rate applies to the named logger and its children; the most specific name wins.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._by_logger: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._by_logger.get(name)
+        if rate is None:
+            matches = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + ".")]
+            rate = self._by_logger[name] = self.rates[max(matches, key=len)] if matches else 1.0
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate_for(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.labels("sampled").inc()
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON document per record, including any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread unformatted, dropping them if its queue is full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record (arguments, exc_info) is
+        # passed as is and formatted there
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json", sample_rates: Optional[Dict[str, float]] = None,
+                      queue_size: int = LOG_QUEUE_SIZE, stream: Optional[TextIO] = None) -> QueueListener:
+    """Route the root logger through a queue to a writer thread on `stream` (stderr)
+
+    `fmt` is "json" or "text". Calling it again replaces the previous configuration.
+    """
+    global _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    stop_logging()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """Write out the records still queued and stop the writer thread"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """ASGI middleware giving each request an ID, from X-Request-ID or generated, echoed back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER, request_id.encode())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
@@ -0,0 +1,224 @@
+"""
+Request Tracing
+Lightweight spans tied together by a context-var trace ID and sent to a pluggable exporter
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Span of the code currently running; None when the request is not being traced
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes',
+                 'status', 'start_time', '_start', 'duration_ms')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: Any):
+        self.status = 'error'
+        self.attributes['error'] = str(error)
+
+    def end(self):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class SpanExporter:
+    """Base class for span exporters"""
+
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StdoutExporter(SpanExporter):
+    """Write one JSON document per span to stdout"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            sys.stdout.write(line + "\n")
+
+
+class JsonFileExporter(SpanExporter):
+    """Append one JSON document per span to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """Creates spans for sampled requests and hands finished spans to the exporter"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def configure_from_env(self):
+        """Configure the exporter and sampling from TRACE_EXPORTER, TRACE_FILE and TRACE_SAMPLE_RATE"""
+        exporter_name = os.getenv('TRACE_EXPORTER', 'none').lower()
+        self.sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+
+        if self.exporter:
+            self.exporter.close()
+        self.exporter = None
+        if exporter_name == 'stdout':
+            self.exporter = StdoutExporter()
+        elif exporter_name == 'file':
+            self.exporter = JsonFileExporter(os.getenv('TRACE_FILE', 'traces.jsonl'))
+        elif exporter_name != 'none':
+            logger.warning("Unknown TRACE_EXPORTER '%s', tracing disabled", exporter_name)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None and self.sample_rate > 0
+
+    def _finish(self, span: Span):
+        span.end()
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.error("Error exporting span %s: %s", span.name, e)
+
+    @contextmanager
+    def start_trace(self, name: str, trace_id: Optional[str] = None, **attributes):
+        """Start a root span, subject to sampling; yields None when not sampled"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        span = Span(name, trace_id or uuid.uuid4().hex, attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    @contextmanager
+    def start_span(self, name: str, **attributes):
+        """Start a child of the current span; yields None outside a sampled trace"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace ID of the request being handled, if it is traced"""
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per request, named after the matched route"""
+
+    def __init__(self, app, tracer: 'Tracer'):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        with self.tracer.start_trace("http.request", method=scope["method"], path=scope["path"]) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            trace_header = (b"x-trace-id", span.trace_id.encode())
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("status_code", message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [trace_header]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                span.name = getattr(route, "path", None) or "unmatched"
+
+
+# Global instance, disabled until configure_from_env() is called
+tracer = Tracer()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '../components/ui/button';
 import { Package, DollarSign, TrendingUp, Users, Search, Filter, LogOut } from 'lucide-react';
@@ -14,11 +14,91 @@ const AdminDashboard = () => {
   const [selectedStatus, setSelectedStatus] = useState('all');
   const [searchEmail, setSearchEmail] = useState('');
   const [adminUsername, setAdminUsername] = useState('');
+  const [authenticated, setAuthenticated] = useState(false);
+  const filtersRef = useRef({ status: 'all', email: '' });
 
   useEffect(() => {
     checkAuth();
   }, []);
 
+  useEffect(() => {
+    filtersRef.current = { status: selectedStatus, email: searchEmail };
+  }, [selectedStatus, searchEmail]);
+
+  // New and changed orders pushed by the server instead of refetching
+  useEffect(() => {
+    if (!authenticated) {
+      return undefined;
+    }
+    let source = null;
+    let closed = false;
+    let analyticsTimer = null;
+    let reconnectTimer = null;
+
+    const matchesFilters = (order) => {
+      const { status, email } = filtersRef.current;
+      return (status === 'all' || order.status === status)
+        && (!email || order.customer_info?.email?.toLowerCase() === email.trim().toLowerCase());
+    };
+
+    const applyEvent = (event) => {
+      const { type, order } = JSON.parse(event.data);
+      setOrders((current) => {
+        const listed = current.some((existing) => existing.id === order.id);
+        if (type === 'order.deleted' || !matchesFilters(order)) {
+          return listed ? current.filter((existing) => existing.id !== order.id) : current;
+        }
+        if (!listed) {
+          return [order, ...current];
+        }
+        return current.map((existing) => (existing.id === order.id ? order : existing));
+      });
+      // Bursts of changes refresh the totals once
+      clearTimeout(analyticsTimer);
+      analyticsTimer = setTimeout(fetchAnalytics, 2000);
+    };
+
+    // EventSource cannot send an Authorization header, so the stream is opened with a
+    // short-lived stream token rather than the admin token, and a fresh one on reconnect
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await axios.post(`${BACKEND_URL}/api/admin/stream-token`, null, {
+          headers: getAuthHeaders()
+        });
+        streamToken = response.data.token;
+      } catch (error) {
+        console.error('Error fetching stream token:', error);
+        reconnectTimer = setTimeout(connect, 5000);
+        return;
+      }
+      if (closed) {
+        return;
+      }
+      source = new EventSource(`${BACKEND_URL}/api/admin/orders/events?token=${encodeURIComponent(streamToken)}`);
+      ['order.created', 'order.status_changed', 'order.updated', 'order.deleted'].forEach((type) => {
+        source.addEventListener(type, applyEvent);
+      });
+      source.onerror = () => {
+        // The browser retries dropped connections with the same (by then expired) token;
+        // once it gives up, start over with a new one
+        if (source.readyState === EventSource.CLOSED) {
+          reconnectTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(analyticsTimer);
+      clearTimeout(reconnectTimer);
+      if (source) {
+        source.close();
+      }
+    };
+  }, [authenticated]);
+
   const checkAuth = async () => {
     const token = localStorage.getItem('admin_token');
     const username = localStorage.getItem('admin_username');
@@ -37,6 +117,7 @@ const AdminDashboard = () => {
       });
       
       setAdminUsername(username);
+      setAuthenticated(true);
       fetchAnalytics();
       fetchOrders();
     } catch (error) {
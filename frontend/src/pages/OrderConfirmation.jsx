@@ -31,6 +31,22 @@ const OrderConfirmation = () => {
     }
   }, [orderNumber]);
 
+  // Live status updates (payment, shipping) pushed by the server instead of refetching
+  const orderId = order?.id;
+  useEffect(() => {
+    if (!orderId) {
+      return undefined;
+    }
+    const source = new EventSource(`${BACKEND_URL}/api/orders/${orderId}/events`);
+    const applySnapshot = (event) => setOrder(JSON.parse(event.data));
+    const applyChange = (event) => setOrder(JSON.parse(event.data).order);
+    source.addEventListener('order.snapshot', applySnapshot);
+    source.addEventListener('order.status_changed', applyChange);
+    source.addEventListener('order.updated', applyChange);
+    source.addEventListener('order.deleted', () => source.close());
+    return () => source.close();
+  }, [orderId]);
+
   if (loading) {
     return (
       <div className="min-h-screen pt-24 pb-16">
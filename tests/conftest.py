@@ -0,0 +1,43 @@
+"""
+Shared fixtures
+Orders built from a fixed checkout, for the tests that run against the in-memory repositories.
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from models import CustomerInfo, Order, OrderItem, OrderStatus, PaymentInfo, ShippingAddress  # noqa: E402
+
+
+def _checkout() -> dict:
+    return {
+        "customer_info": CustomerInfo(
+            first_name="Sarah", last_name="Cohen", email="sarah.cohen@example.com", phone="+972-54-123-4567"
+        ),
+        "shipping_address": ShippingAddress(address="15 Rothschild Boulevard", city="Tel Aviv", postal_code="66881"),
+        "items": [
+            OrderItem(product_id="top-1", name="Timeless Unseen", price=449.0, quantity=2,
+                      selected_size="L", selected_color="Black"),
+            OrderItem(product_id="pant-1", name="Bandana Shorts", price=199.0, quantity=1,
+                      selected_size="M", selected_color="Teal"),
+        ],
+        "shipping_method": "standard",
+        "shipping_cost": 40.0,
+        "subtotal": 1097.0,
+        "total": 1137.0,
+        "payment_info": PaymentInfo(card_last_four="4242", card_name="Sarah Cohen"),
+    }
+
+
+@pytest.fixture
+def make_order():
+    """Build an order for the same checkout (two top-1 L Black, one pant-1 M Teal) at a creation time"""
+    def make(created_at: datetime, status: OrderStatus = OrderStatus.PENDING_PAYMENT) -> Order:
+        return Order(**_checkout(), status=status, created_at=created_at)
+
+    return make
@@ -0,0 +1,96 @@
+"""
+Cross-worker cache invalidation
+Runs several worker processes against a real MongoDB and measures how long an
+invalidation published by one of them takes to reach all the others.
+
+Set TEST_MONGO_URL (e.g. mongodb://localhost:27017, or a replica set URL to exercise
+change streams) to run; the test is skipped otherwise.
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from cache import LocalCache, InvalidationBus  # noqa: E402
+
+MONGO_URL = os.environ.get('TEST_MONGO_URL')
+WORKERS = 4
+POLL_INTERVAL = 0.2
+
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="TEST_MONGO_URL is not set")
+
+
+def _worker(db_name: str, mode: str, ready, done):
+    """Cache a value, then report when another worker's invalidation has removed it"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_URL)
+        bus = InvalidationBus(client[db_name], mode=mode, poll_interval=POLL_INTERVAL)
+        cache = bus.register(LocalCache('discount_codes'))
+        cache.set('SAVE20', {'code': 'SAVE20'})
+        listener = asyncio.create_task(bus.run())
+        while bus.active_mode is None:
+            await asyncio.sleep(0.01)
+        ready.put(bus.active_mode)
+        while cache.get('SAVE20') is not None:
+            await asyncio.sleep(0.005)
+        done.put(time.time())
+        listener.cancel()
+        client.close()
+
+    asyncio.run(main())
+
+
+async def _publish(db_name: str, mode: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        bus = InvalidationBus(client[db_name], mode=mode)
+        await bus.publish('discount_codes', 'SAVE20')
+    finally:
+        client.close()
+
+
+async def _drop(db_name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    await client.drop_database(db_name)
+    client.close()
+
+
+@pytest.mark.parametrize('mode', ['auto', 'poll'])
+def test_invalidation_converges_across_workers(mode):
+    db_name = f"unseen_test_{uuid.uuid4().hex[:8]}"
+    context = multiprocessing.get_context('spawn')
+    ready, done = context.Queue(), context.Queue()
+    workers = [context.Process(target=_worker, args=(db_name, mode, ready, done)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    try:
+        active_modes = {ready.get(timeout=30) for _ in workers}
+
+        published_at = time.time()
+        asyncio.run(_publish(db_name, mode))
+        convergence = max(done.get(timeout=10) for _ in workers) - published_at
+
+        # A change stream delivers within milliseconds; polling within one interval plus the query
+        bound = 1.0 if active_modes == {'change_stream'} else POLL_INTERVAL + 1.0
+        print(f"{WORKERS} workers ({', '.join(sorted(active_modes))}) converged in {convergence * 1000:.0f} ms")
+        assert convergence < bound
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        asyncio.run(_drop(db_name))
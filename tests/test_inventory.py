@@ -0,0 +1,104 @@
+"""
+Inventory reservations
+Reserving, committing, releasing and renewing stock holds against the in-memory
+inventory store, so they run without a MongoDB server.
+"""
+
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from inventory import InMemoryInventoryStore, OutOfStockError, reservation_lines  # noqa: E402
+from models import OrderItem  # noqa: E402
+
+LATER = datetime.now(timezone.utc) + timedelta(hours=1)
+
+
+def _items(quantity: int, product_id: str = "top-1"):
+    return [OrderItem(product_id=product_id, name="Timeless Unseen", price=449.0, quantity=quantity,
+                      selected_size="L", selected_color="Black")]
+
+
+def _stock(inventory: InMemoryInventoryStore):
+    level, = asyncio.run(inventory.stock("top-1"))
+    return level.available, level.reserved
+
+
+@pytest.fixture
+def inventory():
+    store = InMemoryInventoryStore(reservation_ttl_seconds=60)
+    asyncio.run(store.set_stock("top-1", "L", "Black", 5))
+    return store
+
+
+def test_reservation_lines_merge_repeated_skus():
+    lines = reservation_lines(_items(2) + _items(1) + _items(4, "pant-1"))
+    assert [(line["sku"], line["quantity"]) for line in lines] == [("pant-1:L:Black", 4), ("top-1:L:Black", 3)]
+
+
+def test_reserve_holds_stock_once(inventory):
+    asyncio.run(inventory.reserve("order-1", _items(2)))
+    asyncio.run(inventory.reserve("order-1", _items(2)))
+    assert _stock(inventory) == (3, 2)
+
+
+def test_reserve_takes_nothing_when_a_sku_is_short(inventory):
+    asyncio.run(inventory.set_stock("pant-1", "L", "Black", 1))
+    with pytest.raises(OutOfStockError) as error:
+        asyncio.run(inventory.reserve("order-1", _items(2) + _items(3, "pant-1")))
+    assert error.value.skus == ["pant-1:L:Black"]
+    assert _stock(inventory) == (5, 0)
+
+
+def test_untracked_skus_never_run_out(inventory):
+    asyncio.run(inventory.reserve("order-1", _items(100, "hat-1")))
+    assert asyncio.run(inventory.commit("order-1"))
+
+
+def test_commit_and_release_are_idempotent(inventory):
+    asyncio.run(inventory.reserve("paid", _items(2)))
+    asyncio.run(inventory.reserve("cancelled", _items(1)))
+    assert asyncio.run(inventory.commit("paid"))
+    assert not asyncio.run(inventory.commit("paid"))
+    assert asyncio.run(inventory.release("cancelled"))
+    assert not asyncio.run(inventory.release("cancelled"))
+    # A committed order's units are sold, not given back
+    assert not asyncio.run(inventory.release("paid"))
+    assert _stock(inventory) == (3, 0)
+
+
+def test_release_expired_gives_stock_back(inventory):
+    asyncio.run(inventory.reserve("order-1", _items(2)))
+    assert asyncio.run(inventory.release_expired(now=datetime.now(timezone.utc))) == 0
+    assert asyncio.run(inventory.release_expired(now=LATER)) == 1
+    assert _stock(inventory) == (5, 0)
+
+
+def test_renew_takes_expired_stock_again(inventory):
+    asyncio.run(inventory.reserve("order-1", _items(2)))
+    asyncio.run(inventory.release_expired(now=LATER))
+    asyncio.run(inventory.renew("order-1"))
+    assert _stock(inventory) == (3, 2)
+    assert asyncio.run(inventory.commit("order-1"))
+    assert _stock(inventory) == (3, 0)
+
+
+def test_renew_refuses_when_expired_stock_was_sold(inventory):
+    asyncio.run(inventory.reserve("slow", _items(4)))
+    asyncio.run(inventory.release_expired(now=LATER))
+    asyncio.run(inventory.reserve("fast", _items(3)))
+    with pytest.raises(OutOfStockError):
+        asyncio.run(inventory.renew("slow"))
+    assert _stock(inventory) == (2, 3)
+
+
+def test_renew_extends_a_live_hold(inventory):
+    asyncio.run(inventory.reserve("order-1", _items(2)))
+    asyncio.run(inventory.renew("order-1"))
+    assert asyncio.run(inventory.release_expired(now=datetime.now(timezone.utc) + timedelta(seconds=30))) == 0
+    assert _stock(inventory) == (3, 2)
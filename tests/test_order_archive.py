@@ -0,0 +1,108 @@
+"""
+Order archive
+OrderArchiver.run_once with the in-memory order repository and the file archive in a
+temporary directory, and the lookups and range scans that fall back to the archive.
+"""
+
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from models import OrderStatus  # noqa: E402
+from order_archive import FileOrderArchive, OrderArchiver  # noqa: E402
+from order_repository import InMemoryOrderRepository  # noqa: E402
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def orders(make_order):
+    return {
+        "old_delivered": make_order(NOW - timedelta(days=200), OrderStatus.DELIVERED),
+        "old_cancelled": make_order(NOW - timedelta(days=300), OrderStatus.CANCELLED),
+        "old_processing": make_order(NOW - timedelta(days=250), OrderStatus.PROCESSING),
+        "new_delivered": make_order(NOW - timedelta(days=10), OrderStatus.DELIVERED),
+    }
+
+
+async def _setup(orders, directory: Path):
+    archive = FileOrderArchive(directory)
+    repository = InMemoryOrderRepository(archive=archive)
+    for order in orders.values():
+        await repository.create(order)
+    return repository, archive
+
+
+def test_run_once_moves_old_final_orders(orders, tmp_path):
+    async def main():
+        repository, archive = await _setup(orders, tmp_path)
+        report = await OrderArchiver(repository, archive, after_days=180).run_once(now=NOW)
+        hot = {name: await repository.exists(order.id) for name, order in orders.items()}
+        found = await repository.get_by_number(orders["old_delivered"].order_number)
+        again = await OrderArchiver(repository, archive, after_days=180).run_once(now=NOW)
+        return report, hot, found, again
+
+    report, hot, found, again = asyncio.run(main())
+    assert (report["archived"], report["skipped"], report["batches"]) == (2, 0, 1)
+    assert hot == {"old_delivered": False, "old_cancelled": False, "old_processing": True, "new_delivered": True}
+    # Lookups fall back to the archive
+    assert found.id == orders["old_delivered"].id
+    assert found.status == OrderStatus.DELIVERED
+    assert again["archived"] == 0
+
+
+def test_run_once_works_in_batches(make_order, tmp_path):
+    orders = {index: make_order(NOW - timedelta(days=200 + index), OrderStatus.DELIVERED) for index in range(5)}
+
+    async def main():
+        repository, archive = await _setup(orders, tmp_path)
+        archiver = OrderArchiver(repository, archive, after_days=180, batch_size=2, max_batches=2)
+        return await archiver.run_once(now=NOW), await archiver.run_once(now=NOW)
+
+    first, second = asyncio.run(main())
+    assert (first["archived"], first["batches"]) == (4, 2)
+    assert (second["archived"], second["batches"]) == (1, 1)
+
+
+def test_orders_changed_while_archiving_stay_hot(orders, tmp_path):
+    async def main():
+        repository, archive = await _setup(orders, tmp_path)
+        documents = await repository.archivable(NOW - timedelta(days=180), [OrderStatus.DELIVERED.value])
+        await archive.store(documents)
+        await repository.update(orders["old_delivered"].id, {"notes": "refund requested"})
+        removed = await repository.remove_archived(documents)
+        current = await repository.get_by_id(orders["old_delivered"].id)
+        scanned = [
+            document async for document in repository.created_between(NOW - timedelta(days=365), NOW)
+        ]
+        return removed, current, scanned
+
+    removed, current, scanned = asyncio.run(main())
+    assert removed == 0
+    assert current.notes == "refund requested"
+    # The stale archived copy is not listed next to the hot one
+    assert sorted(document["id"] for document in scanned) == sorted(order.id for order in orders.values())
+
+
+def test_created_between_includes_archived_orders(orders, tmp_path):
+    async def main():
+        repository, archive = await _setup(orders, tmp_path)
+        await OrderArchiver(repository, archive, after_days=180).run_once(now=NOW)
+        month = [
+            document async for document in repository.created_between(
+                NOW - timedelta(days=205), NOW - timedelta(days=195), [OrderStatus.DELIVERED.value]
+            )
+        ]
+        everything = [
+            document async for document in repository.created_between(NOW - timedelta(days=400), NOW)
+        ]
+        return month, everything
+
+    month, everything = asyncio.run(main())
+    assert [document["id"] for document in month] == [orders["old_delivered"].id]
+    assert sorted(document["id"] for document in everything) == sorted(order.id for order in orders.values())
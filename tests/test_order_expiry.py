@@ -0,0 +1,88 @@
+"""
+Pending order expiry
+PendingOrderSweeper.run_once and payment confirmation against the in-memory order
+repository and inventory, so they run without a MongoDB server.
+"""
+
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+from inventory import InMemoryInventoryStore  # noqa: E402
+from models import OrderStatus  # noqa: E402
+from order_expiry import PendingOrderSweeper  # noqa: E402
+from order_repository import InMemoryOrderRepository  # noqa: E402
+
+NOW = datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc)
+
+
+async def _setup(orders):
+    repository = InMemoryOrderRepository()
+    inventory = InMemoryInventoryStore()
+    await inventory.set_stock("top-1", "L", "Black", 100)
+    for order in orders:
+        await repository.create(order)
+        if order.status == OrderStatus.PENDING_PAYMENT:
+            await inventory.reserve(order.id, order.items)
+    return repository, inventory
+
+
+def test_run_once_cancels_only_stale_pending_orders(make_order):
+    stale = make_order(NOW - timedelta(hours=30))
+    fresh = make_order(NOW - timedelta(hours=1))
+    old_paid = make_order(NOW - timedelta(hours=30), OrderStatus.PAYMENT_CONFIRMED)
+
+    async def main():
+        repository, inventory = await _setup([stale, fresh, old_paid])
+        sweeper = PendingOrderSweeper(repository, inventory, max_age_seconds=24 * 3600)
+        report = await sweeper.run_once(now=NOW)
+        statuses = {order.id: (await repository.get_by_id(order.id)).status for order in (stale, fresh, old_paid)}
+        return report, statuses, await inventory.stock("top-1")
+
+    report, statuses, stock = asyncio.run(main())
+    assert report["cancelled"] == 1
+    assert report["released"] == 1
+    assert statuses == {
+        stale.id: OrderStatus.CANCELLED,
+        fresh.id: OrderStatus.PENDING_PAYMENT,
+        old_paid.id: OrderStatus.PAYMENT_CONFIRMED,
+    }
+    # Two units of the fresh order stay held
+    assert (stock[0].available, stock[0].reserved) == (98, 2)
+
+
+def test_run_once_works_in_batches_up_to_max_batches(make_order):
+    orders = [make_order(NOW - timedelta(hours=30, minutes=index)) for index in range(7)]
+
+    async def main():
+        repository, _ = await _setup(orders)
+        sweeper = PendingOrderSweeper(repository, max_age_seconds=24 * 3600, batch_size=3, max_batches=2)
+        first = await sweeper.run_once(now=NOW)
+        second = await sweeper.run_once(now=NOW)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert (first["cancelled"], first["batches"]) == (6, 2)
+    assert (second["cancelled"], second["batches"]) == (1, 1)
+    assert first["released"] == 0
+
+
+def test_confirm_payment_only_confirms_pending_orders(make_order):
+    pending = make_order(NOW - timedelta(hours=1))
+    cancelled = make_order(NOW - timedelta(hours=1), OrderStatus.CANCELLED)
+
+    async def main():
+        repository, _ = await _setup([pending, cancelled])
+        confirmed = await repository.confirm_payment(pending.id, "txn-1")
+        again = await repository.confirm_payment(pending.id, "txn-2")
+        revived = await repository.confirm_payment(cancelled.id, "txn-3")
+        return confirmed, again, revived, await repository.get_by_id(pending.id), await repository.get_by_id(cancelled.id)
+
+    confirmed, again, revived, paid, still_cancelled = asyncio.run(main())
+    assert confirmed and not again and not revived
+    assert paid.status == OrderStatus.PAYMENT_CONFIRMED
+    assert paid.payment_transaction_id == "txn-1"
+    assert still_cancelled.status == OrderStatus.CANCELLED
@@ -0,0 +1,172 @@
+"""
+Rate limiting
+Token buckets, limit parsing, the sliding window Retry-After arithmetic and the limiter's
+fallback when the shared store fails; none of it needs a MongoDB server.
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+import rate_limit  # noqa: E402
+from rate_limit import (  # noqa: E402
+    DEFAULT_RATE_LIMITS, InMemoryRateLimitStore, RateLimit, RateLimiter, RateLimitStore, parse_limits,
+    sliding_window_wait
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+# ==================== TOKEN BUCKET ====================
+
+def test_bucket_allows_a_burst_then_the_average_rate(clock):
+    store = InMemoryRateLimitStore()
+    limit = RateLimit(5, 60)
+    assert [store.take("k", limit) for _ in range(5)] == [0.0] * 5
+    assert store.take("k", limit) == pytest.approx(12.0)
+    clock.now += 6
+    # Half a token refilled: the wait is for the other half
+    assert store.take("k", limit) == pytest.approx(6.0)
+    clock.now += 6
+    assert store.take("k", limit) == 0.0
+    assert store.take("k", limit) > 0
+
+
+def test_bucket_refill_is_capped_at_the_limit(clock):
+    store = InMemoryRateLimitStore()
+    limit = RateLimit(2, 1)
+    store.take("k", limit)
+    clock.now += 3600
+    assert store.take("k", limit) == 0.0
+    assert store.take("k", limit) == 0.0
+    assert store.take("k", limit) > 0
+
+
+def test_buckets_are_per_key_and_least_recently_used_are_evicted(clock):
+    store = InMemoryRateLimitStore(max_buckets=2)
+    limit = RateLimit(1, 60)
+    store.take("a", limit)
+    store.take("b", limit)
+    assert store.take("a", limit) > 0
+    store.take("c", limit)
+    assert len(store) == 2
+    # "b" was least recently used, so it starts over with a full bucket
+    assert store.take("b", limit) == 0.0
+    assert store.take("c", limit) > 0
+
+
+# ==================== LIMITS ====================
+
+def test_rate_limit_parse():
+    limit = RateLimit.parse(" 10/minute ")
+    assert (limit.requests, limit.period) == (10, 60)
+    assert RateLimit.parse("3/day").rate == pytest.approx(3 / 86400)
+    for value in ("10/fortnight", "10", "0/minute", "ten/minute"):
+        with pytest.raises(ValueError):
+            RateLimit.parse(value)
+
+
+def test_parse_limits_defaults():
+    limits = parse_limits()
+    assert len(limits) == len(DEFAULT_RATE_LIMITS)
+    assert limits[("POST", "/api/orders")].requests == 10
+
+
+def test_parse_limits_overrides_disables_and_adds_routes():
+    limits = parse_limits("post  /api/orders=20/minute, POST /api/admin/login=off,GET /api/products=100/second")
+    assert limits[("POST", "/api/orders")].requests == 20
+    assert ("POST", "/api/admin/login") not in limits
+    assert limits[("GET", "/api/products")].period == 1
+    assert limits[("POST", "/api/payment/process")].requests == 10
+
+
+def test_parse_limits_rejects_invalid_values():
+    with pytest.raises(ValueError):
+        parse_limits("POST /api/orders=lots")
+
+
+# ==================== SLIDING WINDOW ====================
+
+LIMIT = RateLimit(10, 60)
+
+
+def test_sliding_window_allows_requests_within_the_weighted_count():
+    assert sliding_window_wait(5, 10, 0.6, LIMIT) == 0.0
+    assert sliding_window_wait(10, 0, 0.5, LIMIT) == 0.0
+
+
+def test_sliding_window_waits_for_the_previous_window_to_slide_out():
+    # 10 * 0.4 + 7 = 11; one more request fits once 10 * (1 - e) + 8 <= 10, at e = 0.8
+    assert sliding_window_wait(7, 10, 0.6, LIMIT) == pytest.approx(12.0)
+
+
+def test_sliding_window_over_the_limit_in_this_window_waits_into_the_next():
+    # The rest of this window, then until 11 * (1 - e) + 1 <= 10 in the next: e = 2 / 11
+    assert sliding_window_wait(11, 0, 0.5, LIMIT) == pytest.approx(30 + 60 * 2 / 11)
+
+
+def test_sliding_window_wait_is_enough():
+    for count, previous, elapsed in [(7, 10, 0.6), (9, 30, 0.1), (11, 0, 0.5), (25, 4, 0.9)]:
+        wait = sliding_window_wait(count, previous, elapsed, LIMIT) / LIMIT.period
+        assert wait > 0
+        later = elapsed + wait
+        if later < 1:
+            weighted = previous * (1 - later) + count + 1
+        else:
+            weighted = count * (2 - later) + 1
+        assert weighted <= LIMIT.requests + 1e-9
+
+
+# ==================== LIMITER ====================
+
+class FailingStore(RateLimitStore):
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        raise ConnectionError("shared store unreachable")
+
+
+class CountingStore(RateLimitStore):
+    def __init__(self):
+        self.hits = 0
+
+    async def hit(self, key: str, limit: RateLimit) -> float:
+        self.hits += 1
+        return 0.0
+
+
+def test_limiter_falls_back_to_the_local_limit(clock):
+    limiter = RateLimiter(parse_limits(), shared=FailingStore())
+    limit = limiter.limit_for("POST", "/api/newsletter/subscribe/")
+    results = [asyncio.run(limiter.check("POST /api/newsletter/subscribe", "1.2.3.4", limit)) for _ in range(6)]
+    assert results[:5] == [0.0] * 5
+    assert results[5] > 0
+
+
+def test_limiter_only_counts_locally_allowed_requests_in_the_shared_store(clock):
+    shared = CountingStore()
+    limiter = RateLimiter(parse_limits(), shared=shared)
+    limit = limiter.limit_for("POST", "/api/admin/login")
+    for _ in range(8):
+        asyncio.run(limiter.check("POST /api/admin/login", "1.2.3.4", limit))
+    assert shared.hits == 5
+
+
+def test_disabled_limiter_has_no_limits():
+    limiter = RateLimiter(parse_limits(), enabled=False)
+    assert limiter.limit_for("POST", "/api/orders") is None